@@ -4,12 +4,111 @@ import random
 import time
 import paho.mqtt.client as mqtt
 import csv
+import logging
+import threading
 from datetime import datetime
 
+import log_config
+import metrics
+from outbox import Outbox
+
+logger = log_config.get_logger('MQTTClient')
+
+messages_published = metrics.counter('thp_messages_published_total', '发布成功的消息数')
+publish_errors = metrics.counter('thp_publish_errors_total', '发布失败的消息数')
+mqtt_reconnects = metrics.counter('thp_mqtt_reconnects_total', '与MQTT服务器重新建立连接的次数')
+broker_rtt = metrics.histogram('thp_broker_rtt_seconds', '到MQTT服务器的往返时间(QoS 1探测消息的PUBACK)',
+                               buckets=metrics.RTT_BUCKETS)
+broker_rtt_last = metrics.gauge('thp_broker_rtt_last_seconds', '最近一次探测的MQTT服务器往返时间')
+
+messages_delivered = metrics.counter('thp_messages_delivered_total', '已确认送达的消息数(QoS 0为写入网络，QoS 1/2为收到服务器确认)')
+messages_lost = metrics.counter('thp_messages_lost_total', '连接断开时尚未写入网络而丢失的QoS 0消息数')
+
+QOS_LEVELS = (0, 1, 2)
+DEFAULT_MAX_INFLIGHT = 100   # 默认最多允许100条尚未确认的消息
+DEFAULT_DRAIN_RATE = 500     # 重新连接后发件箱每秒发出的消息数
+OUTBOX_DRAIN_BATCH = 100     # 发件箱每次读取并提交的消息数
+OUTBOX_RETRY_MIN = 0.1       # 连接正常但发件箱发送失败时，重试前等待的时间(秒)，每次失败翻倍
+OUTBOX_RETRY_MAX = 10.0
+ERR_QUEUE_FULL = mqtt.MQTT_ERR_QUEUE_SIZE   # 在途窗口或发件箱已满时publish返回的错误码
+
+# 往返时间探测消息的主题前缀，订阅端收到这些主题的消息时直接忽略
+PROBE_TOPIC_PREFIX = 'thp/rtt-probe/'
+
+# 随机数据支持的消息格式: params为本项目发布端的格式，items为阿里云物模型格式
+PAYLOAD_SHAPES = ('params', 'items')
+
+
+# 生成随机的温湿度气压属性
+def random_properties():
+    return {
+        "CurrentTemperature": random.randint(-10, 40) + random.random(),
+        "CurrentHumidity": random.randint(0, 100) + random.random(),
+        "CurrentPressure": random.randint(900, 1100),
+        "DetectTime": str(int(round(time.time() * 1000)))
+    }
+
+
+# 构造随机数据的上报结构
+def random_payload(shape='params'):
+    prop_data = random_properties()
+    if shape == 'params':
+        return {
+            "id": "123",
+            "version": "1.0",
+            "params": prop_data,
+            "method": "thing.event.property.post"
+        }
+    if shape == 'items':
+        now = int(prop_data["DetectTime"])
+        return {
+            "deviceType": "CustomCategory",
+            "items": {name: {"value": value, "time": now} for name, value in prop_data.items()},
+        }
+    raise ValueError("未知的消息格式: " + str(shape))
+
+
+class RttProbe:
+    """发布一条QoS 1的空消息，以收到PUBACK的时间作为到服务器的往返时间"""
+
+    def __init__(self, topic):
+        self.topic = topic
+        self._pending = {}  # mid -> 发送时间
+
+    def send(self, client):
+        """client为paho客户端，未连接时不发送"""
+        if not client.is_connected():
+            return False
+        sent_at = time.perf_counter()
+        result = client.publish(self.topic, b'', qos=1)
+        if result.rc != 0:
+            return False
+        self._pending[result.mid] = sent_at
+        return True
+
+    def on_publish(self, mid):
+        """mid是探测消息时记录往返时间并返回True"""
+        sent_at = self._pending.pop(mid, None)
+        if sent_at is None:
+            return False
+        rtt = time.perf_counter() - sent_at
+        broker_rtt.observe(rtt)
+        broker_rtt_last.set(rtt)
+        return True
+
+
 class MQTTClient:
-    def __init__(self, product_key, device_name, device_secret, broker='localhost', port=1883):
+    def __init__(self, product_key, device_name, device_secret, broker='localhost', port=1883,
+                 qos=0, max_inflight=DEFAULT_MAX_INFLIGHT, outbox_path=None, drain_rate=DEFAULT_DRAIN_RATE):
+        if qos not in QOS_LEVELS:
+            raise ValueError("QoS必须为0、1或2")
+        if max_inflight < 1:
+            raise ValueError("在途窗口必须至少为1")
+        if drain_rate <= 0:
+            raise ValueError("发件箱发出速率必须大于0")
         # 使用paho-mqtt创建客户端
         self.client = mqtt.Client()
+        self.client.max_inflight_messages_set(max_inflight)
         self.broker = broker
         self.port = port
         self.product_key = product_key
@@ -17,6 +116,30 @@ class MQTTClient:
         self.device_secret = device_secret
         self.mqtt_topic_post = f'/sys/{product_key}/{device_name}/thing/event/property/post'
         self.connected = False
+        # 发布确认的附加回调，由回放引擎等调用方设置，参数为mid
+        self.publish_callback = None
+        # 逐条消息不输出日志，由publish_meter定期汇总发布速率；错误日志按类别限频
+        self.publish_meter = log_config.ThroughputMeter(logger, 'published')
+        self._sampled = log_config.SampledLog(logger)
+        self.rtt_probe = RttProbe(PROBE_TOPIC_PREFIX + device_name)
+
+        # 在途窗口和送达统计: 发布时占用窗口，on_publish回调时释放
+        self.qos = qos
+        self.max_inflight = max_inflight
+        self.published = 0   # 已交给paho的消息数
+        self.delivered = 0   # 已确认送达的消息数
+        self.lost = 0        # 断开连接时丢失的QoS 0消息数
+        self._window = threading.Condition()
+        self._pending = {}   # mid -> qos
+        self._early = set()  # publish返回前就已收到on_publish的mid
+        self._reserved = 0   # 已占用窗口、尚未拿到mid的消息数
+        self._ever_connected = False
+
+        # 磁盘发件箱: 断开期间发布的消息保存在outbox_path中，连接后按drain_rate(条/秒)依次发出
+        self.outbox = Outbox(outbox_path) if outbox_path else None
+        self.drain_rate = drain_rate
+        self._outbox_lock = threading.Lock()
+        self._draining = False
         
         # 设置回调函数
         self.client.on_connect = self.on_connect
@@ -26,34 +149,101 @@ class MQTTClient:
 
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
-            self.connected = True
-            # 使用简单的print语句，避免格式化字符串可能导致的问题
-            print("MQTT已连接 (rc=", rc, ")")
+            drain = self._set_connected()
+            if self._ever_connected:
+                mqtt_reconnects.inc()
+            self._ever_connected = True
+            logger.info("MQTT已连接 (rc=%s)", rc)
+            if drain:
+                threading.Thread(target=self._drain_outbox, name='outbox-drain', daemon=True).start()
         else:
-            # 使用简单的print语句，避免格式化字符串可能导致的问题
-            print("MQTT连接失败 (rc=", rc, ")")
+            logger.warning("MQTT连接失败 (rc=%s)", rc)
 
     def on_disconnect(self, client, userdata, rc):
         self.connected = False
-        # 使用简单的print语句，避免格式化字符串可能导致的问题
-        print("MQTT已断开连接 (rc=", rc, ")")
+        # QoS 0消息没有重发机制，尚未写入网络的消息已经丢失，释放其占用的窗口
+        with self._window:
+            lost = [mid for mid, qos in self._pending.items() if qos == 0]
+            for mid in lost:
+                del self._pending[mid]
+            self.lost += len(lost)
+            self._window.notify_all()
+        if lost:
+            messages_lost.inc(len(lost))
+        logger.info("MQTT已断开连接 (rc=%s)", rc)
 
     def on_publish(self, client, userdata, mid):
-        # 使用简单的print语句，避免格式化字符串可能导致的问题
-        print("消息已发布 (mid=", mid, ")")
+        logger.debug("消息已发布 (mid=%s)", mid)
+        if self.rtt_probe.on_publish(mid):
+            return
+        with self._window:
+            if mid not in self._pending:
+                # publish()还没有登记这个mid，由publish()登记时处理
+                self._early.add(mid)
+                return
+            del self._pending[mid]
+            self._delivered()
+        if self.publish_callback is not None:
+            self.publish_callback(mid)
+
+    def _delivered(self):
+        # 调用时需持有self._window
+        self.delivered += 1
+        messages_delivered.inc()
+        self._window.notify_all()
+
+    @property
+    def inflight(self):
+        """已发布但尚未确认送达的消息数"""
+        return len(self._pending) + self._reserved
+
+    def set_max_inflight(self, max_inflight):
+        if max_inflight < 1:
+            raise ValueError("在途窗口必须至少为1")
+        with self._window:
+            self.max_inflight = max_inflight
+            try:
+                self.client.max_inflight_messages_set(max_inflight)
+            except RuntimeError:
+                pass  # 新版paho不允许在连接后修改，超出paho上限的消息由paho排队，窗口仍按max_inflight计算
+            self._window.notify_all()
+
+    def wait_for_window(self, timeout=None):
+        """等待在途窗口有空位，有空位返回True；超时或连接断开返回False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._window:
+            while self.inflight >= self.max_inflight:
+                if not self.connected:
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._window.wait(0.1 if remaining is None else min(remaining, 0.1))
+            return True
+
+    def wait_for_delivery(self, timeout=None):
+        """等待所有在途消息确认送达，全部送达返回True"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._window:
+            while self.inflight > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._window.wait(0.1 if remaining is None else min(remaining, 0.1))
+            return True
 
     def on_message(self, client, userdata, msg):
-        # 使用简单的print语句，避免格式化字符串可能导致的问题
-        print("已接收消息 (topic=", msg.topic, ", payload=", msg.payload.decode(), ", qos=", msg.qos, ")")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("已接收消息 (topic=%s, payload=%s, qos=%s)", msg.topic, msg.payload.decode(), msg.qos)
 
     def connect(self):
         try:
             # 检查MQTT客户端的状态
             if self.client is None:
-                print("MQTT客户端未初始化")
+                logger.error("MQTT客户端未初始化")
                 return False
             
-            print("尝试连接到MQTT服务器:", self.broker, ":", self.port)
+            logger.info("尝试连接到MQTT服务器: %s:%s", self.broker, self.port)
             
             # 先断开可能存在的连接
             try:
@@ -64,46 +254,159 @@ class MQTTClient:
             # 使用connect_async代替connect，避免阻塞
             self.client.connect_async(self.broker, self.port, 60)
             self.client.loop_start()  # 开启后台循环
-            print("MQTT客户端正在连接...")
+            logger.info("MQTT客户端正在连接...")
             
             # 直接返回，不等待连接完成
             # 连接状态会通过on_connect回调更新
             return True
         except Exception as e:
-            print("MQTT连接错误:", e)
-            import traceback
-            traceback.print_exc()
+            logger.exception("MQTT连接错误: %s", e)
             return False
 
     def disconnect(self):
         self.client.loop_stop()
         self.client.disconnect()
-        print("MQTT客户端正在断开连接...")
+        logger.info("MQTT客户端正在断开连接...")
 
-    def publish(self, topic, message):
+    # qos省略时使用创建客户端时设置的QoS；在途消息达到窗口上限时等待确认，timeout秒内没有空位则发布失败
+    # 启用发件箱时，未连接、正在发出或发件箱中还有消息时新消息追加到发件箱，返回(0, 0)
+    def publish(self, topic, message, qos=None, timeout=None):
+        qos = self.qos if qos is None else qos
         try:
+            if isinstance(message, dict):
+                message = json.dumps(message)
+            if self.outbox is not None:
+                with self._outbox_lock:
+                    if not self.connected or self._draining or len(self.outbox):
+                        if self.outbox.append(topic, message, qos):
+                            return mqtt.MQTT_ERR_SUCCESS, 0
+                        publish_errors.inc()
+                        self._sampled.log('outbox-full', "发件箱已满(%d条)，发布失败", len(self.outbox))
+                        return ERR_QUEUE_FULL, 0
             if not self.connected:
-                print("MQTT客户端未连接，无法发布消息。")
+                publish_errors.inc()
+                self._sampled.log('not-connected', "MQTT客户端未连接，无法发布消息。")
                 return -1, 0
-            if isinstance(message, dict):
-                message_str = json.dumps(message)
-                print(f"[DEBUG] 发布消息到主题 {topic}: {message_str[:100]}...")
-                message = message_str
-            else:
-                print(f"[DEBUG] 发布消息到主题 {topic}: {message[:100]}...")
-            result = self.client.publish(topic, message)
-            print(f"[DEBUG] 发布结果: rc={result.rc}, mid={result.mid}")
-            return result.rc, result.mid
+            return self._send(topic, message, qos, timeout)
         except Exception as e:
-            print("[DEBUG] 发布错误:", e)
+            publish_errors.inc()
+            self._sampled.log('publish-error', "发布错误: %s", e)
             return -1, 0
-    
+
+    def _send(self, topic, message, qos, timeout=None):
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("发布消息到主题 %s: %s...", topic, message[:100])
+        if not self.wait_for_window(timeout):
+            publish_errors.inc()
+            self._sampled.log('window-full', "在途消息已达上限(%d)，发布失败", self.max_inflight)
+            return ERR_QUEUE_FULL, 0
+        with self._window:
+            self._reserved += 1
+        result, early = None, False
+        try:
+            result = self.client.publish(topic, message, qos=qos)
+        finally:
+            with self._window:
+                self._reserved -= 1
+                if result is not None and result.rc == 0:
+                    self.published += 1
+                    if result.mid in self._early:
+                        self._early.discard(result.mid)
+                        self._delivered()
+                        early = True
+                    else:
+                        self._pending[result.mid] = qos
+                self._window.notify_all()
+        self.publish_meter.record(len(message))
+        if result.rc == 0:
+            messages_published.inc()
+            if early and self.publish_callback is not None:
+                self.publish_callback(result.mid)
+        else:
+            publish_errors.inc()
+        if debug:
+            logger.debug("发布结果: rc=%s, mid=%s", result.rc, result.mid)
+        return result.rc, result.mid
+
+    def _set_connected(self):
+        """标记为已连接，发件箱中有消息时在同一临界区内同时设置_draining，返回是否需要启动发出线程
+
+        两者分开设置时，其间的publish会看到已连接但未在发出，越过发件箱中更早的消息直接发送。
+        """
+        if self.outbox is None:
+            self.connected = True
+            return False
+        with self._outbox_lock:
+            self.connected = True
+            if self._draining or len(self.outbox) == 0:
+                return False
+            self._draining = True
+            return True
+
+    def _wait_acked(self, mids):
+        """等待mids全部确认送达(QoS 0为写入网络)，期间连接断开返回False"""
+        with self._window:
+            while any(mid in self._pending for mid in mids):
+                if not self.connected:
+                    return False
+                self._window.wait(0.1)
+            return self.connected
+
+    # 连接后按顺序、按drain_rate的速率发出发件箱中的消息；发出期间新发布的消息也进入发件箱，保证顺序。
+    # 直到发件箱清空或连接断开才结束，连接正常但发送失败时按退避时间重试，期间一直保持_draining。
+    # 一批消息全部确认送达后才提交，确认前断开或进程退出时，这一批在下次连接后重新发出(至少一次)
+    def _drain_outbox(self):
+        self.outbox.start_drain()
+        logger.info("开始发出发件箱中的%d条消息", len(self.outbox))
+        interval = 1.0 / self.drain_rate
+        next_at = time.perf_counter()
+        retry_delay = OUTBOX_RETRY_MIN
+        try:
+            while True:
+                with self._outbox_lock:
+                    if len(self.outbox) == 0 or not self.connected:
+                        self._draining = False
+                        break
+                batch = self.outbox.peek(OUTBOX_DRAIN_BATCH)
+                mids = []
+                for topic, payload, qos in batch:
+                    delay = next_at - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_at = max(next_at + interval, time.perf_counter() - interval)
+                    rc, mid = self._send(topic, payload, qos)
+                    if rc != 0:
+                        break
+                    mids.append(mid)
+                if mids and self._wait_acked(mids):
+                    self.outbox.commit(len(mids))
+                if len(mids) < len(batch) and self.connected:
+                    self._sampled.log('drain-retry', "发件箱发送失败，%.1f秒后重试，还有%d条消息",
+                                      retry_delay, len(self.outbox))
+                    time.sleep(retry_delay)
+                    retry_delay = min(retry_delay * 2, OUTBOX_RETRY_MAX)
+                else:
+                    retry_delay = OUTBOX_RETRY_MIN
+        except Exception:
+            logger.exception("发出发件箱中的消息时发生错误")
+            with self._outbox_lock:
+                self._draining = False
+            return
+        if len(self.outbox):
+            logger.warning("连接断开，发件箱中还有%d条消息", len(self.outbox))
+        else:
+            logger.info("发件箱已清空")
+
+    def outbox_stats(self):
+        return None if self.outbox is None else self.outbox.stats()
+
     def subscribe(self, topic):
         try:
             result, mid = self.client.subscribe(topic)
             return result, mid
         except Exception as e:
-            print("订阅错误:", e)
+            logger.error("订阅错误: %s", e)
             return -1, 0
     
     def unsubscribe(self, topic):
@@ -111,36 +414,26 @@ class MQTTClient:
             result, mid = self.client.unsubscribe(topic)
             return result, mid
         except Exception as e:
-            print("取消订阅错误:", e)
+            logger.error("取消订阅错误: %s", e)
             return -1, 0
 
     def is_connected(self):
         return self.connected
+
+    # 发送往返时间探测消息，结果在收到PUBACK时记录到指标中
+    def probe_rtt(self):
+        return self.rtt_probe.send(self.client)
     
-    # 上报随机数据
-    def post_random_data(self, topic):
-        # 上报随机属性
-        prop_data = {
-            "CurrentTemperature": random.randint(-10, 40) + random.random(),
-            "CurrentHumidity": random.randint(0, 100) + random.random(),
-            "CurrentPressure": random.randint(900, 1100),
-            "DetectTime": str(int(round(time.time() * 1000)))
-        }
-        # 构造上报数据结构
-        payload = {
-            "id": "123",
-            "version": "1.0",
-            "params": prop_data,
-            "method": "thing.event.property.post"
-        }
+    # 上报随机数据，shape为params或items，返回(rc, mid)
+    def post_random_data(self, topic, shape='params'):
+        payload = random_payload(shape)
         # 上报属性
         rc, request_id = self.publish(topic, payload)
         if rc == 0:
-            # 使用简单的print语句，避免格式化字符串可能导致的问题
-            print("属性上报成功:", rc, ", 请求ID:", request_id)
+            logger.debug("属性上报成功: %s, 请求ID: %s", rc, request_id)
         else:
-            # 使用简单的print语句，避免格式化字符串可能导致的问题
-            print("属性上报失败, rc=", rc)
+            logger.warning("属性上报失败, rc=%s", rc)
+        return rc, request_id
     
     # 读取数据并上报
     '''def read_and_post_data(self, publish_file, topic):
@@ -0,0 +1,181 @@
+# bench_pipeline.py
+# Function: 发布端 -> MQTT服务器 -> 订阅端 的端到端基准测试
+# 需要本地运行的Mosquitto。发布端使用load_generator的模拟设备(MQTTClient)，订阅端使用subscribe_module，
+# 二者运行在同一进程中；数据写入临时目录中的存储，不影响data/readings。
+# 按阶段逐步提高目标速率，每个阶段统计:
+#   延迟 - 消息写入receive_data的时间减去消息中的DetectTime(毫秒精度)
+#   丢失 - 发布条数与写入receive_data条数之差
+#   CPU  - 本进程(发布端+订阅端，不含服务器)每条消息消耗的CPU时间
+#   RSS  - 阶段前后常驻内存的变化
+# 未丢失(丢失率不超过--loss)的最高阶段速率即为可持续速率。
+# 用法:
+#   python bench_pipeline.py --rates 500,1000,2000,5000 --stage-time 10
+#   python bench_pipeline.py --baseline bench_results/pipeline-xxx.json
+import argparse
+import tempfile
+import threading
+import time
+
+import bench_util
+import global_var as gv
+import log_config
+from buffered_writer import BufferedWriter
+from load_generator import LoadGenerator, percentile
+from ring_buffer import ReadingRingBuffer
+import subscribe_module as module
+import ts_store
+
+logger = log_config.get_logger('bench_pipeline')
+
+DEFAULT_RATES = (500, 1000, 2000, 5000, 10000)
+DEFAULT_STAGE_TIME = 10.0
+DEFAULT_LOSS = 0.001
+
+
+class TimedRingBuffer(ReadingRingBuffer):
+    """写入时记录消息延迟的接收缓冲区"""
+
+    def __init__(self, capacity):
+        super().__init__(capacity)
+        self.latencies = []  # 毫秒
+        self.received = 0
+        self._stats_lock = threading.Lock()
+
+    def append(self, reading):
+        latency = time.time() * 1000 - int(reading['time'])
+        with self._stats_lock:
+            self.latencies.append(latency)
+            self.received += 1
+        return super().append(reading)
+
+    def take(self):
+        with self._stats_lock:
+            latencies, received = self.latencies, self.received
+            self.latencies, self.received = [], 0
+        return latencies, received
+
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+
+def _wait_drained(buffer, sent, settle=1.0, timeout=30.0):
+    """等待订阅端收完消息：收到的条数达到sent，或在settle秒内不再增加"""
+    deadline = time.monotonic() + timeout
+    last, last_change = -1, time.monotonic()
+    while time.monotonic() < deadline:
+        received = buffer.received
+        if received >= sent:
+            return
+        if received != last:
+            last, last_change = received, time.monotonic()
+        elif time.monotonic() - last_change >= settle:
+            return
+        time.sleep(0.05)
+
+
+def run_stage(rate, devices, stage_time, shape, broker, port, buffer):
+    generator = LoadGenerator(devices, [rate / devices], shape, broker=broker, port=port, product_key='bench')
+    generator.connect()
+    buffer.take()
+    rss_before = bench_util.rss_kb()
+    cpu_before = time.process_time()
+    try:
+        published = generator.run(stage_time, report_every=stage_time)
+    finally:
+        generator.disconnect()
+    _wait_drained(buffer, published['sent'])
+    cpu = time.process_time() - cpu_before
+    rss_after = bench_util.rss_kb()
+    latencies, received = buffer.take()
+    latencies.sort()
+    lost = max(published['sent'] - received, 0)
+    return {
+        'target_rate': rate,
+        'achieved_rate': published['achieved_rate'],
+        'sent': published['sent'],
+        'received': received,
+        'lost': lost,
+        'loss_ratio': round(lost / published['sent'], 6) if published['sent'] else 0.0,
+        'received_rate': round(received / published['duration'], 1),
+        'latency_ms': {
+            'p50': _round(percentile(latencies, 50)),
+            'p90': _round(percentile(latencies, 90)),
+            'p99': _round(percentile(latencies, 99)),
+            'max': _round(latencies[-1] if latencies else None),
+        },
+        'publish_latency_ms': published['latency_ms'],
+        'cpu_us_per_msg': round(cpu / received * 1e6, 2) if received else None,
+        'rss_kb_before': rss_before,
+        'rss_kb_after': rss_after,
+        'rss_kb_growth': None if rss_before is None or rss_after is None else rss_after - rss_before,
+    }
+
+
+def run(rates=DEFAULT_RATES, devices=10, stage_time=DEFAULT_STAGE_TIME, shape='params', loss=DEFAULT_LOSS,
+        broker='localhost', port=1883, stop_on_loss=True):
+    module.mqtt_broker, module.mqtt_port = broker, port
+    buffer = TimedRingBuffer(gv.RECEIVE_CAPACITY)
+    # 替换订阅端的接收缓冲区、存储和写入线程，结束后恢复；此前尚未init()时恢复后仍由init()创建
+    saved = (gv.global_var.receive_data, module.store, module.out_writer, module.default_client_id,
+             module._initialized)
+    gv.global_var.receive_data = buffer
+    stages = []
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            # 订阅端写入临时存储
+            module.store = ts_store.PartitionedStore(directory)
+            writer = module.out_writer = BufferedWriter(module.store.append, name='bench-store-writer')
+            gv.global_var.user_initiated_disconnect = False
+            # 客户端ID为空: 使用clean_session，服务器不为每次运行保留会话
+            module.default_client_id = ''
+            module.connect_and_subscribe('', '', '')
+            time.sleep(1.0)  # 等待订阅生效
+            for rate in rates:
+                stage = run_stage(rate, devices, stage_time, shape, broker, port, buffer)
+                logger.info("目标%s条/秒: 实际%s条/秒，丢失率%s，延迟p99=%sms",
+                            rate, stage['received_rate'], stage['loss_ratio'], stage['latency_ms']['p99'])
+                stages.append(stage)
+                if stop_on_loss and stage['loss_ratio'] > loss:
+                    break
+        finally:
+            module.disconnect_mqtt()
+            (gv.global_var.receive_data, module.store, module.out_writer, module.default_client_id,
+             module._initialized) = saved
+    sustained = [stage['target_rate'] for stage in stages if stage['loss_ratio'] <= loss]
+    return {
+        'config': {'devices': devices, 'stage_time': stage_time, 'shape': shape, 'loss_threshold': loss},
+        'sustained_rate': max(sustained) if sustained else 0,
+        'decoder': module.decoder.stats(),
+        'writer': writer.stats(),
+        'stages': stages,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='发布->服务器->订阅端到端基准测试')
+    parser.add_argument('--broker', default='localhost')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--rates', default=','.join(str(rate) for rate in DEFAULT_RATES), help='各阶段的目标总速率')
+    parser.add_argument('--devices', type=int, default=10)
+    parser.add_argument('--stage-time', type=float, default=DEFAULT_STAGE_TIME, help='每个阶段的时长(秒)')
+    parser.add_argument('--shape', default='params')
+    parser.add_argument('--loss', type=float, default=DEFAULT_LOSS, help='允许的丢失率')
+    parser.add_argument('--all-stages', action='store_true', help='出现丢失后继续运行后面的阶段')
+    parser.add_argument('--output', default=bench_util.RESULTS_DIR, help='结果文件目录')
+    parser.add_argument('--baseline', help='与之比较的基线结果文件')
+    args = parser.parse_args(argv)
+    log_config.configure()
+
+    result = run([float(rate) for rate in args.rates.split(',')], args.devices, args.stage_time, args.shape,
+                 args.loss, args.broker, args.port, stop_on_loss=not args.all_stages)
+    path = bench_util.write_result('pipeline', result, args.output)
+    print("可持续速率: %s条/秒" % result['sustained_rate'])
+    print("结果已保存到", path)
+    if args.baseline:
+        bench_util.print_comparison(bench_util.compare(result, args.baseline))
+    return result
+
+
+if __name__ == "__main__":
+    main()
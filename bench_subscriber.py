@@ -0,0 +1,221 @@
+# bench_subscriber.py
+# Function: 订阅端热点函数的微基准测试，不需要MQTT服务器
+# 逐条消息的函数(transform_data的三种消息格式、format_topicData、timestamp_to_time)统计每次调用的耗时(ns)
+# 以及tracemalloc统计的内存分配；read_data和/chart(getTHPChart)在1e4~1e7行的合成数据上统计耗时随数据量的变化。
+# 用法:
+#   python bench_subscriber.py
+#   python bench_subscriber.py --sizes 1e4,1e5,1e6,1e7 --calls 100000
+#   python bench_subscriber.py --baseline bench_results/subscriber-xxx.json
+import argparse
+import json
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import bench_util
+import global_var as gv
+import log_config
+from buffered_writer import BufferedWriter
+from chart_cache import ChartCache
+from MQTTClient import random_payload
+from ring_buffer import ReadingRingBuffer
+import subscribe_module as module
+import ts_store
+
+logger = log_config.get_logger('bench_subscriber')
+
+DEFAULT_SIZES = (10 ** 4, 10 ** 5, 10 ** 6)
+DEFAULT_CALLS = 20000
+ALLOC_SAMPLES = 1000
+
+
+class Frame:
+    def __init__(self, body):
+        self.body = body
+
+
+def sample_payloads():
+    """三种消息格式各一条消息"""
+    params = random_payload('params')
+    flat = {
+        "time": int(params['params']['DetectTime']),
+        "temperature": params['params']['CurrentTemperature'],
+        "humidity": params['params']['CurrentHumidity'],
+        "pressure": params['params']['CurrentPressure'],
+    }
+    return {
+        'params': json.dumps(params).encode(),
+        'items': json.dumps(random_payload('items')).encode(),
+        'flat': json.dumps(flat).encode(),
+    }
+
+
+def time_calls(func, calls):
+    """返回每次调用的平均耗时(ns)"""
+    start = time.perf_counter_ns()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter_ns() - start) / calls
+
+
+def measure_allocations(func, samples=ALLOC_SAMPLES):
+    """返回单次调用的峰值分配字节数(中位数)和每次调用残留的字节数"""
+    tracemalloc.start()
+    try:
+        func()  # 预热，排除首次调用的缓存分配
+        peaks = []
+        before, _ = tracemalloc.get_traced_memory()
+        for _ in range(samples):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            func()
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'peak_bytes': statistics.median(peaks), 'retained_bytes': round((after - before) / samples, 1)}
+
+
+def bench_per_message(calls):
+    """逐条消息的热点函数"""
+    # 不做实际存储，只测量函数本身以及放入写入队列的开销
+    module.out_writer = BufferedWriter(lambda rows: None, name='bench-null-writer', queue_size=calls * 4 + ALLOC_SAMPLES * 8)
+    gv.global_var.receive_data.clear()
+    results = {}
+    for schema, payload in sample_payloads().items():
+        frame = Frame(payload)
+        topic = 'bench/' + schema
+        func = lambda: module.transform_data(frame, topic)
+        results['transform_data.' + schema] = dict(ns_per_call=round(time_calls(func, calls), 1), **measure_allocations(func))
+    reading = {"temperature": 22.35, "humidity": 51.2, "pressure": 1013, "time": 1392220800000}
+    func = lambda: module.format_topicData(reading)
+    results['format_topicData'] = dict(ns_per_call=round(time_calls(func, calls), 1), **measure_allocations(func))
+    func = lambda: module.timestamp_to_time(1392220800000)
+    results['timestamp_to_time'] = dict(ns_per_call=round(time_calls(func, calls), 1), **measure_allocations(func))
+    module.out_writer.flush()
+    return results
+
+
+def synthetic_store(directory, rows, seed=0):
+    """生成rows行每分钟一条、局部乱序的合成数据，全部放在默认分区"""
+    rng = np.random.default_rng(seed)
+    store = ts_store.PartitionedStore(directory)
+    partition = store.partition(ts_store.DEFAULT_DEVICE)
+    chunk = ts_store.SEGMENT_ROWS * 4
+    for lo in range(0, rows, chunk):
+        n = min(chunk, rows - lo)
+        index = np.arange(lo, lo + n, dtype=np.int64)
+        partition.append_columns({
+            'time': 1392220800000 + index * 60000 + rng.integers(-90000, 90000, n),
+            'temperature': (15 + 10 * np.sin(index / 1440) + rng.normal(0, 1, n)).astype(np.float32),
+            'humidity': rng.uniform(20, 90, n).astype(np.float32),
+            'pressure': rng.integers(980, 1040, n).astype(np.int32),
+        })
+    return store
+
+
+def best_of(func, repeat):
+    """返回repeat次中最短的耗时(ms)"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 3)
+
+
+def peak_kb(func):
+    tracemalloc.start()
+    try:
+        func()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def bench_scaling(sizes, repeat):
+    """read_data和/chart的耗时随数据量的变化"""
+    import subscribe_app
+    results = []
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            store = synthetic_store(directory, rows)
+            module.store = store
+            times = store.query(names=['time'])['time']
+            lo, hi = np.percentile(times, [45, 55]).astype(np.int64)
+            range_query = 'start=%d&end=%d' % (lo, hi)  # 中间10%的数据
+
+            def chart(query=''):
+                with subscribe_app.app.test_request_context('/chart?variable=temperature&' + query):
+                    response = subscribe_app.getTHPChart()
+                assert response.get_json()['isSuccess']
+
+            def chart_cold():
+                subscribe_app.chart_cache = ChartCache(store)
+                chart()
+
+            point = {
+                'rows': rows,
+                'read_data_ms': best_of(module.read_data, repeat),
+                'chart_cold_ms': best_of(chart_cold, repeat),
+                'chart_warm_ms': best_of(chart, repeat),
+                'chart_range_ms': best_of(lambda: chart(range_query), repeat),
+                'chart_cold_peak_kb': peak_kb(chart_cold),
+                'read_data_peak_kb': peak_kb(module.read_data),
+            }
+            logger.info("%d行: %s", rows, point)
+            results.append(point)
+            subscribe_app.chart_cache = None
+    return results
+
+
+def run(sizes=DEFAULT_SIZES, calls=DEFAULT_CALLS, repeat=3):
+    import subscribe_app
+    # 替换订阅端的存储、写入线程、接收缓冲区和图表缓存，结束后恢复；此前尚未init()时恢复后仍由init()创建
+    saved = (module.store, module.out_writer, module.ingest, module._initialized,
+             gv.global_var.receive_data, gv.global_var.device_data,
+             subscribe_app.chart_cache, subscribe_app.device_chart_caches)
+    gv.global_var.receive_data = ReadingRingBuffer(gv.RECEIVE_CAPACITY)
+    gv.global_var.device_data = {}
+    subscribe_app.device_chart_caches = {}
+    try:
+        per_message = bench_per_message(calls)
+        scaling = bench_scaling(sizes, repeat)
+    finally:
+        (module.store, module.out_writer, module.ingest, module._initialized,
+         gv.global_var.receive_data, gv.global_var.device_data,
+         subscribe_app.chart_cache, subscribe_app.device_chart_caches) = saved
+    return {'calls': calls, 'per_message': per_message, 'scaling': scaling}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='订阅端热点函数微基准测试')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES), help='合成数据的行数，如1e4,1e5,1e6')
+    parser.add_argument('--calls', type=int, default=DEFAULT_CALLS, help='逐条消息函数的调用次数')
+    parser.add_argument('--repeat', type=int, default=3, help='数据量测试的重复次数，取最短耗时')
+    parser.add_argument('--output', default=bench_util.RESULTS_DIR, help='结果文件目录')
+    parser.add_argument('--baseline', help='与之比较的基线结果文件')
+    args = parser.parse_args(argv)
+    log_config.configure()
+
+    result = run([int(float(size)) for size in args.sizes.split(',')], args.calls, args.repeat)
+    print("%-28s %12s %12s %14s" % ('函数', 'ns/次', '峰值分配B', '残留B/次'))
+    for name, item in result['per_message'].items():
+        print("%-28s %12s %12s %14s" % (name, item['ns_per_call'], item['peak_bytes'], item['retained_bytes']))
+    print("%-10s %12s %14s %14s %14s" % ('行数', 'read_data ms', 'chart冷 ms', 'chart热 ms', 'chart范围 ms'))
+    for point in result['scaling']:
+        print("%-10d %12s %14s %14s %14s" % (point['rows'], point['read_data_ms'], point['chart_cold_ms'],
+                                             point['chart_warm_ms'], point['chart_range_ms']))
+    path = bench_util.write_result('subscriber', result, args.output)
+    print("结果已保存到", path)
+    if args.baseline:
+        bench_util.print_comparison(bench_util.compare(result, args.baseline))
+    return result
+
+
+if __name__ == "__main__":
+    main()
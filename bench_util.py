@@ -0,0 +1,94 @@
+# bench_util.py
+# Function: 基准测试脚本共用的工具函数
+# 结果保存为 bench_results/<名称>-<时间>-<提交号>.json，便于在不同提交之间比较
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+RESULTS_DIR = 'bench_results'
+
+
+def rss_kb():
+    """当前进程的常驻内存(KB)，无法获取时返回None"""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # Linux上ru_maxrss单位是KB，macOS上是字节；这里只能得到峰值
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss // 1024 if sys.platform == 'darwin' else maxrss
+    except ImportError:
+        return None
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment():
+    import message_decoder
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'json_backend': message_decoder.JSON_BACKEND,
+    }
+
+
+def write_result(name, result, directory=RESULTS_DIR):
+    """保存结果文件，返回文件路径"""
+    os.makedirs(directory, exist_ok=True)
+    now = datetime.datetime.now()
+    commit = git_commit()
+    document = {
+        'benchmark': name,
+        'timestamp': now.isoformat(timespec='seconds'),
+        'commit': commit,
+        'environment': environment(),
+        'result': result,
+    }
+    path = os.path.join(directory, '%s-%s-%s.json' % (name, now.strftime('%Y%m%d%H%M%S'), commit or 'unknown'))
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(document, file, ensure_ascii=False, indent=2)
+    return path
+
+
+def _flatten(value, prefix=''):
+    if isinstance(value, dict):
+        items = {}
+        for key, item in value.items():
+            items.update(_flatten(item, prefix + str(key) + '.'))
+        return items
+    if isinstance(value, list):
+        items = {}
+        for i, item in enumerate(value):
+            items.update(_flatten(item, prefix + str(i) + '.'))
+        return items
+    return {prefix[:-1]: value}
+
+
+def compare(result, baseline_path):
+    """与基线结果文件比较，返回[(指标, 基线值, 当前值, 比值), ...]，只包含数值指标"""
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = _flatten(json.load(file)['result'])
+    current = _flatten(result)
+    rows = []
+    for key, value in current.items():
+        old = baseline.get(key)
+        if isinstance(value, (int, float)) and isinstance(old, (int, float)) and not isinstance(value, bool):
+            rows.append((key, old, value, round(value / old, 3) if old else None))
+    return rows
+
+
+def print_comparison(rows):
+    for key, old, new, ratio in rows:
+        print("%-40s %14s -> %-14s %s" % (key, old, new, '' if ratio is None else 'x%.3f' % ratio))
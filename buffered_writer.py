@@ -0,0 +1,112 @@
+# buffered_writer.py
+# Function: 异步缓冲写入
+# 接收线程只把数据行放进有界队列，由后台线程按行数或时间间隔批量交给sink写入(group commit)
+import queue
+import threading
+import time
+
+import log_config
+
+logger = log_config.get_logger('buffered_writer')
+
+DEFAULT_QUEUE_SIZE = 10000     # 队列最多缓存的行数，超出后丢弃新行
+DEFAULT_BATCH_ROWS = 500       # 累积多少行提交一次
+DEFAULT_FLUSH_INTERVAL = 1.0   # 最长多少秒提交一次
+
+
+class BufferedWriter:
+    def __init__(self, sink, name='buffered-writer', queue_size=DEFAULT_QUEUE_SIZE,
+                 batch_rows=DEFAULT_BATCH_ROWS, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.sink = sink  # 批量写入函数，参数为数据行的列表
+        self.name = name
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # 统计计数
+        self.written_rows = 0
+        self.dropped_rows = 0
+        self.flush_count = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def write(self, row):
+        """放入一行数据，不阻塞调用线程；队列已满时丢弃该行并计数"""
+        self.start()
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped_rows += 1
+            return False
+
+    def flush(self, timeout=5.0):
+        """等待队列中已有的数据全部写入文件"""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize(),
+            'written_rows': self.written_rows,
+            'dropped_rows': self.dropped_rows,
+            'flush_count': self.flush_count,
+            'last_flush_latency_ms': round(self.last_flush_latency * 1000, 3),
+            'max_flush_latency_ms': round(self.max_flush_latency * 1000, 3),
+            'avg_flush_latency_ms': round(self.total_flush_latency * 1000 / self.flush_count, 3) if self.flush_count else 0.0,
+        }
+
+    def _commit(self, rows):
+        start = time.perf_counter()
+        self.sink(rows)
+        latency = time.perf_counter() - start
+        self.written_rows += len(rows)
+        self.flush_count += 1
+        self.last_flush_latency = latency
+        self.total_flush_latency += latency
+        if latency > self.max_flush_latency:
+            self.max_flush_latency = latency
+
+    def _run(self):
+        rows = []
+        waiters = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    rows.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                pass
+            if waiters or len(rows) >= self.batch_rows or (deadline is not None and time.monotonic() >= deadline):
+                if rows:
+                    try:
+                        self._commit(rows)
+                    except Exception as e:
+                        self.dropped_rows += len(rows)
+                        logger.error("%s 批量写入失败: %s", self.name, e)
+                rows = []
+                deadline = None
+                for waiter in waiters:
+                    waiter.set()
+                waiters = []
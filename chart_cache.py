@@ -0,0 +1,116 @@
+# chart_cache.py
+# Function: /chart接口使用的内存时间序列缓存
+# 每个变量(温度/湿度/气压)一列按时间排序的数据，每次查询时只读取存储中新追加的行，
+# 新数据早于已缓存的最后一条时只把它归并到末尾受影响的部分，不重新排序全部数据。
+# 分区被替换(存储标识generation改变)、删除或行数变少时整体重建。
+# store为PartitionedStore时，device指定只缓存一个设备的分区，为None时缓存所有分区。
+import threading
+
+import numpy as np
+
+import ts_store
+
+VARIABLES = ts_store.FIELDS
+
+
+class _Series:
+    """单个变量的有序时间序列，容量按倍数增长"""
+
+    def __init__(self):
+        self.size = 0
+        self._times = np.empty(1024, dtype=np.int64)
+        self._values = np.empty(1024, dtype=np.float32)
+
+    @property
+    def times(self):
+        return self._times[:self.size]
+
+    @property
+    def values(self):
+        return self._values[:self.size]
+
+    def _reserve(self, n):
+        if n <= len(self._times):
+            return
+        capacity = max(n, len(self._times) * 2)
+        times = np.empty(capacity, dtype=np.int64)
+        values = np.empty(capacity, dtype=np.float32)
+        times[:self.size] = self.times
+        values[:self.size] = self.values
+        self._times, self._values = times, values
+
+    def extend(self, times, values):
+        if len(times) == 0:
+            return
+        times = np.asarray(times, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float32)
+        if np.any(times[1:] < times[:-1]):
+            order = np.argsort(times, kind='stable')
+            times, values = times[order], values[order]
+        start, end = self.size, self.size + len(times)
+        self._reserve(end)
+        # 新数据早于已有的最后一条时(发布端时间乱序)，只把新数据归并到晚于它的那一段已有数据中，
+        # 相同时间的已有数据排在前面；大多数情况下新数据都更晚，直接追加
+        if start > 0 and times[0] < self._times[start - 1]:
+            lo = int(np.searchsorted(self._times[:start], times[0], side='right'))
+            old_times, old_values = self._times[lo:start].copy(), self._values[lo:start].copy()
+            positions = np.searchsorted(old_times, times, side='right')
+            self._times[lo:end] = np.insert(old_times, positions, times)
+            self._values[lo:end] = np.insert(old_values, positions, values)
+        else:
+            self._times[start:end] = times
+            self._values[start:end] = values
+        self.size = end
+
+
+class ChartCache:
+    def __init__(self, store, device=None):
+        self.store = store
+        self.device = device
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._rows = {}  # 分区 -> (存储标识, 已经读取的存储行数)
+        self._series = {name: _Series() for name in VARIABLES}
+
+    def _stores(self):
+        if isinstance(self.store, ts_store.PartitionedStore):
+            return self.store.stores(self.device)
+        return {None: self.store}
+
+    def _refresh(self):
+        stores = self._stores()
+        totals = {key: len(store) for key, store in stores.items()}
+        # 分区被替换、删除或行数变少，说明缓存的数据已不是存储中的数据，重建缓存
+        for key, (generation, rows) in self._rows.items():
+            store = stores.get(key)
+            if store is None or store.generation != generation or totals[key] < rows:
+                self._reset()
+                break
+        # 各分区新追加的行合并后一次加入，新数据都晚于已有数据时不需要重新排序
+        parts = []
+        for key, store in stores.items():
+            _, rows = self._rows.get(key, (None, 0))
+            if totals[key] > rows:
+                parts.append(store.read(rows, totals[key]))
+            self._rows[key] = (store.generation, totals[key])
+        if not parts:
+            return
+        data = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+        times = data['time']
+        for name in VARIABLES:
+            mask = ts_store.present(name, data[name])
+            self._series[name].extend(times[mask], data[name][mask])
+
+    def series(self, variable, start=None, end=None):
+        """返回指定变量在[start, end]时间范围内按时间排序的(时间戳数组, 数值数组)的副本"""
+        if variable not in VARIABLES:
+            raise ValueError("Invalid topic")
+        with self._lock:
+            self._refresh()
+            series = self._series[variable]
+            times = series.times
+            lo = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+            hi = len(times) if end is None else int(np.searchsorted(times, end, side='right'))
+            return times[lo:hi].copy(), series.values[lo:hi].copy()
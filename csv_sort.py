@@ -0,0 +1,139 @@
+# csv_sort.py
+# Function: 按第一列时间戳对发布数据文件排序
+# 1. 文件旁边的标记文件(<文件名>.sorted)记录了文件已排序时的mtime和大小，二者不变时直接跳过
+# 2. 否则先流式检查文件是否已经有序，有序时只写标记文件，不重写数据
+# 3. 无序时做分块外部归并排序: 每次读取CHUNK_ROWS行排序后写入临时文件，
+#    再用heapq.merge逐行归并，内存占用与文件大小无关；最后替换原文件(保留原文件的权限)
+#    临时文件很多时分多轮归并，每次最多同时打开MERGE_FAN_IN个文件
+import csv
+import heapq
+import json
+import os
+import shutil
+import tempfile
+
+CHUNK_ROWS = 500000          # 每个排序块的行数
+MERGE_FAN_IN = 64            # 每次归并最多的临时文件数
+MARKER_SUFFIX = '.sorted'
+
+# ensure_sorted的返回值
+MARKED = 'marked'            # 标记文件有效，未读取数据
+ALREADY_SORTED = 'sorted'    # 检查后发现已经有序
+RESORTED = 'resorted'        # 进行了排序并重写
+
+
+def _key(row):
+    return int(row[0])
+
+
+def _rows(file):
+    """读取数据行，跳过空行"""
+    for row in csv.reader(file):
+        if row:
+            yield row
+
+
+def marker_path(path):
+    return path + MARKER_SUFFIX
+
+
+def _file_state(path):
+    stat = os.stat(path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def is_marked_sorted(path):
+    """标记文件记录的mtime和大小与当前文件一致时返回True"""
+    try:
+        with open(marker_path(path), 'r') as file:
+            return json.load(file) == _file_state(path)
+    except (OSError, ValueError):
+        return False
+
+
+def mark_sorted(path):
+    with open(marker_path(path), 'w') as file:
+        json.dump(_file_state(path), file)
+
+
+def is_sorted(path):
+    """流式检查文件是否按时间戳有序，遇到第一个逆序行即返回False"""
+    with open(path, 'r', newline='') as file:
+        last = None
+        for row in _rows(file):
+            key = _key(row)
+            if last is not None and key < last:
+                return False
+            last = key
+    return True
+
+
+def _write_run(directory, rows):
+    rows.sort(key=_key)
+    fd, run_path = tempfile.mkstemp(prefix='sort-run-', suffix='.csv', dir=directory)
+    with os.fdopen(fd, 'w', newline='') as file:
+        csv.writer(file).writerows(rows)
+    return run_path
+
+
+def _merge_runs(directory, runs):
+    """把若干个已排序的临时文件按顺序归并为一个新的临时文件，返回其路径"""
+    fd, out_path = tempfile.mkstemp(prefix='sort-run-', suffix='.csv', dir=directory)
+    files = [open(run_path, 'r', newline='') for run_path in runs]
+    try:
+        with os.fdopen(fd, 'w', newline='') as out:
+            csv.writer(out).writerows(heapq.merge(*[csv.reader(f) for f in files], key=_key))
+    except Exception:
+        os.remove(out_path)
+        raise
+    finally:
+        for f in files:
+            f.close()
+    return out_path
+
+
+def external_sort(path, chunk_rows=CHUNK_ROWS, fan_in=MERGE_FAN_IN):
+    """对文件做分块外部归并排序(稳定排序)，结果替换原文件"""
+    if fan_in < 2:
+        raise ValueError("每次归并的文件数必须至少为2: %r" % fan_in)
+    directory = os.path.dirname(os.path.abspath(path))
+    runs, pending = [], []
+    try:
+        with open(path, 'r', newline='') as file:
+            chunk = []
+            for row in _rows(file):
+                chunk.append(row)
+                if len(chunk) >= chunk_rows:
+                    runs.append(_write_run(directory, chunk))
+                    chunk = []
+            if chunk or not runs:
+                runs.append(_write_run(directory, chunk))
+        # 每轮把相邻的fan_in个文件归并为一个，直到只剩一个；相邻的文件按原顺序归并，排序保持稳定
+        while len(runs) > 1:
+            pending, runs = runs, []
+            while pending:
+                group = pending[:fan_in]
+                runs.append(_merge_runs(directory, group) if len(group) > 1 else group[0])
+                del pending[:fan_in]
+                if len(group) > 1:
+                    for run_path in group:
+                        os.remove(run_path)
+        # 临时文件由mkstemp创建，只有所有者可读写，替换前改为原文件的权限
+        shutil.copymode(path, runs[0])
+        os.replace(runs.pop(), path)
+    finally:
+        for run_path in runs + pending:
+            os.remove(run_path)
+
+
+def ensure_sorted(path, chunk_rows=CHUNK_ROWS):
+    """保证文件按时间戳有序，返回MARKED、ALREADY_SORTED或RESORTED"""
+    if is_marked_sorted(path):
+        return MARKED
+    if is_sorted(path):
+        result = ALREADY_SORTED
+    else:
+        external_sort(path, chunk_rows)
+        result = RESORTED
+    mark_sorted(path)
+    return result
@@ -1,54 +1,181 @@
-# 将时间字符串转换为时间戳
-import csv
+# data.py
+# Function: 把THPData下的温度、湿度、气压数据整理为发布端使用的数据文件
+# 原始文件每行是一个{时间字符串: 数值}的JSON对象。三个序列各自读成带类型的列，按时间外连接，
+# ISO时间整体转换为毫秒时间戳(不逐行strptime)，排序后直接写出:
+#   merged_data.csv - 时间字符串,温度,湿度,气压(有表头，缺失值为空)
+#   THP_data.csv    - 毫秒时间戳,温度,湿度,气压(无表头，只保留三项都有的行)，发布端直接读取，并写入已排序标记
+# 指定--store时同时导入订阅端的二进制存储(ts_store)。
+# numpy、pandas和ts_store只在用到的函数中导入，只使用time_to_timestamp等函数时导入本模块不需要加载它们。
+# 用法:
+#   python data.py [--dir THPData] [--utc-offset 8] [--store data/readings]
+import argparse
+import calendar
 import json
-from datetime import datetime
+import os
+import time
 
-def time_to_timestamp(time_str):
-    dt_obj = datetime.strptime(time_str, '%Y-%m-%dT%H:%M:%S')
-    return int(dt_obj.timestamp()) * 1000
+import csv_sort
+import log_config
 
-# 读取数据文件并解析为字典的函数
-def read_data(file_path):
+logger = log_config.get_logger('data')
+
+DEFAULT_DIR = 'THPData'
+SERIES_FILES = (
+    ('temperature', 'temperature.txt'),
+    ('humidity', 'humidity.txt'),
+    ('pressure', 'pressure.txt'),
+)
+FIELDS = tuple(name for name, _ in SERIES_FILES)
+MERGED_FILE = 'merged_data.csv'
+PUBLISH_FILE = 'THP_data.csv'
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+DEFAULT_UTC_OFFSET = 8.0   # 原始数据中的时间为北京时间(UTC+8)
+
+
+def time_to_timestamp(time_str, utc_offset=DEFAULT_UTC_OFFSET):
+    """把一个时间字符串转换为毫秒时间戳，批量转换使用to_epoch_ms"""
+    seconds = calendar.timegm(time.strptime(time_str, TIME_FORMAT))
+    return seconds * 1000 - int(round(utc_offset * 3600000))
+
+
+def read_series(file_path, name):
+    """读取一个序列文件，返回以时间字符串为索引的float64序列
+
+    同一时间出现多次时以最后一次为准；无法转换为数值的值记为NaN。
+    """
+    import numpy as np
+    import pandas as pd
+    times, values = [], []
     with open(file_path, 'r') as file:
-        # 用于存储所有解析后的数据的字典
-        combined_data = {}
-        # 逐行读取和解析JSON
         for line in file:
-            # 解析当前行的JSON数据
-            line_data = json.loads(line)
-            # 将解析后的字典合并到总字典中
-            combined_data.update(line_data)
-    return combined_data
-
-# 合并温度、湿度和气压数据的函数
-def merge_data(temperature_data, humidity_data, pressure_data):
-    merged_data = {}
-    for time_str in humidity_data:
-        merged_data[time_str] = {
-            "temperature": temperature_data.get(time_str, None),
-            "humidity": humidity_data.get(time_str, None),
-            "pressure": pressure_data.get(time_str, None)
-        }
-    return merged_data
-
-# 读取数据
-temperature_data = read_data('THPData/temperature.txt')
-humidity_data = read_data('THPData/humidity.txt')
-pressure_data = read_data('THPData/pressure.txt')
-
-# 合并数据
-merged_dict = merge_data(temperature_data, humidity_data, pressure_data)
-
-# 写入合并后的数据到表格
-def write_data_to_csv(data, file_path):
+            if line.strip():
+                line_data = json.loads(line)
+                times.extend(line_data.keys())
+                values.extend(line_data.values())
+    try:
+        values = np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        values = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+    series = pd.Series(values, index=pd.Index(times, dtype=object, name='time'), name=name)
+    return series[~series.index.duplicated(keep='last')]
+
+
+def to_epoch_ms(time_strs, utc_offset=DEFAULT_UTC_OFFSET):
+    """把时间字符串整体转换为毫秒时间戳，无法解析的时间返回-1"""
+    import numpy as np
+    import pandas as pd
+    stamps = pd.to_datetime(pd.Index(time_strs, dtype=object), format=TIME_FORMAT, errors='coerce')
+    valid = ~np.asarray(stamps.isna())
+    ms = np.full(len(stamps), -1, dtype=np.int64)
+    ms[valid] = stamps[valid].values.astype('datetime64[ms]').astype(np.int64) - int(round(utc_offset * 3600000))
+    return ms
+
+
+def merge_series(series_list, utc_offset=DEFAULT_UTC_OFFSET):
+    """按时间外连接各序列，返回以时间字符串为索引、按时间排序的表
+
+    表中的列: timestamp(毫秒时间戳)以及各序列的值；时间无法解析的行被丢弃。
+    """
+    import pandas as pd
+    frame = pd.concat(series_list, axis=1, join='outer')
+    timestamps = to_epoch_ms(frame.index, utc_offset)
+    invalid = timestamps < 0
+    if invalid.any():
+        logger.warning("丢弃%d行无法解析的时间，例如: %s", int(invalid.sum()), frame.index[invalid][0])
+        frame, timestamps = frame[~invalid], timestamps[~invalid]
+    frame.insert(0, 'timestamp', timestamps)
+    return frame.sort_values('timestamp', kind='stable')
+
+
+def load(directory=DEFAULT_DIR, utc_offset=DEFAULT_UTC_OFFSET):
+    """读取directory下的三个序列文件并合并"""
+    return merge_series([read_series(os.path.join(directory, file_name), name)
+                         for name, file_name in SERIES_FILES], utc_offset)
+
+
+def format_values(values):
+    """把一列数值整体转换为字符串: 整数值写成"66"而不是"66.0"，缺失值为空"""
+    import numpy as np
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    integral = (np.abs(values) < 2 ** 53) & (values == np.trunc(values))
+    text = np.where(integral, values, 0).astype(np.int64).astype(str).astype(object)
+    fraction = ~integral & ~missing
+    text[fraction] = values[fraction].astype(str)
+    text[missing] = ''
+    return text
+
+
+def _write_columns(file_path, columns, header=None):
+    """按行拼接已转换为字符串的各列并一次写出"""
+    lines = columns[0]
+    for column in columns[1:]:
+        lines = lines + ',' + column
     with open(file_path, 'w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(['time', 'temperature', 'humidity', 'pressure'])
-        for time_str, values in data.items():
-            temperature = values.get('temperature', '')
-            humidity = values.get('humidity', '')
-            pressure = values.get('pressure', '')
-            writer.writerow([time_str, temperature, humidity, pressure])
-
-# 写入数据到表格
-write_data_to_csv(merged_dict, 'THPData/merged_data.csv')
\ No newline at end of file
+        if header:
+            file.write(','.join(header) + '\n')
+        if len(lines):
+            file.write('\n'.join(lines))
+            file.write('\n')
+
+
+def write_merged_csv(frame, file_path):
+    """写出时间字符串,温度,湿度,气压，返回行数"""
+    columns = [frame.index.to_numpy(dtype=object)] + [format_values(frame[name]) for name in FIELDS]
+    _write_columns(file_path, columns, header=('time',) + FIELDS)
+    return len(frame)
+
+
+def complete_rows(frame):
+    """三项数据都有的行，发布端只发布这些行"""
+    return frame.dropna(subset=list(FIELDS))
+
+
+def write_publish_csv(frame, file_path):
+    """写出发布端使用的毫秒时间戳,温度,湿度,气压(无表头)，返回行数
+
+    frame已按时间排序，写完后记录已排序标记，发布端不需要再检查。
+    """
+    rows = complete_rows(frame)
+    columns = [rows['timestamp'].to_numpy().astype(str).astype(object)]
+    columns += [format_values(rows[name]) for name in FIELDS]
+    _write_columns(file_path, columns)
+    csv_sort.mark_sorted(file_path)
+    return len(rows)
+
+
+def import_to_store(frame, directory):
+    """把数据导入订阅端存储的默认分区，返回导入的行数"""
+    import numpy as np
+    import ts_store
+    columns = {
+        'time': frame['timestamp'].to_numpy(dtype=np.int64),
+        'temperature': frame['temperature'].to_numpy(dtype=np.float32),
+        'humidity': frame['humidity'].to_numpy(dtype=np.float32),
+        'pressure': frame['pressure'].fillna(ts_store.PRESSURE_MISSING).to_numpy(dtype=np.int32),
+    }
+    store = ts_store.PartitionedStore(directory).partition(ts_store.DEFAULT_DEVICE, create=True)
+    store.append_columns(columns)
+    return len(frame)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='合并温度、湿度、气压数据，生成发布端的数据文件')
+    parser.add_argument('--dir', default=DEFAULT_DIR, help='原始数据所在目录，输出文件也写在这里')
+    parser.add_argument('--utc-offset', type=float, default=DEFAULT_UTC_OFFSET, help='原始数据时间的UTC偏移(小时)')
+    parser.add_argument('--store', help='同时导入订阅端的二进制存储目录')
+    args = parser.parse_args(argv)
+    log_config.configure()
+
+    started = time.perf_counter()
+    frame = load(args.dir, args.utc_offset)
+    merged = write_merged_csv(frame, os.path.join(args.dir, MERGED_FILE))
+    published = write_publish_csv(frame, os.path.join(args.dir, PUBLISH_FILE))
+    print("合并%d行，其中%d行数据完整，已写入%s和%s" % (merged, published, MERGED_FILE, PUBLISH_FILE))
+    if args.store:
+        print("已导入%d行到%s" % (import_to_store(frame, args.store), args.store))
+    print("用时%.3f秒" % (time.perf_counter() - started))
+
+
+if __name__ == '__main__':
+    main()
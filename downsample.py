@@ -0,0 +1,71 @@
+# downsample.py
+# Function: 图表数据降采样，在控制点数的同时保留曲线形状
+#   lttb   - Largest-Triangle-Three-Buckets，每个桶保留与相邻桶构成三角形面积最大的点
+#   minmax - 每个桶保留最小值和最大值两个点
+# 两个函数都返回被选中点的下标(升序)，调用方据此取出时间和数值
+import numpy as np
+
+METHODS = ('lttb', 'minmax')
+
+
+def _bucket_edges(n, buckets):
+    return np.linspace(0, n, buckets + 1).astype(np.int64)
+
+
+def lttb(x, y, threshold):
+    """返回LTTB算法选出的不超过threshold个点的下标"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # 第一个点和最后一个点固定保留，中间的点分成threshold-2个桶
+    edges = _bucket_edges(n - 2, threshold - 2) + 1
+    # 每个桶的平均点，用作计算下一个桶时的第三个顶点
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[n - 1])
+    avg_y = np.append(sums_y / counts, y[n - 1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        cx, cy = avg_x[i + 1], avg_y[i + 1]
+        bx, by = x[start:end], y[start:end]
+        # 三角形面积的两倍，只比较大小，不需要乘0.5
+        area = np.abs((x[a] - cx) * (by - y[a]) - (x[a] - bx) * (cy - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(y, threshold):
+    """把数据分成threshold/2个桶，返回每个桶中最小值和最大值的下标"""
+    n = len(y)
+    buckets = threshold // 2
+    if threshold >= n or buckets < 1:
+        return np.arange(n)
+    y = np.asarray(y, dtype=np.float64)
+    edges = _bucket_edges(n, buckets)
+    bucket_id = np.repeat(np.arange(buckets), np.diff(edges))
+    mins = np.minimum.reduceat(y, edges[:-1])
+    maxs = np.maximum.reduceat(y, edges[:-1])
+    # 每个桶中第一个等于桶最小值/最大值的位置
+    min_mask = y == mins[bucket_id]
+    max_mask = y == maxs[bucket_id]
+    min_idx = np.flatnonzero(min_mask)[np.unique(bucket_id[min_mask], return_index=True)[1]]
+    max_idx = np.flatnonzero(max_mask)[np.unique(bucket_id[max_mask], return_index=True)[1]]
+    return np.unique(np.concatenate((min_idx, max_idx)))
+
+
+def downsample(x, y, threshold, method='lttb'):
+    """按method降采样，返回选中点的下标"""
+    if method == 'lttb':
+        return lttb(x, y, threshold)
+    if method == 'minmax':
+        return minmax(y, threshold)
+    raise ValueError("未知的降采样方法: " + str(method))
@@ -1,8 +1,18 @@
 
+from ring_buffer import ReadingRingBuffer
+
+# 接收数据缓冲区的容量，超出后覆盖最早的数据，保证长时间运行时内存不增长
+RECEIVE_CAPACITY = 10000
+# 每个设备单独的接收数据缓冲区容量
+DEVICE_RECEIVE_CAPACITY = 1000
+
 class global_var:
-    receive_data = []
+    receive_data = ReadingRingBuffer(RECEIVE_CAPACITY)
+    # 设备名 -> 该设备的接收数据缓冲区，收到设备的第一条数据时创建
+    device_data = {}
+    # /TopicData在前端没有提供游标时使用的默认读取位置
+    topic_cursor = 0
+    # /subTopic选择的主题；其中的MQTT主题过滤器编译到subscribe_module.topic_filter中，字段名不参与过滤
     topic_list = []
     # 添加一个标志，以跟踪断开是不是用户主动操作的
     user_initiated_disconnect = False
-    # 连接检查线程运行标志
-    connection_check_running = False
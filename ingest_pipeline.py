@@ -0,0 +1,215 @@
+# ingest_pipeline.py
+# Function: 订阅端的消息处理流水线
+# paho网络线程的on_message只把(主题, 负载, 接收时间)放进有界队列后立即返回，
+# 由若干工作线程按批取出交给handler解析和保存，处理慢时不会耽误心跳和socket读取。
+# 队列满时的处理策略:
+#   block       - 阻塞网络线程直到队列有空位，通过TCP背压让服务器放慢发送
+#   drop_oldest - 丢弃队列中最早的消息
+#   spill       - 溢出的消息按顺序追加到磁盘上的溢出文件(outbox.Outbox)，队列处理完后再读回；
+#                 溢出文件不为空时新消息也追加到溢出文件，保持先后顺序。进程重启后继续处理上次未处理完的部分
+# 溢出文件同一时间只由一个工作线程读取，读取时不持有队列的锁；handler成功返回后才提交这一批，
+# 处理中途进程退出时重启后会再处理这一批(至少一次)。handler抛出异常(如写入存储失败)时不提交，
+# 按退避时间重试同一批；停止时还没有重试成功的一批留在溢出文件中，下次启动后再处理。
+import collections
+import threading
+import time
+
+import log_config
+from outbox import Outbox
+
+logger = log_config.get_logger('ingest_pipeline')
+
+POLICIES = ('block', 'drop_oldest', 'spill')
+DEFAULT_POLICY = 'drop_oldest'
+DEFAULT_QUEUE_SIZE = 10000   # 内存队列最多缓存的消息数
+DEFAULT_BATCH_SIZE = 200     # 工作线程每次最多取出的消息数
+DEFAULT_SPILL_PATH = 'data/ingest/spill.log'
+SPILL_RETRY_MIN = 0.1        # 溢出文件中的一批处理失败后，重试前等待的时间(秒)，每次失败翻倍
+SPILL_RETRY_MAX = 5.0
+
+
+class IngestPipeline:
+    def __init__(self, handler, workers=1, queue_size=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                 policy=DEFAULT_POLICY, spill_path=DEFAULT_SPILL_PATH, name='ingest'):
+        if policy not in POLICIES:
+            raise ValueError("未知的队列溢出策略: %r，可选: %s" % (policy, ', '.join(POLICIES)))
+        if workers < 1 or queue_size < 1 or batch_size < 1:
+            raise ValueError("工作线程数、队列长度和批大小必须大于0")
+        self.handler = handler  # 批量处理函数，参数为[(主题, 负载, 接收时间), ...]
+        self.workers = workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.policy = policy
+        self.name = name
+        self._queue = collections.deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._spill = Outbox(spill_path) if policy == 'spill' else None
+        self._spill_reading = False  # 是否有工作线程正在处理溢出文件中的一批
+        self._spill_delay = 0.0      # 溢出文件中的一批处理失败后的重试等待时间，成功后清零
+        self._spill_retry_at = 0.0   # 可以重试的时间(time.monotonic())
+        self._threads = []
+        self._busy = 0
+        self._stopping = False
+
+        # 统计计数
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0      # drop_oldest丢弃的，或溢出文件也已满时丢弃的消息数
+        self.spilled = 0      # 写入溢出文件的消息数
+        self.failed = 0       # handler抛出异常的批次中的消息数
+        self.blocked = 0      # block策略下put等待的次数
+        self.batches = 0
+
+    def start(self):
+        with self._lock:
+            self._stopping = False
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name='%s-%d' % (self.name, len(self._threads)), daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _spill_depth(self):
+        return len(self._spill) if self._spill is not None else 0
+
+    def _spill_ready(self):
+        # 调用时需持有self._lock
+        if self._spill_reading or self._spill_depth() == 0:
+            return False
+        if self._spill_delay and (self._stopping or time.monotonic() < self._spill_retry_at):
+            return False
+        return True
+
+    def _spill_wait(self):
+        # 调用时需持有self._lock；溢出文件中的一批等待重试时返回剩余的等待时间，否则返回None
+        if self._spill_delay and not self._spill_reading and not self._stopping and self._spill_depth():
+            return max(0.0, self._spill_retry_at - time.monotonic())
+        return None
+
+    def put(self, topic, payload, recv_ts=None):
+        """放入一条消息，返回False表示有消息被丢弃(这条消息，或drop_oldest策略下队列中最早的消息)"""
+        if recv_ts is None:
+            recv_ts = time.time()
+        with self._lock:
+            if self._spill_depth() or len(self._queue) >= self.queue_size:
+                if self.policy == 'spill':
+                    if not self._spill.append(topic, payload, enqueued_at=recv_ts):
+                        self.dropped += 1
+                        return False
+                    self.spilled += 1
+                    self._not_empty.notify()
+                    return True
+                if self.policy == 'drop_oldest':
+                    self._queue.popleft()
+                    self.dropped += 1
+                    self._queue.append((topic, payload, recv_ts))
+                    self.enqueued += 1
+                    return False
+                self.blocked += 1
+                while len(self._queue) >= self.queue_size and not self._stopping:
+                    self._not_full.wait()
+            self._queue.append((topic, payload, recv_ts))
+            self.enqueued += 1
+            self._not_empty.notify()
+            return True
+
+    def _take(self):
+        # 调用时需持有self._lock；从内存队列取出一批
+        count = min(self.batch_size, len(self._queue))
+        batch = [self._queue.popleft() for _ in range(count)]
+        self._not_full.notify_all()
+        return batch
+
+    def _read_spill(self):
+        # 不持有self._lock，paho网络线程put时不必等待读文件
+        records = self._spill.peek(self.batch_size, with_time=True)
+        return [(topic, payload, recv_ts) for topic, payload, _, recv_ts in records]
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._spill_ready() and not self._stopping:
+                    self._not_empty.wait(self._spill_wait())
+                # 先取内存队列，内存队列为空时从溢出文件读回
+                from_spill = not self._queue
+                if from_spill and not self._spill_ready():
+                    return  # 已停止且没有剩余消息(溢出文件由正在读取的工作线程继续处理)
+                if from_spill:
+                    self._spill_reading = True
+                    batch = []
+                else:
+                    batch = self._take()
+                self._busy += 1
+            ok = False
+            try:
+                if from_spill:
+                    batch = self._read_spill()
+                self.handler(batch)
+                ok = True
+                if from_spill:
+                    self._spill.commit(len(batch))
+            except Exception:
+                self.failed += len(batch)
+                logger.exception("%s 处理一批%d条消息时发生错误", self.name, len(batch))
+            finally:
+                with self._lock:
+                    if from_spill:
+                        self._spill_reading = False
+                        if ok:
+                            self._spill_delay = 0.0
+                        else:
+                            # 不提交，这一批留在溢出文件中，等待后重试
+                            self._spill_delay = min(max(self._spill_delay * 2, SPILL_RETRY_MIN), SPILL_RETRY_MAX)
+                            self._spill_retry_at = time.monotonic() + self._spill_delay
+                        self._not_empty.notify_all()
+                    self._busy -= 1
+                    if ok or not from_spill:
+                        self.processed += len(batch)
+                    self.batches += 1
+                    self._idle.notify_all()
+
+    def depth(self):
+        return len(self._queue)
+
+    def flush(self, timeout=5.0):
+        """等待已放入的消息全部处理完"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            if not self._threads:
+                return not self._queue and not self._spill_depth()
+            while self._queue or self._spill_depth() or self._busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+            return True
+
+    def stop(self, timeout=5.0):
+        """处理完剩余消息后停止工作线程"""
+        with self._lock:
+            self._stopping = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+            threads, self._threads = self._threads, []
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def stats(self):
+        return {
+            'policy': self.policy,
+            'workers': self.workers,
+            'queue_depth': len(self._queue),
+            'queue_size': self.queue_size,
+            'spill_depth': self._spill_depth(),
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'spilled': self.spilled,
+            'failed': self.failed,
+            'blocked': self.blocked,
+            'batches': self.batches,
+        }
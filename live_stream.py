@@ -0,0 +1,130 @@
+# live_stream.py
+# Function: 向浏览器推送实时数据(Server-Sent Events)的公共部分
+# 订阅端按环形缓冲区的序号推送接收数据，发布端按版本号推送最新的发布状态，
+# 浏览器断线重连时通过Last-Event-ID从上次的位置继续
+# 按MQTT主题过滤器订阅时，每个连接一个TopicStream，由subscribe_module.router把匹配的数据分发过来
+import json
+import threading
+import time
+
+from ring_buffer import ReadingRingBuffer
+
+KEEPALIVE_INTERVAL = 15.0   # 没有新数据时发送注释行的间隔，防止代理断开空闲连接
+RETRY_MS = 2000             # 浏览器断线后重连的等待时间
+STATUS_MIN_INTERVAL = 0.2   # 发布状态推送的最小间隔，避免逐条推送
+TOPIC_STREAM_CAPACITY = 1000  # 按主题订阅的连接各自缓存的数据条数
+
+
+def format_sse(data, event=None, event_id=None):
+    """把数据编码为一条SSE消息"""
+    message = ''
+    if event_id is not None:
+        message += 'id: ' + str(event_id) + '\n'
+    if event is not None:
+        message += 'event: ' + event + '\n'
+    message += 'data: ' + json.dumps(data, ensure_ascii=False) + '\n\n'
+    return message
+
+
+def sse_headers():
+    return {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+def resume_id(request, name='cursor'):
+    """从Last-Event-ID请求头或查询参数中取出续传位置，没有时返回None"""
+    value = request.headers.get('Last-Event-ID') or request.args.get(name)
+    try:
+        return int(value) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+
+def stream_readings(buffer, cursor, format_reading, batch=500):
+    """按序号推送环形缓冲区中的新数据
+
+    每个连接只保存自己的游标，只有浏览器读完上一批数据后才会取下一批，
+    客户端过慢导致数据被覆盖时发送gap事件说明丢失的条数。
+    游标大于最新序号时(服务端重启后序号重新开始，浏览器带着旧的Last-Event-ID重连)，
+    发送reset事件，从最早仍保留的数据重新开始推送。
+    """
+    yield 'retry: ' + str(RETRY_MS) + '\n\n'
+    while True:
+        if cursor > buffer.last_seq:
+            cursor = buffer.first_seq - 1
+            yield format_sse({'cursor': cursor}, event='reset')
+        if not buffer.wait(cursor, KEEPALIVE_INTERVAL):
+            yield ': keepalive\n\n'
+            continue
+        missed = buffer.first_seq - (cursor + 1)
+        if missed > 0:
+            yield format_sse({'missed': missed}, event='gap')
+        readings, cursor = buffer.since(cursor, batch)
+        if readings:
+            yield format_sse({'cursor': cursor,
+                              'readings': readings,
+                              'message': ''.join(format_reading(r) for r in readings)},
+                             event='readings', event_id=cursor)
+
+
+class TopicStream:
+    """按主题过滤器订阅的实时数据
+
+    作为router(topic_trie.TopicTrie)的消费者接收匹配的数据，放进自己的环形缓冲区，
+    推送开始时注册到router，连接关闭时注销。
+    """
+
+    def __init__(self, router, topic_filter, capacity=TOPIC_STREAM_CAPACITY):
+        self.router = router
+        self.topic_filter = topic_filter
+        self.buffer = ReadingRingBuffer(capacity)
+
+    def __call__(self, topic, device, reading):
+        self.buffer.append(reading)
+
+    def stream(self, format_reading):
+        self.router.add(self.topic_filter, self)
+        try:
+            yield from stream_readings(self.buffer, self.buffer.last_seq, format_reading)
+        finally:
+            self.router.remove(self.topic_filter, self)
+
+
+class StatusChannel:
+    """保存最新的状态快照和版本号，等待方在状态变化时被唤醒"""
+
+    def __init__(self):
+        self.version = 0
+        self.snapshot = {}
+        self._cond = threading.Condition()
+        self._last_publish = 0.0
+
+    def publish(self, status, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_publish < STATUS_MIN_INTERVAL:
+            return
+        with self._cond:
+            self._last_publish = now
+            self.version += 1
+            self.snapshot = dict(status)
+            self._cond.notify_all()
+
+    def wait(self, version, timeout):
+        """等待版本号大于version，返回(版本号, 快照)；超时返回(version, None)"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.version > version, timeout):
+                return version, None
+            return self.version, self.snapshot
+
+    def stream(self, version=None):
+        yield 'retry: ' + str(RETRY_MS) + '\n\n'
+        # 新连接先发送当前状态，断线重连时只在状态有更新时发送
+        if version is None or version < self.version:
+            with self._cond:
+                version, snapshot = self.version, self.snapshot
+            yield format_sse(snapshot, event='status', event_id=version)
+        while True:
+            version, snapshot = self.wait(version, KEEPALIVE_INTERVAL)
+            if snapshot is None:
+                yield ': keepalive\n\n'
+            else:
+                yield format_sse(snapshot, event='status', event_id=version)
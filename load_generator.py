@@ -0,0 +1,241 @@
+# load_generator.py
+# Function: 多设备压测工具，用于评估MQTT服务器和订阅端的承载能力
+# 每个模拟设备使用独立的MQTTClient连接，向各自的 /sys/<product_key>/<device_name>/thing/event/property/post 发布随机数据
+# 用法示例(本地Mosquitto):
+#   python load_generator.py --devices 50 --rate 10 --duration 60
+#   python load_generator.py --devices 200 --rate 1,5 --shape mixed --ramp linear --ramp-time 30 --json
+# 延迟为调用publish到on_publish回调的时间(QoS 0时即消息写入套接字的时间)
+import argparse
+import heapq
+import json
+import threading
+import time
+from array import array
+
+from MQTTClient import MQTTClient, PAYLOAD_SHAPES, random_payload
+import log_config
+
+logger = log_config.get_logger('load_generator')
+
+SHAPE_MIXED = 'mixed'        # 设备交替使用params和items格式
+RAMP_NONE = 'none'           # 所有设备同时开始
+RAMP_LINEAR = 'linear'       # 设备在ramp_time内均匀地陆续开始
+RAMP_STEP = 'step'           # 设备分steps批，在ramp_time内逐批开始
+RAMP_PROFILES = (RAMP_NONE, RAMP_LINEAR, RAMP_STEP)
+
+
+def percentile(sorted_values, q):
+    """sorted_values已排序，q为0~100"""
+    if not sorted_values:
+        return None
+    index = min(int(round(q / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class SimulatedDevice:
+    def __init__(self, client, rate, shape, start_offset=0.0):
+        self.client = client
+        self.topic = client.mqtt_topic_post
+        self.rate = rate
+        self.interval = 1.0 / rate
+        self.shape = shape
+        self.start_offset = start_offset
+        self.sent = 0
+        self.failed = 0
+        self.latencies = array('d')  # 秒
+        self._lock = threading.Lock()
+        self._pending = {}  # mid -> 发送时间
+        self._early = {}    # 在publish返回前就已确认的mid -> 确认时间
+        client.publish_callback = self._on_ack
+
+    def _on_ack(self, mid):
+        now = time.perf_counter()
+        with self._lock:
+            sent_at = self._pending.pop(mid, None)
+            if sent_at is None:
+                self._early[mid] = now
+            else:
+                self.latencies.append(now - sent_at)
+
+    def send(self):
+        payload = json.dumps(random_payload(self.shape))
+        sent_at = time.perf_counter()
+        rc, mid = self.client.publish(self.topic, payload)
+        if rc != 0:
+            self.failed += 1
+            return False
+        self.sent += 1
+        with self._lock:
+            acked_at = self._early.pop(mid, None)
+            if acked_at is None:
+                self._pending[mid] = sent_at
+            else:
+                self.latencies.append(acked_at - sent_at)
+        return True
+
+
+class LoadGenerator:
+    def __init__(self, devices=10, rates=(1.0,), shape='params', ramp=RAMP_NONE, ramp_time=0.0, steps=4,
+                 threads=1, broker='localhost', port=1883, product_key='loadtest', device_prefix='sim',
+                 client_factory=MQTTClient):
+        if devices < 1:
+            raise ValueError("设备数必须至少为1")
+        if any(rate <= 0 for rate in rates):
+            raise ValueError("发布速率必须大于0")
+        if shape not in PAYLOAD_SHAPES + (SHAPE_MIXED,):
+            raise ValueError("未知的消息格式: " + str(shape))
+        if ramp not in RAMP_PROFILES:
+            raise ValueError("未知的加压方式: " + str(ramp))
+        if threads < 1 or steps < 1:
+            raise ValueError("线程数和批数必须至少为1")
+        self.ramp = ramp
+        self.ramp_time = ramp_time
+        self.steps = steps
+        self.threads = min(threads, devices)
+        self.devices = []
+        for i in range(devices):
+            client = client_factory(product_key, '%s-%04d' % (device_prefix, i), 'secret', broker=broker, port=port)
+            device_shape = PAYLOAD_SHAPES[i % len(PAYLOAD_SHAPES)] if shape == SHAPE_MIXED else shape
+            self.devices.append(SimulatedDevice(client, rates[i % len(rates)], device_shape,
+                                                self._start_offset(i, devices)))
+        self._stop = threading.Event()
+        self.started_at = None
+        self.finished_at = None
+
+    def _start_offset(self, i, devices):
+        if self.ramp == RAMP_LINEAR:
+            return self.ramp_time * i / devices
+        if self.ramp == RAMP_STEP:
+            return self.ramp_time * (i * self.steps // devices) / self.steps
+        return 0.0
+
+    def connect(self, timeout=10.0):
+        for device in self.devices:
+            device.client.connect()
+        deadline = time.monotonic() + timeout
+        connected = 0
+        while time.monotonic() < deadline:
+            connected = sum(device.client.is_connected() for device in self.devices)
+            if connected == len(self.devices):
+                return
+            time.sleep(0.05)
+        raise RuntimeError("%d个设备中只有%d个连接成功" % (len(self.devices), connected))
+
+    def disconnect(self):
+        for device in self.devices:
+            device.client.disconnect()
+
+    def stop(self):
+        self._stop.set()
+
+    def target_rate(self, elapsed):
+        """elapsed秒时所有已开始设备的目标总速率"""
+        return sum(device.rate for device in self.devices if device.start_offset <= elapsed)
+
+    def _schedule(self, devices, start, end):
+        # 按下一次发送时间排列的最小堆，一个线程驱动多个设备
+        heap = [(start + device.start_offset, i) for i, device in enumerate(devices)]
+        heapq.heapify(heap)
+        while heap and not self._stop.is_set():
+            due, i = heap[0]
+            if due >= end:
+                break
+            now = time.perf_counter()
+            if due > now:
+                self._stop.wait(due - now)
+                continue
+            device = devices[i]
+            device.send()
+            # 落后时不补发，达不到的速率体现在achieved_rate中
+            heapq.heapreplace(heap, (max(due + device.interval, now), i))
+
+    def run(self, duration, report_every=5.0):
+        """发布duration秒，返回report()的结果"""
+        self._stop.clear()
+        self.started_at = time.perf_counter()
+        end = self.started_at + duration
+        workers = [threading.Thread(target=self._schedule, args=(self.devices[k::self.threads], self.started_at, end),
+                                    name='load-generator-%d' % k, daemon=True)
+                   for k in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        last_sent, last_time = 0, self.started_at
+        while any(worker.is_alive() for worker in workers):
+            deadline = time.perf_counter() + report_every
+            for worker in workers:
+                worker.join(max(deadline - time.perf_counter(), 0))
+            now = time.perf_counter()
+            sent = sum(device.sent for device in self.devices)
+            logger.info("已发布%d条，当前速率: %.1f条/秒，目标速率: %.1f条/秒",
+                        sent, (sent - last_sent) / (now - last_time), self.target_rate(now - self.started_at))
+            last_sent, last_time = sent, now
+        self.finished_at = time.perf_counter()
+        time.sleep(0.2)  # 等待最后的发布确认
+        return self.report()
+
+    def report(self):
+        elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        sent = sum(device.sent for device in self.devices)
+        latencies = sorted(value for device in self.devices for value in device.latencies)
+
+        def ms(value):
+            return None if value is None else round(value * 1000, 3)
+
+        return {
+            'devices': len(self.devices),
+            'duration': round(elapsed, 3),
+            'sent': sent,
+            'acked': len(latencies),
+            'failed': sum(device.failed for device in self.devices),
+            'target_rate': round(self.target_rate(elapsed), 1),
+            'achieved_rate': round(sent / elapsed, 1) if elapsed > 0 else 0.0,
+            'latency_ms': {
+                'p50': ms(percentile(latencies, 50)),
+                'p90': ms(percentile(latencies, 90)),
+                'p99': ms(percentile(latencies, 99)),
+                'max': ms(latencies[-1] if latencies else None),
+            },
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='MQTT多设备压测工具')
+    parser.add_argument('--broker', default='localhost')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--devices', type=int, default=10, help='模拟设备数')
+    parser.add_argument('--rate', default='1', help='每个设备每秒发布的条数，逗号分隔时按设备轮流使用')
+    parser.add_argument('--duration', type=float, default=30.0, help='发布时长(秒)')
+    parser.add_argument('--shape', default='params', choices=PAYLOAD_SHAPES + (SHAPE_MIXED,), help='消息格式')
+    parser.add_argument('--ramp', default=RAMP_NONE, choices=RAMP_PROFILES, help='加压方式')
+    parser.add_argument('--ramp-time', type=float, default=0.0, help='加压时长(秒)')
+    parser.add_argument('--steps', type=int, default=4, help='step加压的批数')
+    parser.add_argument('--threads', type=int, default=1, help='发布线程数')
+    parser.add_argument('--product-key', default='loadtest')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    args = parser.parse_args(argv)
+    log_config.configure()
+
+    generator = LoadGenerator(args.devices, [float(rate) for rate in args.rate.split(',')], args.shape,
+                              args.ramp, args.ramp_time, args.steps, args.threads,
+                              args.broker, args.port, args.product_key)
+    generator.connect()
+    try:
+        result = generator.run(args.duration)
+    except KeyboardInterrupt:
+        generator.stop()
+        result = generator.report()
+    finally:
+        generator.disconnect()
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        latency = result['latency_ms']
+        print("设备数: %d, 时长: %.1f秒" % (result['devices'], result['duration']))
+        print("发布: %d条, 确认: %d条, 失败: %d条" % (result['sent'], result['acked'], result['failed']))
+        print("目标速率: %.1f条/秒, 实际速率: %.1f条/秒" % (result['target_rate'], result['achieved_rate']))
+        print("延迟(ms): p50=%s p90=%s p99=%s max=%s" % (latency['p50'], latency['p90'], latency['p99'], latency['max']))
+    return result
+
+
+if __name__ == "__main__":
+    main()
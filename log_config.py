@@ -0,0 +1,132 @@
+# log_config.py
+# Function: 发布端和订阅端共用的日志配置
+# 通过环境变量控制日志:
+#   THP_LOG_LEVEL   全局日志级别，默认INFO
+#   THP_LOG_LEVELS  按模块设置级别，例如 "subscribe_module=DEBUG,MQTTClient=WARNING"
+#   THP_LOG_FORMAT  text(默认)或json，json时每行输出一个JSON对象，便于日志系统采集
+#   THP_LOG_SUMMARY 吞吐量汇总日志的输出间隔(秒)，默认10，设为0关闭
+# 逐条消息的日志使用DEBUG级别，默认不输出也不做格式化；
+# 消息量统计由ThroughputMeter定期汇总输出。
+# get_logger只返回日志对象，不修改全局的日志设置；程序入口(main、start)调用configure()，
+# 导入本项目的模块(测试、其他程序)时不会添加处理器或改变日志级别。
+import json
+import logging
+import os
+import threading
+import time
+
+_configured = False
+_lock = threading.Lock()
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _set_level(logger, level, source):
+    """设置日志级别，级别名称不合法时保留原来的级别并输出警告"""
+    try:
+        logger.setLevel(level.strip().upper())
+    except ValueError:
+        logging.getLogger(__name__).warning("%s中的日志级别不合法: %r", source, level)
+
+
+def configure():
+    """按环境变量配置根日志，只执行一次，由程序入口调用"""
+    global _configured
+    with _lock:
+        if _configured:
+            return
+        handler = logging.StreamHandler()
+        if os.environ.get('THP_LOG_FORMAT', 'text').lower() == 'json':
+            handler.setFormatter(_JsonFormatter())
+        else:
+            handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        root = logging.getLogger()
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+        _set_level(root, os.environ.get('THP_LOG_LEVEL', 'INFO'), 'THP_LOG_LEVEL')
+        for item in os.environ.get('THP_LOG_LEVELS', '').split(','):
+            if '=' in item:
+                name, level = item.split('=', 1)
+                _set_level(logging.getLogger(name.strip()), level, 'THP_LOG_LEVELS')
+        _configured = True
+
+
+def get_logger(name):
+    return logging.getLogger(name)
+
+
+def summary_interval():
+    return float(os.environ.get('THP_LOG_SUMMARY', '10'))
+
+
+class SampledLog:
+    """限制同一类日志的输出频率，interval秒内只输出一次，并附带被省略的次数"""
+
+    def __init__(self, logger, interval=5.0, level=logging.WARNING):
+        self.logger = logger
+        self.interval = interval
+        self.level = level
+        self._last = {}
+        self._suppressed = {}
+
+    def log(self, key, msg, *args):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        now = time.monotonic()
+        last = self._last.get(key)
+        if last is not None and now - last < self.interval:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return
+        suppressed = self._suppressed.pop(key, 0)
+        self._last[key] = now
+        if suppressed:
+            msg += ' (期间省略%d条同类日志)'
+            args = args + (suppressed,)
+        self.logger.log(self.level, msg, *args)
+
+
+class ThroughputMeter:
+    """统计消息条数和字节数，由后台线程定期输出msgs/s和bytes/s"""
+
+    def __init__(self, logger, what, interval=None):
+        self.logger = logger
+        self.what = what
+        self.interval = summary_interval() if interval is None else interval
+        self.count = 0
+        self.bytes = 0
+        self._thread = None
+
+    def record(self, nbytes=0, count=1):
+        self.count += count
+        self.bytes += nbytes
+        if self._thread is None and self.interval > 0:
+            self._start()
+
+    def _start(self):
+        with _lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='throughput-' + self.what, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        last_count, last_bytes, last_time = self.count, self.bytes, time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            count, nbytes, now = self.count, self.bytes, time.monotonic()
+            if count != last_count:
+                elapsed = now - last_time
+                self.logger.info('%s: %.1f msgs/s, %.1f bytes/s, 累计%d条',
+                                 self.what, (count - last_count) / elapsed, (nbytes - last_bytes) / elapsed, count)
+            last_count, last_bytes, last_time = count, nbytes, now
@@ -0,0 +1,129 @@
+# message_decoder.py
+# Function: 把MQTT消息负载解析为温湿度气压数据
+# 支持三种消息格式:
+#   items  - 阿里云格式 {"items": {"DetectTime": {"value": ...}, ...}}
+#   params - publish_app.py发送的格式 {"params": {"DetectTime": ..., ...}}
+#   flat   - 直接格式 {"time": ..., "temperature": ..., ...}
+# 同一个主题的消息格式通常不变，第一次识别出格式后按主题缓存，之后的消息直接按该格式解析。
+# 安装了orjson时使用orjson解析JSON，否则使用标准库json。
+# device_of从/sys/{product_key}/{device_name}/...格式的主题中取出设备名。
+import functools
+import json
+import time
+
+try:
+    import orjson
+    _loads = orjson.loads
+    JSON_BACKEND = 'orjson'
+except ImportError:
+    _loads = json.loads
+    JSON_BACKEND = 'json'
+
+# 消息格式无法解析时抛出的异常类型
+DECODE_ERRORS = (ValueError, KeyError, TypeError, AttributeError)
+
+
+def _decode_items(result):
+    items = result['items']
+    return {
+        "time": int(items['DetectTime']['value']),
+        "temperature": float(items['CurrentTemperature'].get("value", None)),
+        "humidity": float(items['CurrentHumidity'].get("value", None)),
+        "pressure": int(items['CurrentPressure'].get("value", None)),
+    }
+
+
+def _decode_params(result):
+    params = result['params']
+    return {
+        "time": int(params['DetectTime']),
+        "temperature": float(params['CurrentTemperature']),
+        "humidity": float(params['CurrentHumidity']),
+        "pressure": int(params['CurrentPressure']),
+    }
+
+
+def _decode_flat(result):
+    return {
+        "time": int(result.get("time", time.time() * 1000)),
+        "temperature": float(result.get("temperature", None)),
+        "humidity": float(result.get("humidity", None)),
+        "pressure": int(result.get("pressure", None)),
+    }
+
+
+SCHEMAS = {'items': _decode_items, 'params': _decode_params, 'flat': _decode_flat}
+
+
+@functools.lru_cache(maxsize=4096)
+def device_of(topic):
+    """返回/sys/{product_key}/{device_name}/...主题中的设备名，其他格式的主题返回None"""
+    if not topic:
+        return None
+    levels = topic.lstrip('/').split('/')
+    if len(levels) >= 3 and levels[0] == 'sys' and levels[2]:
+        return levels[2]
+    return None
+
+
+def detect_schema(result):
+    """按原来的判断顺序识别消息格式"""
+    if 'items' in result and 'DetectTime' in result['items']:
+        return 'items'
+    if 'params' in result and 'DetectTime' in result['params']:
+        return 'params'
+    return 'flat'
+
+
+class MessageDecoder:
+    def __init__(self):
+        self._schemas = {}  # 主题 -> 格式名
+        # 统计计数
+        self.decoded = 0
+        self.errors = 0
+        self.schema_misses = 0  # 需要重新识别格式的次数
+        self.total_ns = 0
+
+    def decode(self, topic, payload):
+        """解析一条消息，返回包含time/temperature/humidity/pressure的字典
+
+        payload可以是bytes或str，格式无法解析时抛出DECODE_ERRORS中的异常。
+        """
+        start = time.perf_counter_ns()
+        try:
+            result = _loads(payload)
+            schema = self._schemas.get(topic)
+            if schema is not None:
+                try:
+                    prop_data = SCHEMAS[schema](result)
+                    self.decoded += 1
+                    return prop_data
+                except DECODE_ERRORS:
+                    pass  # 该主题的消息格式变了，重新识别
+            self.schema_misses += 1
+            schema = detect_schema(result)
+            prop_data = SCHEMAS[schema](result)
+            self._schemas[topic] = schema
+            self.decoded += 1
+            return prop_data
+        except DECODE_ERRORS:
+            self.errors += 1
+            raise
+        finally:
+            self.total_ns += time.perf_counter_ns() - start
+
+    def schema_for(self, topic):
+        return self._schemas.get(topic)
+
+    def stats(self):
+        count = self.decoded + self.errors
+        avg_ns = self.total_ns / count if count else 0.0
+        return {
+            'backend': JSON_BACKEND,
+            'decoded': self.decoded,
+            'errors': self.errors,
+            'schema_misses': self.schema_misses,
+            'topics': len(self._schemas),
+            'avg_decode_us': round(avg_ns / 1000, 3),
+            'max_msgs_per_sec': round(1e9 / avg_ns) if avg_ns else None,
+        }
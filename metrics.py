@@ -0,0 +1,268 @@
+# metrics.py
+# Function: 运行时指标，以Prometheus文本格式通过/metrics导出
+# 计数器和直方图按线程分片: 每个线程第一次写入时分配自己的计数单元，之后只修改自己的单元，
+# 写入路径不加锁；导出时把所有线程的单元相加，已结束线程的单元并入合计后移除。
+# 也可以传入func，导出时调用func取值，用于队列长度等已有的统计。
+import bisect
+import math
+import threading
+import weakref
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# transform_data等逐条处理的耗时分桶(秒)
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1)
+# 服务器往返时间分桶(秒)
+RTT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _format_value(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names, values, extra=None):
+    pairs = ['%s="%s"' % (name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append('%s="%s"' % extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Cells:
+    """按线程分配的计数单元，每个单元是长度为size的列表
+
+    线程结束后不会再写入它的单元，分配新单元和导出时把已结束线程的单元累加到_retired后移除，
+    重连定时器、回放等短时线程不会让单元无限增加。
+    """
+
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._cells = []               # (线程的弱引用, 单元)
+        self._retired = [0] * size     # 已结束线程的单元之和
+        self._lock = threading.Lock()  # 只在线程第一次写入和导出时使用
+
+    def cell(self):
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = [0] * self._size
+            with self._lock:
+                self._prune()
+                self._cells.append((weakref.ref(threading.current_thread()), cell))
+            self._local.cell = cell
+            return cell
+
+    def _prune(self):
+        # 调用时需持有self._lock
+        alive = []
+        for ref, cell in self._cells:
+            thread = ref()
+            if thread is not None and thread.is_alive():
+                alive.append((ref, cell))
+            else:
+                for i in range(self._size):
+                    self._retired[i] += cell[i]
+        self._cells = alive
+
+    def totals(self):
+        with self._lock:
+            self._prune()
+            cells = [cell for _, cell in self._cells]
+            totals = list(self._retired)
+        return [totals[i] + sum(cell[i] for cell in cells) for i in range(self._size)]
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), func=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.func = func
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """返回指定标签值的子指标"""
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self):
+        if self.func is not None:
+            yield self.name, '', self.func()
+            return
+        if not self.labelnames:
+            yield from self._child_samples(self._default, ())
+            return
+        for values, child in sorted(self._children.items()):
+            yield from self._child_samples(child, values)
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s %s' % (self.name, self.kind)]
+        for name, labels, value in self._samples():
+            lines.append('%s%s %s' % (name, labels, _format_value(value)))
+        return '\n'.join(lines)
+
+
+class _CounterChild:
+    def __init__(self):
+        self._cells = _Cells(1)
+
+    def inc(self, amount=1):
+        self._cells.cell()[0] += amount
+
+    @property
+    def value(self):
+        return self._cells.totals()[0]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), func=None):
+        super().__init__(name, documentation, labelnames, func)
+        self._default = _CounterChild()
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    @property
+    def value(self):
+        return self.func() if self.func is not None else self._default.value
+
+    def _child_samples(self, child, values):
+        yield self.name, _label_text(self.labelnames, values), child.value
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), func=None):
+        super().__init__(name, documentation, labelnames, func)
+        self._default = _GaugeChild()
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default.set(value)
+
+    @property
+    def value(self):
+        return self.func() if self.func is not None else self._default.value
+
+    def _child_samples(self, child, values):
+        yield self.name, _label_text(self.labelnames, values), child.value
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # 每个单元: 各桶计数 + 超出最大桶的计数 + 总和
+        self._cells = _Cells(len(buckets) + 2)
+
+    def observe(self, value):
+        cell = self._cells.cell()
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def snapshot(self):
+        """返回(累计桶计数列表, 总数, 总和)"""
+        totals = self._cells.totals()
+        cumulative, running = [], 0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, running, totals[-1]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._default = _HistogramChild(self.buckets)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def snapshot(self):
+        return self._default.snapshot()
+
+    def _child_samples(self, child, values):
+        cumulative, count, total = child.snapshot()
+        for bound, running in zip(self.buckets + (float('inf'),), cumulative):
+            le = '+Inf' if math.isinf(bound) else repr(bound)
+            yield self.name + '_bucket', _label_text(self.labelnames, values, ('le', le)), running
+        labels = _label_text(self.labelnames, values)
+        yield self.name + '_count', labels, count
+        yield self.name + '_sum', labels, total
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """按名称注册指标；同名指标已存在时返回已有的指标"""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def unregister(self, name):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=(), func=None, registry=REGISTRY):
+    return registry.register(Counter(name, documentation, labelnames, func))
+
+
+def gauge(name, documentation, labelnames=(), func=None, registry=REGISTRY):
+    return registry.register(Gauge(name, documentation, labelnames, func))
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def render(registry=REGISTRY):
+    return registry.render()
@@ -0,0 +1,198 @@
+# outbox.py
+# Function: 发布端的磁盘发件箱
+# 与MQTT服务器断开期间发布的消息按顺序追加到日志文件，重新连接后再按顺序发出。
+# 日志文件中每条记录的格式:
+#   记录头(crc32, 负载长度, 入队时间, qos, 主题长度) | 主题 | 负载
+# 已发出的位置记录在<日志文件>.pos中，一批消息全部确认送达(QoS 1/2为收到PUBACK/PUBCOMP)后更新一次；
+# 确认前断开或进程退出时，重新连接或重启后会重发这一批消息(至少一次)。全部发出后清空日志文件。
+# 发件箱一直没有清空时，已发出部分超过COMPACT_BYTES后把未发出部分复制到新文件。
+# 打开时从已发出的位置开始扫描，文件末尾写了一半的记录会被截掉。
+import collections
+import os
+import struct
+import threading
+import time
+import zlib
+
+RECORD_HEADER = struct.Struct('<IIdBH')
+DEFAULT_MAX_MESSAGES = 100000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+COMPACT_BYTES = 64 * 1024 * 1024   # 已发出部分超过该大小时压缩日志文件
+
+
+class Outbox:
+    def __init__(self, path, max_messages=DEFAULT_MAX_MESSAGES, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.pos_path = path + '.pos'
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.dropped = 0          # 发件箱已满而拒绝的消息数
+        self.drained = 0          # 已发出的消息数
+        self._lock = threading.Lock()
+        self._pending = collections.deque()  # 未发出记录的(结束位置, 入队时间)
+        self._drain_started = None
+        self._drain_count = 0
+        self.drain_rate = 0.0     # 最近一次发出过程的速率(条/秒)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._head = self._load_position()
+        self._end = self._recover()
+        if not self._pending and self._end:
+            # 上次已全部发出，但退出前没来得及清空日志
+            with open(path, 'r+b') as file:
+                file.truncate(0)
+            self._head = self._end = 0
+            self._save_position()
+        self._file = open(path, 'ab')
+
+    def _load_position(self):
+        # 位置文件内容为"已发出位置 日志文件inode"，inode不一致说明日志文件在压缩后没来得及更新位置，从头开始
+        try:
+            with open(self.pos_path, 'r') as file:
+                head, inode = file.read().split()
+            return int(head) if int(inode) == os.stat(self.path).st_ino else 0
+        except (OSError, ValueError):
+            return 0
+
+    def _save_position(self):
+        tmp = self.pos_path + '.tmp'
+        with open(tmp, 'w') as file:
+            file.write('%d %d' % (self._head, os.stat(self.path).st_ino))
+        os.replace(tmp, self.pos_path)
+
+    def _recover(self):
+        """从已发出的位置开始扫描日志，重建未发出记录的索引，返回有效数据的结束位置"""
+        if not os.path.exists(self.path):
+            open(self.path, 'wb').close()
+        size = os.path.getsize(self.path)
+        if self._head > size:
+            self._head = 0
+        offset = self._head
+        with open(self.path, 'rb') as file:
+            file.seek(offset)
+            while True:
+                header = file.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                crc, length, enqueued_at, qos, topic_length = RECORD_HEADER.unpack(header)
+                body = file.read(topic_length + length)
+                if len(body) < topic_length + length or zlib.crc32(header[4:] + body) != crc:
+                    break
+                offset += RECORD_HEADER.size + len(body)
+                self._pending.append((offset, enqueued_at))
+        if offset < size:
+            # 截掉写了一半或损坏的记录
+            with open(self.path, 'r+b') as file:
+                file.truncate(offset)
+        return offset
+
+    def __len__(self):
+        return len(self._pending)
+
+    def append(self, topic, payload, qos=0, enqueued_at=None):
+        """追加一条消息，发件箱已满时返回False；enqueued_at默认为当前时间"""
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        topic_bytes = topic.encode('utf-8')
+        now = time.time() if enqueued_at is None else enqueued_at
+        header = RECORD_HEADER.pack(0, len(payload), now, qos, len(topic_bytes))[4:]
+        body = topic_bytes + payload
+        record = struct.pack('<I', zlib.crc32(header + body)) + header + body
+        with self._lock:
+            if len(self._pending) >= self.max_messages or self._end - self._head + len(record) > self.max_bytes:
+                self.dropped += 1
+                return False
+            self._file.write(record)
+            self._file.flush()
+            self._end += len(record)
+            self._pending.append((self._end, now))
+            return True
+
+    def peek(self, n, with_time=False):
+        """按顺序返回最早的n条未发出的消息[(主题, 负载, qos), ...]，with_time为True时再附上入队时间"""
+        messages = []
+        with self._lock:
+            count = min(n, len(self._pending))
+            if count == 0:
+                return messages
+            start, stop = self._head, self._pending[count - 1][0]
+        with open(self.path, 'rb') as file:
+            file.seek(start)
+            data = file.read(stop - start)
+        offset = 0
+        while offset < len(data):
+            _, length, enqueued_at, qos, topic_length = RECORD_HEADER.unpack_from(data, offset)
+            offset += RECORD_HEADER.size
+            topic = data[offset:offset + topic_length].decode('utf-8')
+            offset += topic_length
+            if with_time:
+                messages.append((topic, data[offset:offset + length], qos, enqueued_at))
+            else:
+                messages.append((topic, data[offset:offset + length], qos))
+            offset += length
+        return messages
+
+    def commit(self, n):
+        """标记最早的n条消息已发出"""
+        if n <= 0:
+            return
+        with self._lock:
+            for _ in range(min(n, len(self._pending))):
+                self._head, _ = self._pending.popleft()
+            self.drained += n
+            self._drain_count += n
+            if self._drain_started is not None:
+                elapsed = time.monotonic() - self._drain_started
+                if elapsed > 0:
+                    self.drain_rate = round(self._drain_count / elapsed, 1)
+            if not self._pending:
+                # 全部发出后清空日志
+                self._file.truncate(0)
+                self._head = self._end = 0
+            elif self._head >= COMPACT_BYTES:
+                self._compact()
+            self._save_position()
+
+    def _compact(self):
+        # 调用时需持有self._lock
+        tmp = self.path + '.tmp'
+        with open(self.path, 'rb') as source, open(tmp, 'wb') as target:
+            source.seek(self._head)
+            while True:
+                chunk = source.read(1 << 20)
+                if not chunk:
+                    break
+                target.write(chunk)
+        self._file.close()
+        os.replace(tmp, self.path)
+        self._file = open(self.path, 'ab')
+        shift = self._head
+        self._pending = collections.deque((end - shift, enqueued_at) for end, enqueued_at in self._pending)
+        self._head, self._end = 0, self._end - shift
+
+    def start_drain(self):
+        with self._lock:
+            self._drain_started = time.monotonic()
+            self._drain_count = 0
+
+    def oldest_age(self):
+        """最早一条未发出消息的等待时间(秒)"""
+        with self._lock:
+            if not self._pending:
+                return 0.0
+            return round(time.time() - self._pending[0][1], 3)
+
+    def stats(self):
+        return {
+            'depth': len(self._pending),
+            'bytes': self._end - self._head,
+            'oldest_age': self.oldest_age(),
+            'drain_rate': self.drain_rate,
+            'drained': self.drained,
+            'dropped': self.dropped,
+        }
+
+    def close(self):
+        with self._lock:
+            self._file.close()
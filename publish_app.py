@@ -1,12 +1,15 @@
 # publish_app.py
 # Function: 用于发布消息的Flask应用程序
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response
 import datetime
+import math
 from MQTTClient import MQTTClient
-import csv
-import json
-import time
 import threading
+import replay_engine
+import csv_sort
+import live_stream
+import log_config
+import metrics
 
 publish_file = "THPData/THP_data.csv"
 # 定义变量
@@ -23,7 +26,11 @@ mqtt_topic_set = f'/sys/{product_key}/{device_name}/thing/service/property/set'
 
 
 app = Flask(__name__)
-mqtt_client = MQTTClient(product_key, device_name, device_secret, broker_address, broker_port)
+# 断开期间发布的消息保存在发件箱中，重新连接后按顺序发出
+outbox_path = "data/outbox/publish.log"
+# MQTT客户端和发件箱由init()创建，导入本模块时不建立发件箱文件
+mqtt_client = None
+_init_lock = threading.Lock()
 
 # 全局变量，用于存储状态
 publish_status = {
@@ -32,60 +39,75 @@ publish_status = {
     'error': None
 }
 stop_publishing = False # 用于停止发布数据的标志
+current_engine = None # 当前正在运行的回放引擎
+status_channel = live_stream.StatusChannel() # 向浏览器推送发布状态
+
+# 运行时指标，由/metrics导出
+metrics.gauge('thp_replay_running', '是否正在回放数据文件',
+              func=lambda: int(current_engine is not None and not current_engine.status.get('complete')))
+metrics.gauge('thp_replay_inflight', '回放中已发布但尚未确认的消息数',
+              func=lambda: current_engine.status.get('inflight', 0) if current_engine is not None else 0)
+metrics.gauge('thp_replay_throughput', '回放的发布速率(条/秒)',
+              func=lambda: current_engine.status.get('throughput', 0) if current_engine is not None else 0)
+
+
+def init():
+    """创建MQTT客户端和发件箱，并注册发件箱的指标，只执行一次"""
+    global mqtt_client
+    with _init_lock:
+        if mqtt_client is not None:
+            return mqtt_client
+        client = MQTTClient(product_key, device_name, device_secret, broker_address, broker_port, outbox_path=outbox_path)
+        metrics.gauge('thp_outbox_depth', '发件箱中等待发出的消息数', func=lambda: len(client.outbox))
+        metrics.gauge('thp_outbox_oldest_age_seconds', '发件箱中最早一条消息的等待时间', func=lambda: client.outbox.oldest_age())
+        metrics.gauge('thp_outbox_drain_rate', '发件箱最近一次发出的速率(条/秒)', func=lambda: client.outbox.drain_rate)
+        mqtt_client = client
+        return mqtt_client
 
 # 读取public_file中的数据，并按照第一列的数据从小到大排序生成信文档，排序完成后写回文件
+# 文件已有序(或标记文件显示未修改过)时不重写，大文件使用外部归并排序
 def sort_data(publish_file):
-    with open(publish_file, 'r') as file:
-        reader = csv.reader(file)
-        data = list(reader)
-        data.sort(key=lambda x: int(x[0]))
-    with open(publish_file, 'w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerows(data)
+    return csv_sort.ensure_sorted(publish_file)
 
 # 读取并发布数据的后台线程
-def read_and_publish_data(topic, publish_file):
-    global publish_status, stop_publishing
+def read_and_publish_data(topic, publish_file, engine):
+    global stop_publishing
     try:
-        # ... 发布数据的代码 ...
-        # 确保更新 publish_status['count'] 和 publish_status['complete'] ...
         sort_data(publish_file) # 排序数据
-        with open(publish_file, 'r') as file:
-            reader = csv.reader(file)
-            for row in reader:
-                if stop_publishing:
-                    break
-                if len(row) == 4:
-                    # 从行中提取数据并构建属性字典
-                    prop_data = {
-                        "DetectTime": str(int(row[0])),  # 假设 CSV 文件中的时间戳已经是毫秒格式
-                        "CurrentTemperature": float(row[1]),
-                        "CurrentHumidity": float(row[2]),
-                        "CurrentPressure": int(row[3])
-                    }
-                    # 构造上报数据结构
-                    payload = {
-                        "id": "123",
-                        "version": "1.0",
-                        "params": prop_data,
-                        "method": "thing.event.property.post"
-                    }
-                    # 上报属性
-                    rc, request_id = mqtt_client.publish(topic, payload)
-                    publish_status['count'] += 1
-                    if rc == 0:
-                        print("已发布", publish_status['count'], "条记录。")
-                    else:
-                        print("属性发布失败, rc=", rc)
-                        publish_status['error'] = "第 " + str(publish_status['count']) + " 条发布失败, rc=" + str(rc)
-                        publish_status['complete'] = True
-                    time.sleep(1)  # 防止发送过快，根据平台限制可能需要调整
-            print("数据发布完成。发布的记录总数:", publish_status['count'])
+        if not stop_publishing:
+            engine.run()
     except Exception as e:
-        publish_status['error'] = str(e)
+        engine.status['error'] = str(e)
     finally:
-        publish_status['complete'] = True
+        engine.status['complete'] = True
         stop_publishing = False    # 重置停止标志
+        status_channel.publish(engine.status, force=True)
+
+# 从请求中解析回放参数，JSON和表单两种形式都支持；参数无效时抛出ValueError
+def parse_replay_options(req):
+    data = req.get_json(silent=True)
+    if data is None:
+        data = req.form
+    elif not isinstance(data, dict):
+        raise ValueError("请求体必须是JSON对象")
+    try:
+        mode = data.get('mode') or replay_engine.MODE_RATE
+        rate = float(data.get('rate') or replay_engine.DEFAULT_RATE)
+        speedup = float(data.get('speedup') or replay_engine.DEFAULT_SPEEDUP)
+        window = float(data.get('window') or replay_engine.DEFAULT_WINDOW)
+        qos = int(data.get('qos') or replay_engine.DEFAULT_QOS)
+    except TypeError as e:
+        raise ValueError(str(e))
+    # NaN和无穷大能通过"<= 0"的检查，NaN的速率会变成不限速回放
+    for name, value in (('rate', rate), ('speedup', speedup), ('window', window)):
+        if not (math.isfinite(value) and value > 0):
+            raise ValueError("%s必须是大于0的有限数" % name)
+    return mode, rate, speedup, int(window), qos
+
+# 处理请求前创建MQTT客户端(只在第一次时创建)
+@app.before_request
+def ensure_initialized():
+    init()
 
 @app.route('/')
 def index():
@@ -138,22 +160,46 @@ def publishRandom():
 def start_publish():
     if not mqtt_client.is_connected():
         return jsonify({'timestamp': str(datetime.datetime.now()), 'status': 'error', 'message': '尚未连接到MQTT服务器，请先手动连接。'})
-    global publish_status,stop_publishing
+    global publish_status,stop_publishing,current_engine
+    status = {'count': 0, 'complete': False, 'error': None}
+    try:
+        mode, rate, speedup, window, qos = parse_replay_options(request)
+        engine = replay_engine.ReplayEngine(mqtt_client, mqtt_topic_post, publish_file, status,
+                                            mode=mode, rate=rate, speedup=speedup, window=window, qos=qos,
+                                            on_progress=status_channel.publish)
+    except ValueError as e:
+        return jsonify({'timestamp': str(datetime.datetime.now()), 'status': 'error', 'message': '发布参数错误: ' + str(e)})
     stop_publishing = False  # 确保停止标志为False，以便开始新的发布流程
-    publish_status = {'count': 0, 'complete': False, 'error': None}
-    thread = threading.Thread(target=read_and_publish_data, args=(mqtt_topic_post, publish_file))
+    publish_status = status
+    current_engine = engine
+    status_channel.publish(status, force=True)
+    thread = threading.Thread(target=read_and_publish_data, args=(mqtt_topic_post, publish_file, engine))
     thread.start()
-    return jsonify({'timestamp': str(datetime.datetime.now()), 'status': 'started', 'message': '数据发布已开始。'})
+    return jsonify({'timestamp': str(datetime.datetime.now()), 'status': 'started', 'mode': mode, 'message': '数据发布已开始，模式: ' + mode + '。'})
 
 @app.route('/publishStatus', methods=['GET'])
 def get_publish_status():
     global publish_status
-    return jsonify(publish_status)
+    return jsonify(dict(publish_status, outbox=mqtt_client.outbox_stats()))
+
+#推送发布状态的SSE接口，状态变化时推送最新状态，代替每秒轮询/publishStatus
+@app.route('/publishStream', methods=['GET'])
+def publish_stream():
+    version = live_stream.resume_id(request, 'version')
+    return Response(status_channel.stream(version), mimetype='text/event-stream', headers=live_stream.sse_headers())
+
+#Prometheus格式的运行时指标；每次请求时发送一次往返时间探测，结果在下次请求时体现
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    mqtt_client.probe_rtt()
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route('/stopPublish', methods=['POST'])
 def stop_publish():
   global stop_publishing
   stop_publishing = True # 设置停止标志为真
+  if current_engine is not None:
+      current_engine.stop()
   return jsonify({'message': '正在停止发布进程...'})
 
 if __name__ == '__main__':
@@ -162,5 +208,7 @@ if __name__ == '__main__':
     os.environ['FLASK_ENV'] = 'development'
     import warnings
     warnings.filterwarnings("ignore", message=".*development server.*")
-    
+
+    log_config.configure()
+    init()
     app.run(debug=True, port=5000, use_reloader=False)
@@ -1,11 +1,12 @@
-# main.py
+# publish_module.py
+# Function: 通过linkkit把THP数据上报到物联网平台的命令行程序
+# 导入时不执行任何操作，python publish_module.py运行时依次: 生成发布数据文件、连接物联网平台、进入命令循环。
+# linkkit和data.py(pandas)只在用到时才导入。
 import paho.mqtt.client as mqtt
 import json
-from datetime import datetime
 import csv
 import time
 import sys
-from linkkit import linkkit
 import os
 import random
 
@@ -24,44 +25,19 @@ mqtt_port = 1883  # MQTT代理服务器的端口
 mqtt_topic_post = f'/sys/{product_key}/{device_name}/thing/event/property/post'  # 用于发布消息的主题
 mqtt_topic_set = f'/sys/{product_key}/{device_name}/thing/service/property/set'  # 用于发布消息的主题
 
-# Read the input file and process the data
-with open(input_file, 'r') as file:
-    reader = csv.reader(file)
-    next(reader, None)  # Skip the header
-    processed_rows = []
-    
-    for row in reader:
-        if len(row) > 0:
-            # 注意这里的时间格式更改为 '%Y-%m-%dT%H:%M:%S' 以匹配您文件中的时间戳格式
-            try:
-                timestamp = datetime.strptime(row[0], "%Y-%m-%dT%H:%M:%S").timestamp() * 1000
-                processed_row = [str(int(timestamp))] + [col for col in row[1:] if col.strip() != ""]
-                processed_rows.append(processed_row)
-            except ValueError as e:
-                print(f"Error parsing date for row: {row[0]}, Error: {str(e)}")
-                continue
-
-print("读取完成")
-
-# Write the processed data to the output file
-with open(output_file, 'w', newline='') as file:
-    writer = csv.writer(file)
-    writer.writerows(processed_rows)
+# 合并原始数据并生成发布数据文件(见data.py)，返回合并后的表
+def prepare_data():
+    import data
+    merged_frame = data.load()
+    data.write_merged_csv(merged_frame, input_file)
+    data.write_publish_csv(merged_frame, output_file)
     print("写入完成")
+    return merged_frame
 
 
-# 一机一密认证
-lk = linkkit.LinkKit(
-    host_name="cn-shanghai",
-    product_key=product_key,
-    device_name=device_name,
-    device_secret=device_secret
-)
-
-# 从云端控制台下载物模型文件，该文件需要集成到应用工程中
-lk.thing_setup("tsl.json")
-
+lk = None # linkkit实例，由create_linkkit创建
 connected = False # 增加一个全局变量来跟踪连接状态
+
 # 连接到物联网平台后的回调，成功连接session_flag为0
 def on_connect(session_flag, rc, userdata):
     global connected
@@ -96,20 +72,35 @@ def on_message(topic, payload, qos, userdata):
     print("on_message topic:%s,payload:%s,qos:%d,userdata:" % (topic, payload, qos))
     pass
 
-# 当出现网络波动时，程序自动循环调用连接，显示效果为两个回调函数一直调用
-lk.on_connect = on_connect
-lk.on_disconnect = on_disconnect
+# 一机一密认证，创建linkkit实例并开始连接
+def create_linkkit():
+    global lk
+    from linkkit import linkkit
+    lk = linkkit.LinkKit(
+        host_name="cn-shanghai",
+        product_key=product_key,
+        device_name=device_name,
+        device_secret=device_secret
+    )
 
-lk.on_subscribe = on_subscribe # 订阅主题成功后的回调
-lk.on_unsubscribe = on_unsubscribe # 取消订阅主题成功后的回调
+    # 从云端控制台下载物模型文件，该文件需要集成到应用工程中
+    lk.thing_setup("tsl.json")
 
-lk.on_publish = on_publish # 发布消息成功后的回调
-lk.on_message = on_message # 收到消息后的回调
+    # 当出现网络波动时，程序自动循环调用连接，显示效果为两个回调函数一直调用
+    lk.on_connect = on_connect
+    lk.on_disconnect = on_disconnect
 
-lk.connect_async() # 异步连接
-lk.start_worker_loop() # 开启循环
+    lk.on_subscribe = on_subscribe # 订阅主题成功后的回调
+    lk.on_unsubscribe = on_unsubscribe # 取消订阅主题成功后的回调
 
-print("linkkit初始化成功")
+    lk.on_publish = on_publish # 发布消息成功后的回调
+    lk.on_message = on_message # 收到消息后的回调
+
+    lk.connect_async() # 异步连接
+    lk.start_worker_loop() # 开启循环
+
+    print("linkkit初始化成功")
+    return lk
 
 # 假设有一个函数可以获取当前的属性值
 def get_current_property_values():
@@ -183,107 +174,107 @@ def read_and_post_data(publish_file, linkkit_instance):
         print("数据发布完成。已发布记录总数:", count)
 
 # 增加while循环，保证物联网平台是连接上之后再开始通信的
-while True:
-    try: 
-        msg = input() # 输入任意字符，开始通信
-    except KeyboardInterrupt:
-        sys.exit() # 退出程序
-    if not connected:
-        print("正在等待连接...")
-        time.sleep(1) # 等待一段时间让连接尝试完成
-        continue # 跳过本次循环迭代
-    else:
-        if msg == "1":
-            lk.disconnect() # 断开连接
-        elif msg == "2":
-            lk.connect_async() # 重新连接
-        elif msg == "3": # 输入为3时，订阅post这个主题，每个主题只需要订阅一次，会在物联网平台的设备topic中显示
-            rc, mid = lk.subscribe_topic(mqtt_topic_post) # 订阅主题
-            if rc == 0:
-                print("订阅成功, 主题=%s" % mqtt_topic_post)
-            else:
-                print("订阅失败, rc=%d" % rc)
-        elif msg == "4": # 输入为4时，取消订阅post这个主题
-            rc, mid = lk.unsubscribe_topic(mqtt_topic_post)
-            if rc == 0:
-                print("取消订阅成功, 主题=%s" % mqtt_topic_post)
-            else:
-                print("取消订阅失败, rc=%d" % rc)
-            '''elif msg == "5": # 输入为5时，发布消息到receier这个主题
-            rc, mid = lk.publish_topic(lk.to_full_topic("user/receiver"), "hello world")
-            if rc == 0:
-                print("publish success, topic=%s" % lk.to_full_topic("user/receiver"))
-            else:
-                print("publish failed, rc=%d" % rc)'''
-        elif msg == "6": # 输入为6时，同时订阅多个topic
-            rc, mid = lk.subscribe_topic([(mqtt_topic_post, 1),
-                                          (mqtt_topic_set, 1),])
-            if rc == 0:
-                print("订阅多个主题成功:%r, mid:%r" % (rc, mid))
-            else:
-                print("订阅失败, rc=%d" % rc)
-        elif msg == "7": # 输入为7时，取消订阅多个topic
-            rc, mid = lk.unsubscribe_topic([mqtt_topic_post,
-                                            mqtt_topic_set])
-            if rc == 0:
-                print("取消订阅多个主题成功:%r, mid:%r" % (rc, mid))
-            else:
-                print("取消订阅失败, rc=%d" % rc)
-        elif msg == "8": # RRPC请求
-            lk.on_message = on_message # 收到消息后的回调
-        elif msg == "11": # 属性上报
-            # 属性上报
-            '''
-            prop_data = {
-                "CurrentTemperature":25.5,
-                "CurrentHumidity":60.3,
-                "CurrentPressure":1013,
-                "DetectTime":int(round(time.time() * 1000))
-            }'''
-            # 获取当前的属性值
-            property_values = get_current_property_values()
-            # 准备上报的JSON数据
-            payload = json.dumps(property_values)
-            print(payload)  # 打印包含当前时间戳的属性值
-
-            rc, request_id = lk.thing_post_property(payload)
-            if rc == 0:
-                print("设备属性上报成功:%r, 请求ID:%r" % (rc, request_id))
-            else:
-                print("设备属性上报失败, rc=%d" % rc)
-        elif msg == "12": # 属性上报
-            # 上报随机属性
-            prop_data = {
-                "CurrentTemperature": random.randint(-10.0, 40.0),
-                "CurrentHumidity": random.randint(0.0, 100.0),
-                "CurrentPressure": random.randint(900, 1100),
-                "DetectTime": int(round(time.time() * 1000))
-            }
-            # 构造上报数据结构
-            payload = {
-                "id": "123",
-                "version": "1.0",
-                "params": prop_data,
-                "method": "thing.event.property.post"
-            }
-            # 上报属性
-            rc, request_id = lk.publish_topic(mqtt_topic_post, json.dumps(payload))
-            if rc == 0:
-                print("设备属性上报成功:%r, 请求ID:%r" % (rc, request_id))
-            else:
-                print("设备属性上报失败, rc=%d" % rc)
-        elif msg == "13": # 属性批量上报
-            # 属性上报
-            read_and_post_data(publish_file, lk)
-        elif msg == "98": # 打印topic列表
-            ret = lk.dump_user_topics()
-            print("用户主题列表:%r" % ret)
-        elif msg == "99": # 退出程序
-            lk.destruct()
-            print("已销毁")
+def command_loop(lk):
+    while True:
+        try: 
+            msg = input() # 输入任意字符，开始通信
+        except KeyboardInterrupt:
+            sys.exit() # 退出程序
+        if not connected:
+            print("正在等待连接...")
+            time.sleep(1) # 等待一段时间让连接尝试完成
+            continue # 跳过本次循环迭代
         else:
-            sys.exit()
-
+            if msg == "1":
+                lk.disconnect() # 断开连接
+            elif msg == "2":
+                lk.connect_async() # 重新连接
+            elif msg == "3": # 输入为3时，订阅post这个主题，每个主题只需要订阅一次，会在物联网平台的设备topic中显示
+                rc, mid = lk.subscribe_topic(mqtt_topic_post) # 订阅主题
+                if rc == 0:
+                    print("订阅成功, 主题=%s" % mqtt_topic_post)
+                else:
+                    print("订阅失败, rc=%d" % rc)
+            elif msg == "4": # 输入为4时，取消订阅post这个主题
+                rc, mid = lk.unsubscribe_topic(mqtt_topic_post)
+                if rc == 0:
+                    print("取消订阅成功, 主题=%s" % mqtt_topic_post)
+                else:
+                    print("取消订阅失败, rc=%d" % rc)
+                '''elif msg == "5": # 输入为5时，发布消息到receier这个主题
+                rc, mid = lk.publish_topic(lk.to_full_topic("user/receiver"), "hello world")
+                if rc == 0:
+                    print("publish success, topic=%s" % lk.to_full_topic("user/receiver"))
+                else:
+                    print("publish failed, rc=%d" % rc)'''
+            elif msg == "6": # 输入为6时，同时订阅多个topic
+                rc, mid = lk.subscribe_topic([(mqtt_topic_post, 1),
+                                              (mqtt_topic_set, 1),])
+                if rc == 0:
+                    print("订阅多个主题成功:%r, mid:%r" % (rc, mid))
+                else:
+                    print("订阅失败, rc=%d" % rc)
+            elif msg == "7": # 输入为7时，取消订阅多个topic
+                rc, mid = lk.unsubscribe_topic([mqtt_topic_post,
+                                                mqtt_topic_set])
+                if rc == 0:
+                    print("取消订阅多个主题成功:%r, mid:%r" % (rc, mid))
+                else:
+                    print("取消订阅失败, rc=%d" % rc)
+            elif msg == "8": # RRPC请求
+                lk.on_message = on_message # 收到消息后的回调
+            elif msg == "11": # 属性上报
+                # 属性上报
+                '''
+                prop_data = {
+                    "CurrentTemperature":25.5,
+                    "CurrentHumidity":60.3,
+                    "CurrentPressure":1013,
+                    "DetectTime":int(round(time.time() * 1000))
+                }'''
+                # 获取当前的属性值
+                property_values = get_current_property_values()
+                # 准备上报的JSON数据
+                payload = json.dumps(property_values)
+                print(payload)  # 打印包含当前时间戳的属性值
+
+                rc, request_id = lk.thing_post_property(payload)
+                if rc == 0:
+                    print("设备属性上报成功:%r, 请求ID:%r" % (rc, request_id))
+                else:
+                    print("设备属性上报失败, rc=%d" % rc)
+            elif msg == "12": # 属性上报
+                # 上报随机属性
+                prop_data = {
+                    "CurrentTemperature": random.randint(-10.0, 40.0),
+                    "CurrentHumidity": random.randint(0.0, 100.0),
+                    "CurrentPressure": random.randint(900, 1100),
+                    "DetectTime": int(round(time.time() * 1000))
+                }
+                # 构造上报数据结构
+                payload = {
+                    "id": "123",
+                    "version": "1.0",
+                    "params": prop_data,
+                    "method": "thing.event.property.post"
+                }
+                # 上报属性
+                rc, request_id = lk.publish_topic(mqtt_topic_post, json.dumps(payload))
+                if rc == 0:
+                    print("设备属性上报成功:%r, 请求ID:%r" % (rc, request_id))
+                else:
+                    print("设备属性上报失败, rc=%d" % rc)
+            elif msg == "13": # 属性批量上报
+                # 属性上报
+                read_and_post_data(publish_file, lk)
+            elif msg == "98": # 打印topic列表
+                ret = lk.dump_user_topics()
+                print("用户主题列表:%r" % ret)
+            elif msg == "99": # 退出程序
+                lk.destruct()
+                print("已销毁")
+            else:
+                sys.exit()
 
 
 # MQTT配置参数
@@ -291,7 +282,7 @@ MQTT_BROKER = '******.******'  # MQTT代理服务器的域名或IP地址
 MQTT_PORT = 1883                  # MQTT代理服务器的端口
 MQTT_TOPIC = '/sys/******/THP-DataSystems/thing/event/property/post'        # 用于发布消息的主题
 
-def on_connect(client, userdata, flags, rc):
+def on_mqtt_connect(client, userdata, flags, rc):
     """
     连接到MQTT代理服务器的回调函数
 
@@ -306,88 +297,44 @@ def on_connect(client, userdata, flags, rc):
     """
     print(f"Connected with result code {rc}")
 
-# 将时间字符串转换为时间戳
-def time_to_timestamp(time_str):
-    dt_obj = datetime.strptime(time_str, '%Y-%m-%dT%H:%M:%S')
-    return int(dt_obj.timestamp()) * 1000
-
-# 读取数据文件并解析为字典的函数
-def read_data(file_path):
-    with open(file_path, 'r') as file:
-        # 用于存储所有解析后的数据的字典
-        combined_data = {}
-        # 逐行读取和解析JSON
-        for line in file:
-            # 解析当前行的JSON数据
-            line_data = json.loads(line)
-            # 将解析后的字典合并到总字典中
-            combined_data.update(line_data)
-    return combined_data
-
-# 合并温度、湿度和气压数据的函数
-def merge_data(temperature_data, humidity_data, pressure_data):
-    merged_data = {}
-    for time_str in humidity_data:
-        merged_data[time_str] = {
-            "temperature": temperature_data.get(time_str, None),
-            "humidity": humidity_data.get(time_str, None),
-            "pressure": pressure_data.get(time_str, None)
-        }
-    return merged_data
-
-# 读取数据
-temperature_data = read_data('THPData/temperature.txt')
-humidity_data = read_data('THPData/humidity.txt')
-pressure_data = read_data('THPData/pressure.txt')
-
-# 合并数据
-merged_dict = merge_data(temperature_data, humidity_data, pressure_data)
-
-# 写入合并后的数据到表格
-def write_data_to_csv(data, file_path):
-    with open(file_path, 'w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(['time', 'temperature', 'humidity', 'pressure'])
-        for time_str, values in data.items():
-            temperature = values.get('temperature', '')
-            humidity = values.get('humidity', '')
-            pressure = values.get('pressure', '')
-            writer.writerow([time_str, temperature, humidity, pressure])
-
-# 写入数据到表格
-write_data_to_csv(merged_dict, 'THPData/merged_data.csv')
-
-# 转换时间并准备数据用于发布
-publish_data = []
-for time_str, data in merged_dict.items():
-    if all(value is not None for value in data.values()):
-        timestamp = time_to_timestamp(time_str)
-        data['timestamp'] = timestamp
-        publish_data.append(data)
-
-# 连接到MQTT代理并发送数据
-client = mqtt.Client()
-client.username_pw_set('THP-DataSystems&******', '******')  # 替换为你的用户名和密码
-client.on_connect = on_connect
-
-# 连接到MQTT代理
-client.connect(MQTT_BROKER, MQTT_PORT, 60)
-# 开始网络循环
-client.loop_start()
-# 给予一点时间来完成连接
-time.sleep(1)  # 可能需要更长时间
-
-
-# 发布合并后的数据
-for data in publish_data:
-    client.publish(MQTT_TOPIC, json.dumps(data))
-
-def on_publish(client, userdata, mid):
+def on_mqtt_publish(client, userdata, mid):
     print(f"Message {mid} published successfully.")
 
-# 设置回调函数
-client.on_publish = on_publish
+# 直接通过MQTT代理发布合并后三项数据都有的行
+def publish_merged_data(merged_frame):
+    import data
+    publish_data = data.complete_rows(merged_frame).to_dict('records')
+
+    # 连接到MQTT代理并发送数据
+    client = mqtt.Client()
+    client.username_pw_set('THP-DataSystems&******', '******')  # 替换为你的用户名和密码
+    client.on_connect = on_mqtt_connect
+
+    # 连接到MQTT代理
+    client.connect(MQTT_BROKER, MQTT_PORT, 60)
+    # 开始网络循环
+    client.loop_start()
+    # 给予一点时间来完成连接
+    time.sleep(1)  # 可能需要更长时间
+
+
+    # 发布合并后的数据
+    for record in publish_data:
+        client.publish(MQTT_TOPIC, json.dumps(record))
+
+    # 设置回调函数
+    client.on_publish = on_mqtt_publish
+
+    # 在发送完所有数据之后，停止网络循环并断开连接
+    client.loop_stop()
+    client.disconnect()
+
+
+def main():
+    merged_frame = prepare_data()
+    command_loop(create_linkkit())
+    publish_merged_data(merged_frame)
+
 
-# 在发送完所有数据之后，停止网络循环并断开连接
-client.loop_stop()
-client.disconnect()
+if __name__ == '__main__':
+    main()
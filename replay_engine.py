@@ -0,0 +1,159 @@
+# replay_engine.py
+# Function: 按设定的模式回放CSV数据文件并通过MQTT发布
+# 支持三种模式:
+#   rate     - 按目标速率(条/秒)匀速发布
+#   max      - 不做任何等待，尽可能快地发布
+#   realtime - 按原始DetectTime的时间间隔发布，可设置加速倍数
+import csv
+import math
+import threading
+import time
+
+import log_config
+from MQTTClient import ERR_QUEUE_FULL
+
+logger = log_config.get_logger('replay_engine')
+
+MODE_RATE = 'rate'
+MODE_MAX = 'max'
+MODE_REALTIME = 'realtime'
+REPLAY_MODES = (MODE_RATE, MODE_MAX, MODE_REALTIME)
+
+DEFAULT_RATE = 1.0        # 默认每秒发布1条，与原来的time.sleep(1)一致
+DEFAULT_SPEEDUP = 1.0     # realtime模式下的默认加速倍数
+DEFAULT_WINDOW = 100      # 默认最多允许100条尚未确认的在途消息
+DEFAULT_QOS = 0
+PROGRESS_EVERY = 1000     # 每发布多少条输出一次进度日志
+STATS_INTERVAL = 0.2      # 回放期间最多每隔多少秒更新一次状态并调用on_progress
+
+# 上报数据的模板，字段顺序与原来的payload字典一致，避免每行重新构造嵌套字典再json.dumps
+PAYLOAD_TEMPLATE = ('{"id": "123", "version": "1.0", "params": {"DetectTime": "%d", '
+                    '"CurrentTemperature": %r, "CurrentHumidity": %r, "CurrentPressure": %d}, '
+                    '"method": "thing.event.property.post"}')
+
+
+def build_payload(row):
+    """把CSV中的一行(时间戳,温度,湿度,气压)转换为上报的JSON字符串"""
+    return PAYLOAD_TEMPLATE % (int(row[0]), float(row[1]), float(row[2]), int(row[3]))
+
+
+class ReplayEngine:
+    def __init__(self, mqtt_client, topic, publish_file, status, mode=MODE_RATE,
+                 rate=DEFAULT_RATE, speedup=DEFAULT_SPEEDUP, window=DEFAULT_WINDOW, qos=DEFAULT_QOS, on_progress=None):
+        if mode not in REPLAY_MODES:
+            raise ValueError("未知的发布模式: " + str(mode))
+        if mode == MODE_RATE and not (math.isfinite(rate) and rate > 0):
+            raise ValueError("发布速率必须大于0")
+        if mode == MODE_REALTIME and not (math.isfinite(speedup) and speedup > 0):
+            raise ValueError("加速倍数必须大于0")
+        if window < 1:
+            raise ValueError("在途窗口必须至少为1")
+        if qos not in (0, 1, 2):
+            raise ValueError("QoS必须为0、1或2")
+        self.mqtt_client = mqtt_client
+        self.topic = topic
+        self.publish_file = publish_file
+        self.status = status  # 与publish_app共享的状态字典
+        self.mode = mode
+        self.rate = float(rate)
+        self.speedup = float(speedup)
+        self.window = int(window)
+        self.qos = int(qos)
+        self.on_progress = on_progress  # 状态更新后的回调，参数为状态字典
+
+        self._stop = threading.Event()
+        self._clock = time.perf_counter
+        self._delivered_base = 0  # 开始回放时客户端已送达的消息数
+        self._stats_at = None     # 上次更新状态的时间
+
+        self.status.update({
+            'mode': self.mode,
+            'rate': self.rate if self.mode == MODE_RATE else None,
+            'speedup': self.speedup if self.mode == MODE_REALTIME else None,
+            'window': self.window,
+            'qos': self.qos,
+            'delivered': 0,
+            'inflight': 0,
+            'elapsed': 0.0,
+            'throughput': 0.0,
+        })
+
+    def stop(self):
+        self._stop.set()
+
+    def _wait_window(self):
+        # 在途消息达到窗口上限时等待确认(由MQTTClient的在途窗口提供背压)，连接断开时返回
+        while not self.mqtt_client.wait_for_window(0.1):
+            if self._stop.is_set() or not self.mqtt_client.is_connected():
+                return
+
+    def _update_stats(self, start, force=False):
+        # 每条消息都会调用，距上次更新不足STATS_INTERVAL时跳过，结束时force强制更新
+        now = self._clock()
+        if not force and self._stats_at is not None and now - self._stats_at < STATS_INTERVAL:
+            return
+        self._stats_at = now
+        elapsed = now - start
+        self.status['elapsed'] = round(elapsed, 3)
+        self.status['inflight'] = self.mqtt_client.inflight
+        self.status['delivered'] = self.mqtt_client.delivered - self._delivered_base
+        outbox = self.mqtt_client.outbox_stats()
+        if outbox is not None:
+            self.status['outbox'] = outbox
+        if elapsed > 0:
+            self.status['throughput'] = round(self.status['count'] / elapsed, 2)
+        if self.on_progress is not None:
+            self.on_progress(self.status)
+
+    def run(self):
+        self.mqtt_client.set_max_inflight(self.window)
+        self._delivered_base = self.mqtt_client.delivered
+        start = self._clock()
+        first_time = None
+        try:
+            with open(self.publish_file, 'r') as file:
+                for row in csv.reader(file):
+                    if self._stop.is_set():
+                        break
+                    if len(row) != 4:
+                        continue
+                    payload = build_payload(row)
+
+                    # 计算这一条的计划发送时间
+                    if self.mode == MODE_RATE:
+                        due = start + self.status['count'] / self.rate
+                    elif self.mode == MODE_REALTIME:
+                        detect_time = int(row[0])
+                        if first_time is None:
+                            first_time = detect_time
+                        due = start + (detect_time - first_time) / 1000.0 / self.speedup
+                    else:
+                        due = None
+                    if due is not None:
+                        delay = due - self._clock()
+                        if delay > 0 and self._stop.wait(delay):
+                            break
+
+                    self._wait_window()
+                    if self._stop.is_set():
+                        break
+                    rc, mid = self.mqtt_client.publish(self.topic, payload, qos=self.qos)
+                    # 发件箱已满时等待其发出后重试
+                    while rc == ERR_QUEUE_FULL and not self._stop.wait(0.1):
+                        rc, mid = self.mqtt_client.publish(self.topic, payload, qos=self.qos)
+                    if rc == ERR_QUEUE_FULL:
+                        break  # 等待期间被停止
+                    if rc != 0:
+                        logger.warning("属性发布失败, rc=%s", rc)
+                        self.status['error'] = "第 " + str(self.status['count'] + 1) + " 条发布失败, rc=" + str(rc)
+                        break
+                    self.status['count'] += 1
+                    progress = self.status['count'] % PROGRESS_EVERY == 0
+                    self._update_stats(start, force=progress)
+                    if progress:
+                        logger.info("已发布%d条记录，吞吐量: %s条/秒", self.status['count'], self.status['throughput'])
+            # 结束前等待剩余的在途消息确认送达，使送达数和吞吐量统计准确
+            self.mqtt_client.wait_for_delivery(5.0)
+        finally:
+            self._update_stats(start, force=True)
+        logger.info("数据发布完成。发布的记录总数: %d，吞吐量: %s条/秒", self.status['count'], self.status['throughput'])
@@ -0,0 +1,95 @@
+# ring_buffer.py
+# Function: 固定容量的接收数据环形缓冲区
+# 每条数据按列存放在预分配的数组中，并分配一个单调递增的序号，
+# 读取方只需提供上次读到的序号(游标)，即可取回之后的新数据，不需要重新扫描全部数据
+import math
+import threading
+from array import array
+
+FIELDS = ('temperature', 'humidity', 'pressure')
+DEFAULT_CAPACITY = 10000
+
+_NAN = float('nan')
+
+
+def _to_float(value):
+    return _NAN if value is None or value == '' else float(value)
+
+
+class ReadingRingBuffer:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        if capacity < 1:
+            raise ValueError("环形缓冲区容量必须至少为1")
+        self.capacity = capacity
+        self._time = array('q', [0]) * capacity
+        self._values = {field: array('d', [_NAN]) * capacity for field in FIELDS}
+        self._next_seq = 1   # 下一条数据的序号，序号从1开始，游标0表示从头读取
+        self._start_seq = 1  # 缓冲区中最早一条数据的序号
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)  # 有新数据写入时唤醒等待的读取方
+
+    @property
+    def last_seq(self):
+        """最新一条数据的序号，尚未写入任何数据时为0"""
+        return self._next_seq - 1
+
+    @property
+    def first_seq(self):
+        """缓冲区中最早一条仍保留的数据的序号"""
+        return self._start_seq
+
+    def append(self, reading):
+        """写入一条数据，返回分配的序号；缓冲区满时覆盖最早的数据"""
+        with self._lock:
+            seq = self._next_seq
+            slot = seq % self.capacity
+            self._time[slot] = int(reading['time'])
+            for field in FIELDS:
+                self._values[field][slot] = _to_float(reading.get(field))
+            self._next_seq = seq + 1
+            if seq - self._start_seq >= self.capacity:
+                self._start_seq = seq - self.capacity + 1
+            self._cond.notify_all()
+            return seq
+
+    def _reading(self, slot):
+        reading = {}
+        for field in FIELDS:
+            value = self._values[field][slot]
+            if not math.isnan(value):
+                reading[field] = int(value) if field == 'pressure' else value
+        reading['time'] = self._time[slot]
+        return reading
+
+    def since(self, cursor, limit=None):
+        """返回序号大于cursor的数据(最多limit条)以及新的游标
+
+        如果游标落后太多，已被覆盖的数据无法取回，从最早仍保留的数据开始返回。
+        游标大于最新序号时(来自重启之前的服务端，序号已重新从1开始)，同样从最早仍保留的数据开始返回。
+        """
+        with self._lock:
+            if cursor >= self._next_seq:
+                cursor = self._start_seq - 1
+            first = max(cursor + 1, self._start_seq)
+            last = self._next_seq
+            if limit is not None:
+                last = min(last, first + limit)
+            readings = [self._reading(seq % self.capacity) for seq in range(first, last)]
+            return readings, max(cursor, last - 1)
+
+    def wait(self, cursor, timeout=None):
+        """等待序号大于cursor的数据出现，超时返回False；cursor大于最新序号时立即返回True"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._next_seq - 1 != cursor, timeout)
+
+    def clear(self):
+        """清空缓冲区，序号继续递增，已有的游标仍然有效"""
+        with self._lock:
+            self._start_seq = self._next_seq
+
+    def __len__(self):
+        return self._next_seq - self._start_seq
+
+    def __iter__(self):
+        readings, _ = self.since(0)
+        return iter(readings)
@@ -1,9 +1,10 @@
+# subscibeChoice.py
+# Function: 订阅数据的选择保存，以及把merged_data.csv转换为预测模型使用的tran_data.csv(月,日,时,三项数据)
+# 导入时不执行任何操作，转换通过python subscibeChoice.py或convert()进行；pandas只在转换时导入。
 import csv
 from datetime import datetime,timedelta
 import sys
 import json
-import pandas as pd
-import numpy as np
 
 class SubscribeChoice:
     Temperture=1
@@ -58,34 +59,26 @@ class Time:
         self.day=cst_datetime.day
         self.hour=cst_datetime.hour
 
-data = pd.read_csv('merged_data.csv', header=None)
-data = data.dropna(axis=0, how='any')
-data = np.array(data.iloc[1:,:])
-DataSet=[['Month', 'Day','Hour','Humidity', 'Temperture', 'Pressure']]
-time= data[:, 0]  # 时间
-num = data.shape[0]
-
-
 def time_to_timestamp(time_str):
     dt_obj = datetime.strptime(time_str, '%Y-%m-%dT%H:%M:%S')
     return int(dt_obj.timestamp()) * 1000
 
-for i in range(num):
-    items=time_to_timestamp(time[i])
-    timestamp=float(items)/1000
-    utc_datetime=datetime.utcfromtimestamp(timestamp)
-    cst_datetime=utc_datetime+timedelta(hours=8)
-    #print(cst_datetime)
-    year=cst_datetime.year
-    month=cst_datetime.month
-    day=cst_datetime.day
-    hour=cst_datetime.hour
-    DataSet.append([month,day,hour,data[i][1],data[i][2],data[i][3]])
+# 把merged_data.csv转换为tran_data.csv，返回转换的行数
+# 只保留三项数据都有的行；时间整体解析，月、日、时取原始数据中的北京时间，数值保持原样写出
+def convert(input_file='merged_data.csv', output_file='tran_data.csv'):
+    import pandas as pd
+    data = pd.read_csv(input_file, dtype=str, keep_default_na=False, na_values=[''])
+    data = data.dropna(axis=0, how='any')
+    stamps = pd.to_datetime(data.iloc[:, 0], format='%Y-%m-%dT%H:%M:%S')
+    DataSet = pd.DataFrame({'Month': stamps.dt.month, 'Day': stamps.dt.day, 'Hour': stamps.dt.hour,
+                            'Humidity': data.iloc[:, 1], 'Temperture': data.iloc[:, 2], 'Pressure': data.iloc[:, 3]})
+    DataSet.to_csv(output_file, index=False)
+    return len(DataSet)
 
 
-      
+def main():
+    print("已转换%d行" % convert())
 
-with open('tran_data.csv', 'w',newline='') as file:
-    writer = csv.writer(file)
-    writer.writerows(DataSet)
 
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,19 @@
 # subscribe_app.py
 # Description: Flask web app for subscribing to the IoT platform
 import csv
+import io
 import json
+import os
 
-from flask import Flask, render_template, request, flash, redirect, url_for, jsonify
+from flask import Flask, render_template, request, flash, redirect, url_for, jsonify, Response
 import datetime
 import subscribe_module as module
+import live_stream
+import log_config
+import metrics
+import topic_trie
 
+logger = log_config.get_logger('subscribe_app')
 app = Flask(__name__)
 app.secret_key = 'test_secret'
 product_key = "test_product"
@@ -15,19 +22,37 @@ device_secret = "test_secret"
 mqtt_topic_post = f'/sys/{product_key}/{device_name}/thing/event/property/post'  # 用于发布消息的主题
 mqtt_topic_set = f'/sys/{product_key}/{device_name}/thing/service/property/set'  # 用于发布消息的主题
 import global_var as gv
-filename = "out.csv"
+filename = module.out_file
+# 图表缓存在第一次请求/chart时创建；使用numpy的模块(ts_store、chart_cache等)也在用到时才导入
+chart_cache = None
+device_chart_caches = {}  # 设备名 -> 只缓存该设备分区的ChartCache
 
-# 在应用启动时自动连接到MQTT服务器
-try:
-    gv.global_var.user_initiated_disconnect = False
-    # 使用默认的ClientID
-    client_id = f"subscriber_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
-    module.connect_and_subscribe(client_id, "", "")
-    print("自动连接到MQTT服务器成功")
-except Exception as e:
-    print(f"自动连接到MQTT服务器失败: {e}")
-    import traceback
-    traceback.print_exc()
+
+def start():
+    """应用启动时的初始化: 配置日志、导入历史数据并自动连接到MQTT服务器
+
+    只在作为程序运行时调用，导入本模块(测试、基准测试、其他进程)时不会连接服务器。
+    """
+    log_config.configure()
+    module.init()
+    # 首次使用二进制存储时，把以前保存在out.csv中的数据导入存储
+    if len(module.store) == 0 and os.path.exists(filename):
+        logger.info("从%s导入历史数据: %d条", filename, module.store.import_csv(filename))
+
+    # 在应用启动时自动连接到MQTT服务器
+    try:
+        gv.global_var.user_initiated_disconnect = False
+        # 使用默认的ClientID(THP_CLIENT_ID或本机生成的ID)，重启后复用原来的持久会话
+        module.connect_and_subscribe("", "", "")
+        logger.info("自动连接到MQTT服务器成功")
+    except Exception as e:
+        logger.exception("自动连接到MQTT服务器失败: %s", e)
+
+
+# 处理请求前创建订阅端的存储和写入线程(只在第一次时创建)
+@app.before_request
+def ensure_initialized():
+    module.init()
 
 
 @app.route('/', methods=['GET', 'POST'])
@@ -38,10 +63,7 @@ def index():
         access_key_id = request.form.get('access_key_id', '')
         access_key_secret = request.form.get('access_secret', '')
         
-        # 如果没有提供ClientID，生成一个默认的
-        if not ClientID:
-            ClientID = f"subscriber_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
-            
+        # 没有提供ClientID时使用默认的ClientID(THP_CLIENT_ID或本机生成的ID)
         #尝试连接并订阅
         try:
             gv.global_var.user_initiated_disconnect = False
@@ -72,55 +94,130 @@ def disconnect():
     return redirect(url_for('index'))#路由到login界面
 
 #我们有唯一的一个post主题，而且连接后会马上订阅这个主题，所以不需要再写一个订阅post主题的接口
+#topic可以是页面上的字段名(temperature等)，也可以是MQTT主题过滤器(如/sys/+/THP-01/#)；
+#选择了主题过滤器后，只接收与其中任意一个匹配的主题的消息
 @app.route('/subTopic', methods=['POST'])
 def subTopic():
     # 获取前端传递的JSON数据
     data=request.get_json()
     topic = data.get('topic', '')
     checked = True if data.get("checked") == "1" else False
-    #将topic转为字符串形式，并且全部字母变成小写
-    topic = str(topic).lower()
+    #字段名全部字母变成小写，MQTT主题区分大小写，保持原样
+    import ts_store
+    topic = str(topic)
+    if topic.lower() in ts_store.FIELDS:
+        topic = topic.lower()
+    #主题过滤器在前缀树中查找，不需要遍历topic_list
+    is_field = topic in ts_store.FIELDS
+    listed = topic in gv.global_var.topic_list if is_field else topic in module.topic_filter
     if checked:
-        if topic not in gv.global_var.topic_list:
+        if not listed:
+            if not is_field:
+                try:
+                    module.add_topic_filter(topic)
+                except ValueError as e:
+                    return jsonify({'timestamp': str(datetime.datetime.now()), 'status': 'fail', 'message': str(e)})
             gv.global_var.topic_list.append(topic)
             return jsonify({'timestamp': str(datetime.datetime.now()), 'status': 'success', 'message': '主题列表: ' + module.format_topiclist(gv.global_var.topic_list)+ '.'})
     if checked==False:
-        if topic in gv.global_var.topic_list:
+        if listed:
             gv.global_var.topic_list.remove(topic)
+            if not is_field:
+                module.remove_topic_filter(topic)
             return jsonify({'timestamp': str(datetime.datetime.now()), 'status': 'success', 'message': '主题列表: ' + module.format_topiclist(gv.global_var.topic_list)+ '.'})
     return jsonify({'timestamp': str(datetime.datetime.now()), 'status': 'fail', 'message': '主题列表: ' + module.format_topiclist(gv.global_var.topic_list)+ '.'})
 
 #读取数组，将指定topic的数据以及相应的时间戳返回给前端
-#前端需要每隔1秒调用一次这个接口，以获取最新的数据
-#可以参考checkPublishStatus
+#前端每次请求时带上上次返回的cursor，只返回该序号之后的新数据
+#没有带cursor时使用服务端保存的默认游标，兼容旧的前端
+#带device时只读取该设备的缓冲区，游标是该缓冲区中的序号
 @app.route('/TopicData', methods=['GET'])
 def getTopicData():
-    formatted_ans =""
-    # 只处理前10条未打印的数据，避免性能问题
-    count = 0
-    for prop_data in gv.global_var.receive_data:
-        if count >= 10:
-            break
-        if(prop_data.get('printed', False)==False):
-            prop_data['printed'] = True
-            formatted_ans +=module.format_topicData(prop_data)
-            count += 1
-    return jsonify({'timestamp': str(datetime.datetime.now()), 'status': 'success', 'message': formatted_ans})
-
-
-#把数据存储到csv文件，并清空receive_data
+    cursor = request.args.get('cursor', type=int)
+    limit = request.args.get('limit', default=100, type=int)
+    device = request.args.get('device')
+    buffer = gv.global_var.receive_data
+    use_default = cursor is None and not device
+    if device:
+        buffer = module.device_buffer(device)
+        if buffer is None:
+            return jsonify({'timestamp': str(datetime.datetime.now()), 'status': 'fail',
+                            'message': '没有设备' + device + '的数据。', 'cursor': 0, 'count': 0})
+        cursor = cursor or 0
+    elif use_default:
+        cursor = gv.global_var.topic_cursor
+    readings, next_cursor = buffer.since(cursor, limit)
+    if use_default:
+        gv.global_var.topic_cursor = next_cursor
+    formatted_ans = "".join(module.format_topicData(prop_data) for prop_data in readings)
+    return jsonify({'timestamp': str(datetime.datetime.now()), 'status': 'success', 'message': formatted_ans,
+                    'cursor': next_cursor, 'count': len(readings)})
+
+
+#推送接收数据的SSE接口，浏览器通过EventSource连接，不再需要每秒轮询/TopicData
+#断线重连时浏览器会带上Last-Event-ID，从上次的序号继续推送
+#带device时只推送该设备的数据；带topic(MQTT主题过滤器，如/sys/+/THP-01/#)时只推送匹配的主题的数据
+@app.route('/stream', methods=['GET'])
+def streamTopicData():
+    topic_filter = request.args.get('topic')
+    if topic_filter:
+        try:
+            topic_trie.validate_filter(topic_filter)
+        except ValueError as e:
+            return jsonify({'timestamp': str(datetime.datetime.now()), 'status': 'fail', 'message': str(e)}), 400
+        generator = live_stream.TopicStream(module.router, topic_filter).stream(module.format_topicData)
+        return Response(generator, mimetype='text/event-stream', headers=live_stream.sse_headers())
+    buffer = gv.global_var.receive_data
+    device = request.args.get('device')
+    if device:
+        # 只为已经有数据的设备创建缓冲区，避免任意的设备名占用内存
+        buffer = module.device_buffer(device, create=module.store.partition(device) is not None)
+        if buffer is None:
+            return jsonify({'timestamp': str(datetime.datetime.now()), 'status': 'fail',
+                            'message': '没有设备' + device + '的数据。'}), 404
+    cursor = live_stream.resume_id(request)
+    if cursor is None:
+        cursor = buffer.last_seq  # 新连接只推送之后到达的数据
+    generator = live_stream.stream_readings(buffer, cursor, module.format_topicData)
+    return Response(generator, mimetype='text/event-stream', headers=live_stream.sse_headers())
+
+
+#把存储中的数据导出到csv文件，并清空receive_data
+#接收到的数据已经自动保存到存储中，这里只需要等待缓冲写完后导出
 @app.route('/saveData', methods=['GET', 'POST'])
 def saveData():
-    with open(filename, 'a', newline='') as file:#采用追加模式打开文件
-        writer = csv.writer(file)
-        # 通过writer，往写入数据
-        for prop_data in gv.global_var.receive_data:
-            #在这一行中，第一列是时间，第二列是温度，第三列是湿度，第四列是气压
-            row = [prop_data.get('time', ''), prop_data.get('temperature', ''), prop_data.get('humidity', ''),
-                   prop_data.get('pressure', '')]
-            writer.writerow(row)
+    module.out_writer.flush()
+    count = module.store.export_csv(filename)
     gv.global_var.receive_data.clear()
-    return jsonify({'timestamp': str(datetime.datetime.now()), 'status': 'success', 'message': '数据保存成功。'})
+    for buffer in list(gv.global_var.device_data.values()):
+        buffer.clear()
+    return jsonify({'timestamp': str(datetime.datetime.now()), 'status': 'success', 'message': '数据保存成功，已导出 ' + str(count) + ' 条数据到 ' + filename + '。'})
+
+#查看后台写入线程的状态：队列深度、丢弃行数、批量写入耗时
+@app.route('/writerStatus', methods=['GET'])
+def getWriterStatus():
+    return jsonify(module.out_writer.stats())
+
+#查看消息解析的统计：使用的JSON库、解析条数、错误数、平均解析耗时
+@app.route('/decoderStatus', methods=['GET'])
+def getDecoderStatus():
+    return jsonify(module.decoder.stats())
+
+#列出有数据的设备，以及每个设备保存的行数和缓冲区中的条数
+@app.route('/devices', methods=['GET'])
+def getDevices():
+    module.out_writer.flush()
+    devices = [{'device': device, 'rows': rows,
+                'buffered': len(gv.global_var.device_data.get(device, ()))}
+               for device, rows in module.store.devices().items()]
+    return jsonify({'timestamp': str(datetime.datetime.now()), 'status': 'success',
+                    'message': '共有' + str(len(devices)) + '个设备。', 'devices': devices})
+
+#Prometheus格式的运行时指标；每次请求时发送一次往返时间探测，结果在下次请求时体现
+@app.route('/metrics', methods=['GET'])
+def getMetrics():
+    module.probe_rtt()
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route('/getChart', methods=['GET'])
 def getChart():
@@ -129,45 +226,83 @@ def getChart():
     variable = request.args.get('variable', default='temperature', type=str)
     return render_template('chart.html', variable=variable)
 
+# /chart默认返回的最大点数，以及允许请求的上限
+DEFAULT_MAX_POINTS = 2000
+MAX_POINTS_LIMIT = 20000
+
+# 时间参数既可以是毫秒时间戳，也可以是"2014-02-13T06:20:00"格式的字符串
+def parse_time_arg(value):
+    if value is None or value == "":
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        return module.time_to_timestamp(value)
+
+# 返回设备的图表缓存，device为空时返回所有设备的缓存；设备没有数据时返回None
+def get_chart_cache(device):
+    global chart_cache
+    from chart_cache import ChartCache
+    module.init()
+    if not device:
+        if chart_cache is None:
+            chart_cache = ChartCache(module.store)
+        return chart_cache
+    cache = device_chart_caches.get(device)
+    if cache is None and module.store.partition(device) is not None:
+        cache = device_chart_caches.setdefault(device, ChartCache(module.store, device))
+    return cache
+
+#带device时只读取该设备的分区；time_format=ms时x_data为毫秒时间戳
 @app.route('/chart', methods=['GET'])
 def getTHPChart():
+    import downsample
+    import time_format
+    import ts_store
     topic=request.args.get("variable")
+    device = request.args.get("device") or None
     try:
-        if topic == "temperature":
-            col=1
-        elif topic == "humidity":
-            col=2
-        elif topic == "pressure":
-            col=3
+        start = parse_time_arg(request.args.get("start"))
+        end = parse_time_arg(request.args.get("end"))
+        max_points = request.args.get("max_points", default=DEFAULT_MAX_POINTS, type=int)
+        max_points = min(max(max_points, 3), MAX_POINTS_LIMIT)
+        method = request.args.get("method", default="lttb")
+        time_format_arg = "ms" if request.args.get("time_format") == "ms" else "text"
+        cache = get_chart_cache(device)
+        if cache is None:
+            raise Exception("Unknown device: %s" % device)
+        if start is None and end is None:
+            # 全部数据从缓存中取，缓存只会读取存储中新追加的部分
+            times, values = cache.series(topic)
+        else:
+            # 指定了时间范围时通过时间索引只读取相关的块
+            if topic not in ts_store.FIELDS:
+                raise Exception("Invalid topic")
+            data = module.store.query(start, end, [topic], device=device)
+            mask = ts_store.present(topic, data[topic])
+            times, values = data['time'][mask], data[topic][mask]
+        total = len(times)
+        # 点数超过max_points时降采样，保证返回的数据量有上限
+        if total > max_points:
+            index = downsample.downsample(times, values, max_points, method)
+            times, values = times[index], values[index]
+        #time_format=ms时直接返回毫秒时间戳，由浏览器格式化；否则整列转换成字符串形式
+        if time_format_arg == "ms":
+            x_data = times.tolist()
         else:
-            # 抛出异常
-            raise Exception("Invalid topic")
-        with open(filename, 'r') as file:
-            reader = csv.reader(file)
-            csv_data=[]
-            for row in reader:
-                #print(row)
-                if row[col]!="" :
-                    read_data={}
-                    read_data["time"] = float(row[0])
-                    read_data[topic] = float(row[col])
-                    csv_data.append(read_data)
-            #对csv_data,按照time从小到大排序
-            csv_data.sort(key=lambda x: x["time"])
-            x_data=[]
-            y_data=[]
-            #遍历csv_data，将time和temperature分别存入x_data和y_data
-            for data in csv_data:
-                #对于放到x_data里的时间戳，需要转换成字符串形式
-                x_data.append(module.timestamp_to_time(data["time"]) )
-                y_data.append(data[topic])
-            #构造要返回的数据结构
-            ans_data={
-                "isSuccess":True,
-                "type":topic,
-                "x_data":x_data,
-                "y_data":y_data
-            }
+            x_data = time_format.format_timestamps(times)
+        y_data = ts_store.display_values(values).tolist()
+        #构造要返回的数据结构
+        ans_data={
+            "isSuccess":True,
+            "type":topic,
+            "device":device,
+            "total":total,
+            "method":method if total > max_points else None,
+            "time_format":time_format_arg,
+            "x_data":x_data,
+            "y_data":y_data
+        }
 
     except Exception as e:
         ans_data={
@@ -176,10 +311,26 @@ def getTHPChart():
             "x_data":[],
             "y_data":[]
         }
-        print("Error:",e)
+        logger.error("Error: %s", e)
     finally:
         return jsonify(ans_data)
 
+#按时间范围导出数据为csv文件下载，start/end格式与/chart相同，省略时导出全部；带device时只导出该设备
+@app.route('/exportCsv', methods=['GET'])
+def exportCsv():
+    try:
+        start = parse_time_arg(request.args.get("start"))
+        end = parse_time_arg(request.args.get("end"))
+    except ValueError as e:
+        logger.error("Error: %s", e)
+        return jsonify({"isSuccess": False, "message": "Invalid time: %s" % e})
+    device = request.args.get("device") or None
+    module.out_writer.flush()
+    buffer = io.StringIO()
+    module.store.export_csv(buffer, start, end, device=device)
+    return Response(buffer.getvalue(), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=THP_export.csv'})
+
 @app.route('/getPredict', methods=['GET'])
 
 def getPredict():
@@ -221,7 +372,6 @@ def getPredictData():
         data=[]
         for i in range(0,3):
             to_put_into_data={}
-            print(all_topic[i])
             to_put_into_data["type"]=all_topic[i]
             to_put_into_data["x_data"]=[]
             to_put_into_data["ry_data"]=[]#真实值
@@ -247,7 +397,7 @@ def getPredictData():
             "isSuccess":False,
             "data":[]
         }
-        print("Error:",e)
+        logger.error("Error: %s", e)
     finally:
         return jsonify(ans_data)
 
@@ -258,5 +408,6 @@ if __name__ == '__main__':
     os.environ['FLASK_ENV'] = 'development'
     import warnings
     warnings.filterwarnings("ignore", message=".*development server.*")
-    
+
+    start()
     app.run(debug=True, port=5001, use_reloader=False)
@@ -1,107 +1,337 @@
 # encoding=utf-8
 # subscribe_module.py
 import base64
-import csv
 import hashlib
 import hmac
-import json
+import logging
+import os
+import random
+import secrets
+import socket
 import ssl
 import threading
 import time
 import paho.mqtt.client as mqtt
-import schedule
 from datetime import datetime
 import global_var as gv
+from buffered_writer import BufferedWriter
+import message_decoder
+import log_config
+import metrics
+import ingest_pipeline
+import subscribe_pool
+from ring_buffer import ReadingRingBuffer
+from topic_trie import TopicTrie
+from MQTTClient import PROBE_TOPIC_PREFIX, RttProbe, mqtt_reconnects
+
+logger = log_config.get_logger('subscribe_module')
 
 # Mosquitto服务器配置
 mqtt_broker = "localhost"
 mqtt_port = 1883
 
+# 连接意外断开后按带抖动的指数退避重新连接(秒)
+RECONNECT_MIN_DELAY = 0.05
+RECONNECT_MAX_DELAY = 30.0
+SUBSCRIBE_QOS = 1  # 配合clean_session=False，离线期间服务器为本客户端保留QoS 1消息
+# 未指定客户端ID时使用的ID。ID固定时才使用持久会话(clean_session=False)，重启、重新登录后复用同一个会话；
+# 设为空时由paho随机生成ID并使用干净会话，不在服务器上留下无人接收的会话。
+# 没有设置THP_CLIENT_ID时(None)使用本机的ID(install_client_id)，不同机器上的订阅端不会互相挤掉对方的连接
+default_client_id = os.environ.get('THP_CLIENT_ID')
+client_id_file = "data/client_id"  # 本机的客户端ID，第一次使用时生成
+SESSION_CLEAR_TIMEOUT = 5.0  # 删除持久会话时等待服务器确认的时间(秒)
+# 订阅工作进程数，大于0时由多个进程以共享订阅分担消息解析，本进程只负责合并保存
+subscribe_workers = int(os.environ.get('THP_SUBSCRIBE_WORKERS', '0'))
+share_group = os.environ.get('THP_SHARE_GROUP', subscribe_pool.DEFAULT_GROUP)
+# on_message只把消息放进队列，由ingest_workers个线程批量解析保存；队列满时按ingest_policy处理
+ingest_workers = int(os.environ.get('THP_INGEST_WORKERS', '1'))
+ingest_queue_size = int(os.environ.get('THP_INGEST_QUEUE', str(ingest_pipeline.DEFAULT_QUEUE_SIZE)))
+ingest_policy = os.environ.get('THP_INGEST_POLICY', ingest_pipeline.DEFAULT_POLICY)
+
 client = None
 clientId = None
+persistent_session = False  # 当前连接是否使用持久会话
 accessKey = None
 accessSecret = None
-csv_file = "receive_data.csv"
+pool = None  # 多进程模式下的SubscriberPool
+out_file = "out.csv"  # 导出CSV时使用的文件名
+store_dir = "data/readings"
+# 接收到的数据按设备分区保存在列式二进制存储中，由后台线程批量写入，避免在paho网络线程中逐条写文件；
+# 存储、写入线程和处理队列由init()创建，导入本模块时不建立数据目录、不扫描已有数据，也不加载numpy
+store = None
+out_writer = None
+ingest = None
+_init_lock = threading.Lock()
+_initialized = False
+# 按主题缓存消息格式的解析器
+decoder = message_decoder.MessageDecoder()
+# 接收速率定期汇总输出；逐条消息只在DEBUG级别输出，解析错误等按类别限频
+receive_meter = log_config.ThroughputMeter(logger, 'received')
+sampled = log_config.SampledLog(logger)
+rtt_probe = RttProbe(PROBE_TOPIC_PREFIX + 'subscriber')
+# 由topic_list中的MQTT主题过滤器编译而成，为空时接收所有主题
+topic_filter = TopicTrie()
+# 主题过滤器 -> 对该主题的数据感兴趣的消费者(按主题订阅的实时推送等)，
+# 收到数据后调用匹配的消费者consumer(主题, 设备, 数据)
+router = TopicTrie()
+
+# 运行时指标，由subscribe_app的/metrics导出
+messages_received = metrics.counter('thp_messages_received_total', '接收并解析成功的消息数')
+messages_dropped = metrics.counter('thp_messages_dropped_total', '被丢弃的消息数', ['reason'])
+decode_errors = metrics.counter('thp_decode_errors_total', '消息解析错误数', ['type'])
+transform_seconds = metrics.histogram('thp_transform_seconds', '处理一条消息(解析并保存)的耗时')
+metrics.gauge('thp_receive_buffer_length', 'receive_data中的数据条数', func=lambda: len(gv.global_var.receive_data))
+ingest_wait_seconds = metrics.histogram('thp_ingest_wait_seconds', '消息从接收到开始处理在队列中等待的时间',
+                                        buckets=metrics.RTT_BUCKETS)
+metrics.gauge('thp_router_filters', '按主题分发数据的过滤器数', func=lambda: len(router))
+metrics.gauge('thp_subscribe_workers_alive', '运行中的订阅工作进程数', func=lambda: pool.alive() if pool else 0)
+
+
+def init():
+    """创建存储、写入线程和处理队列，并注册依赖它们的指标，只执行一次
+
+    连接服务器、读取数据前调用，subscribe_app处理请求前也会调用；
+    基准测试等事先替换了store或out_writer时保留替换后的对象。
+    """
+    global store, out_writer, ingest, _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        import ts_store
+        if store is None:
+            store = ts_store.PartitionedStore(store_dir)
+        if out_writer is None:
+            out_writer = BufferedWriter(store.append, name='store-writer')
+        if ingest is None:
+            ingest = ingest_pipeline.IngestPipeline(handle_batch, workers=ingest_workers,
+                                                    queue_size=ingest_queue_size, policy=ingest_policy)
+        metrics.gauge('thp_writer_queue_depth', '写入队列中等待写入存储的行数', func=lambda: out_writer.stats()['queue_depth'])
+        metrics.counter('thp_writer_written_rows_total', '已写入存储的行数', func=lambda: out_writer.written_rows)
+        metrics.counter('thp_writer_dropped_rows_total', '写入队列已满或写入失败而丢弃的行数', func=lambda: out_writer.dropped_rows)
+        metrics.gauge('thp_ingest_queue_depth', '处理队列中等待处理的消息数', func=lambda: ingest.depth())
+        metrics.gauge('thp_ingest_spill_depth', '溢出文件中等待处理的消息数', func=lambda: ingest.stats()['spill_depth'])
+        metrics.counter('thp_ingest_processed_total', '处理队列已处理的消息数', func=lambda: ingest.processed)
+        metrics.counter('thp_ingest_spilled_total', '写入溢出文件的消息数', func=lambda: ingest.spilled)
+        metrics.counter('thp_ingest_blocked_total', '队列已满而阻塞网络线程的次数', func=lambda: ingest.blocked)
+        _initialized = True
+
+class Backoff:
+    """带抖动的指数退避，每次等待时间在[min_delay, 上限]内随机选取，上限每次翻倍直到max_delay。
+    多个订阅端同时断开时，随机等待把重连请求错开，避免同时涌向服务器"""
+
+    def __init__(self, min_delay=RECONNECT_MIN_DELAY, max_delay=RECONNECT_MAX_DELAY):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._ceiling = min_delay * 2
+
+    def next(self):
+        delay = random.uniform(self.min_delay, self._ceiling)
+        self._ceiling = min(self._ceiling * 2, self.max_delay)
+        return delay
+
+    def reset(self):
+        self._ceiling = self.min_delay * 2
+
+
+reconnect_backoff = Backoff()
+reconnect_timer = None
+disconnected_at = None
 
 def on_connect(client, userdata, flags, rc):
     """连接成功回调函数"""
-    print(f"已连接，返回码: {rc}")
-    # 订阅所有主题
-    client.subscribe("#")
-    print("已成功订阅所有主题")
+    global disconnected_at
+    if rc != 0:
+        logger.warning("连接被拒绝，返回码: %s", rc)
+        return
+    reconnect_backoff.reset()
+    if disconnected_at is not None:
+        logger.info("已重新连接，用时%.3f秒", time.monotonic() - disconnected_at)
+        disconnected_at = None
+    else:
+        logger.info("已连接，返回码: %s", rc)
+    if pool is not None:
+        return  # 多进程模式下由工作进程订阅，本连接只用于往返时间探测
+    # 订阅所有主题；会话保留时服务器仍有订阅，重新订阅不影响已保留的消息
+    client.subscribe("#", qos=SUBSCRIBE_QOS)
+    logger.info("已成功订阅所有主题 (会话保留: %s)", bool(flags.get('session present')))
 
 def on_message(client, userdata, msg):
-    """接收消息回调函数"""
-    print(f"\n[DEBUG] 已接收主题 {msg.topic} 的消息")
-    print(f"[DEBUG] 消息负载: {msg.payload.decode()}")
-    # 创建一个模拟stomp frame的对象，用于兼容transform_data函数
-    class MockFrame:
-        def __init__(self, body):
-            self.body = body
-    
-    mock_frame = MockFrame(msg.payload.decode())
-    transform_data(mock_frame)
+    """接收消息回调函数，在paho网络线程中运行，只把消息放进处理队列"""
+    if msg.topic.startswith(PROBE_TOPIC_PREFIX):
+        return  # 往返时间探测消息
+    if not accept_topic(msg.topic):
+        return
+    if not ingest.put(msg.topic, msg.payload):
+        messages_dropped.labels('ingest_overflow').inc()
+        sampled.log('ingest-overflow', "处理队列已满(%s)，消息被丢弃", ingest.policy)
 
 def on_disconnect(client, userdata, rc):
-    """断开连接回调函数"""
-    print(f"已断开连接，返回码: {rc}")
+    """断开连接回调函数，意外断开时安排重新连接"""
+    global disconnected_at
+    logger.info("已断开连接，返回码: %s", rc)
+    if rc == 0 or gv.global_var.user_initiated_disconnect:
+        return
+    if disconnected_at is None:
+        disconnected_at = time.monotonic()
+    schedule_reconnect(client)
+
+def schedule_reconnect(target):
+    """等待一段退避时间后在后台线程中重新连接"""
+    global reconnect_timer
+    delay = reconnect_backoff.next()
+    logger.debug("%.3f秒后重新连接", delay)
+    reconnect_timer = threading.Timer(delay, reconnect, args=(target,))
+    reconnect_timer.daemon = True
+    reconnect_timer.start()
+
+def cancel_reconnect():
+    global reconnect_timer
+    if reconnect_timer is not None:
+        reconnect_timer.cancel()
+        reconnect_timer = None
+
+def reconnect(target):
+    """复用原来的客户端和会话重新连接，失败时继续退避"""
+    if target is not client or gv.global_var.user_initiated_disconnect:
+        return  # 期间已重新登录或主动断开
+    # 客户端设置了reconnect_on_failure=False，断开后网络线程自行退出，这里等它结束
+    target.loop_stop()
+    try:
+        target.reconnect()
+    except OSError as e:
+        sampled.log('reconnect-failed', "重新连接失败: %s", e)
+        schedule_reconnect(target)
+        return
+    mqtt_reconnects.inc()
+    target.loop_start()
 
 def on_publish(client, userdata, mid):
     """发布消息回调函数"""
-    print(f"消息已发布，mid: {mid}")
+    logger.debug("消息已发布，mid: %s", mid)
+    rtt_probe.on_publish(mid)
+
+def stop_pool():
+    global pool
+    if pool is not None:
+        pool.stop()
+        pool = None
+
+def clear_session(client_id, username=None, password=None):
+    """以clean_session=True连接一次再断开，服务器随之删除client_id的持久会话(订阅和保留的消息)"""
+    cleaner = mqtt.Client(client_id=client_id, clean_session=True, reconnect_on_failure=False)
+    if username and password:
+        cleaner.username_pw_set(username, password)
+    try:
+        cleaner.connect(mqtt_broker, mqtt_port, 60)
+        deadline = time.monotonic() + SESSION_CLEAR_TIMEOUT
+        while not cleaner.is_connected() and time.monotonic() < deadline:
+            cleaner.loop(0.1)
+        cleared = cleaner.is_connected()
+        cleaner.disconnect()
+    except OSError as e:
+        cleared = False
+        logger.warning("删除持久会话%s失败: %s", client_id, e)
+    if cleared:
+        logger.info("已删除持久会话: %s", client_id)
+    return cleared
 
 def disconnect_mqtt():
-    global client, clientId, accessKey, accessSecret, connection_check_thread
+    global client, clientId, accessKey, accessSecret, persistent_session
     try:
-        # 停止连接检查
-        if hasattr(gv.global_var, 'connection_check_running'):
-            gv.global_var.connection_check_running = False
-        
-        # 等待连接检查线程结束
-        if connection_check_thread and connection_check_thread.is_alive():
-            time.sleep(1)  # 给线程一点时间来结束
-        
+        gv.global_var.user_initiated_disconnect = True  # 设置断开标志，断开回调不再重新连接
+        cancel_reconnect()
+        stop_pool()
         if client:
-            client.loop_stop()
             client.disconnect()
-            gv.global_var.user_initiated_disconnect = True  # 设置断开标志
+            client.loop_stop()
+            # 主动断开后不再接收消息，删除服务器上的持久会话，不让它继续积累消息
+            if persistent_session:
+                clear_session(clientId, accessKey, accessSecret)
+                persistent_session = False
             # 清除clientID、accessKey和accessSecret
             clientId = None
             accessKey = None
             accessSecret = None
-            print("MQTT连接已断开。")
+            logger.info("MQTT连接已断开。")
+        # 处理完队列中的消息，再把缓冲中尚未写入的数据写入文件
+        if ingest is not None and not ingest.flush():
+            logger.warning("处理队列中的消息超时: %s", ingest.stats())
+        if out_writer is not None and not out_writer.flush():
+            logger.warning("写入缓冲数据超时: %s", out_writer.stats())
     except Exception as e:
-        print('尝试断开连接时发生错误:', e)
+        logger.error('尝试断开连接时发生错误: %s', e)
+
+def install_client_id():
+    """本机固定的客户端ID: 主机名加随机后缀，第一次使用时生成并保存在client_id_file中"""
+    try:
+        with open(client_id_file, 'r') as file:
+            saved = file.read().strip()
+        if saved:
+            return saved
+    except FileNotFoundError:
+        pass
+    # MQTT 3.1.1只保证服务器接受不超过23个字符的客户端ID
+    host = ''.join(c for c in socket.gethostname() if c.isalnum())[:10] or 'host'
+    generated = 'thp-%s-%s' % (host, secrets.token_hex(4))
+    directory = os.path.dirname(client_id_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    try:
+        with open(client_id_file, 'x') as file:
+            file.write(generated + '\n')
+    except FileExistsError:
+        # 其他进程同时生成了ID，以先保存的为准
+        return install_client_id()
+    logger.info("已生成本机的客户端ID: %s", generated)
+    return generated
+
+def resolve_client_id(client_id):
+    """client_id为空时依次使用default_client_id和本机的客户端ID"""
+    if client_id:
+        return client_id
+    if default_client_id is not None:
+        return default_client_id
+    return install_client_id()
+
+def use_persistent_session(client_id):
+    """客户端ID固定时使用持久会话(clean_session=False): 断开期间服务器保留订阅和QoS 1消息，重新连接后补发。
+    多进程模式下由工作进程以共享订阅接收消息，本连接使用干净会话，
+    服务器同时删除之前单进程运行时留下的"#"订阅，避免本进程也收到每条消息、重复保存"""
+    return bool(client_id) and subscribe_workers <= 0
 
 def connect_and_subscribe(client_id, username, password):
-    """连接到Mosquitto服务器并订阅主题"""
-    global client, clientId, accessKey, accessSecret, connection_check_thread
+    """连接到Mosquitto服务器并订阅主题，client_id为空时由resolve_client_id决定"""
+    global client, clientId, accessKey, accessSecret, disconnected_at, pool, persistent_session
     
+    client_id = resolve_client_id(client_id)
     try:
-        # 停止之前的连接检查
-        if hasattr(gv.global_var, 'connection_check_running'):
-            gv.global_var.connection_check_running = False
-        
-        # 等待连接检查线程结束
-        if connection_check_thread and connection_check_thread.is_alive():
-            time.sleep(1)  # 给线程一点时间来结束
+        init()
+        cancel_reconnect()
+        stop_pool()
         
         # 断开之前的MQTT客户端连接
         if client:
             try:
-                client.loop_stop()
                 client.disconnect()
-                print("已断开之前的MQTT客户端连接")
+                client.loop_stop()
+                logger.info("已断开之前的MQTT客户端连接")
             except Exception as e:
-                print("断开之前连接时发生错误:", e)
+                logger.warning("断开之前连接时发生错误: %s", e)
+            # 换用其他客户端ID登录时，原来的持久会话不会再被使用
+            if persistent_session and clientId != client_id:
+                clear_session(clientId, accessKey, accessSecret)
         
         # 更新全局变量
         clientId = client_id
         accessKey = username
         accessSecret = password
+        disconnected_at = None
+        reconnect_backoff.reset()
         
         # 创建新的MQTT客户端
-        client = mqtt.Client(client_id=clientId)
+        # reconnect_on_failure=False: 由on_disconnect安排带抖动的重新连接，不使用paho的固定退避
+        persistent_session = use_persistent_session(clientId)
+        client = mqtt.Client(client_id=clientId, clean_session=not persistent_session, reconnect_on_failure=False)
         
         # 设置回调函数
         client.on_connect = on_connect
@@ -113,136 +343,135 @@ def connect_and_subscribe(client_id, username, password):
         if accessKey and accessSecret:
             client.username_pw_set(accessKey, accessSecret)
         
+        # 多进程模式: 先创建进程池，on_connect据此决定本连接是否订阅
+        if subscribe_workers > 0:
+            pool = subscribe_pool.SubscriberPool(subscribe_workers, handle_rows, mqtt_broker, mqtt_port, clientId,
+                                                 accessKey, accessSecret, group=share_group, qos=SUBSCRIBE_QOS)
+        
         # 连接到Mosquitto服务器
+        ingest.start()
         client.connect(mqtt_broker, mqtt_port, 60)
         
         # 启动后台线程处理MQTT网络流量
         client.loop_start()
+        if pool is not None:
+            pool.start()
         
-        # 清除历史连接检查任务，新建连接检查任务
-        schedule.clear('conn-check')
-        schedule.every(1).seconds.do(do_check).tag('conn-check')
-        
-        # 启动新的连接检查线程
-        gv.global_var.connection_check_running = True
-        connection_check_thread = threading.Thread(target=connection_check_timer)
-        connection_check_thread.start()
-        
-        print("已成功连接到Mosquitto服务器")
+        logger.info("已成功连接到Mosquitto服务器")
         
     except Exception as e:
-        print('连接失败:', e)
+        logger.error('连接失败: %s', e)
         raise e
 
-# 检查连接，如果未连接则重新建连
-def do_check():
-    global client, clientId, accessKey, accessSecret
-    if clientId is None:
-        print('请输入clientId')
-        return
-    
-    # 检查客户端状态
-    if client and client.is_connected():
-        print('连接正常')
-    else:
-        try:
-            # 只有在确保不是因为用户主动断开连接时才尝试重新连接
-            if not gv.global_var.user_initiated_disconnect:
-                connect_and_subscribe(clientId, accessKey, accessSecret)
-        except Exception as e:
-            print('尝试重新连接时发生错误:', e)
+# 发送往返时间探测消息，结果在收到PUBACK时记录到指标中
+def probe_rtt():
+    if client is None:
+        return False
+    return rtt_probe.send(client)
 
-# 定时任务方法，检查连接状态
-connection_check_thread = None
-
-
-def connection_check_timer():
-    global connection_check_thread
-    try:
-        while gv.global_var.connection_check_running:
-            schedule.run_pending()
-            time.sleep(1)  # 改为每秒运行一次，与schedule的任务间隔一致
-    finally:
-        connection_check_thread = None
-
-#把时间戳转换成字符串
+#把时间戳转换成字符串，按秒缓存(见time_format.py)
 def timestamp_to_time(timestamp):
-    if type(timestamp) == float:
-        dt_obj = datetime.fromtimestamp(timestamp / 1000.0)
-    else:
-        dt_obj = datetime.fromtimestamp(timestamp / 1000)
-    return dt_obj.strftime('%Y-%m-%d T %H:%M:%S')
+    import time_format
+    return time_format.format_timestamp(timestamp)
 
 # 将时间字符串转换为时间戳
 def time_to_timestamp(time_str):
     dt_obj = datetime.strptime(time_str, '%Y-%m-%dT%H:%M:%S')
     return int(dt_obj.timestamp()) * 1000
 
-def transform_data(frame):
-    str_result = frame.body
-    print(type(frame.body))  # str类型
-    print(str_result)
-    
+# 兼容旧接口：frame.body为消息负载
+def transform_data(frame, topic=None):
+    handle_message(topic, frame.body)
+
+# 处理队列的工作线程调用，batch为[(主题, 负载, 接收时间), ...]
+def handle_batch(batch):
+    now = time.time()
+    for topic, payload, recv_ts in batch:
+        ingest_wait_seconds.observe(now - recv_ts)
+        handle_message(topic, payload)
+
+# 解析一条消息并保存，payload可以是bytes或str
+def handle_message(topic, payload):
+    start = time.perf_counter()
     try:
-        result = json.loads(str_result)
-        
-        # 处理三种不同的消息格式
-        if 'items' in result and 'DetectTime' in result['items']:
-            # 阿里云格式
-            prop_data = {}
-            prop_data["time"] = int(result['items']['DetectTime']['value'])
-            prop_data["temperature"] = float(result['items']['CurrentTemperature'].get("value", None))
-            prop_data["humidity"] = float(result['items']['CurrentHumidity'].get("value", None))
-            prop_data["pressure"] = int(result['items']['CurrentPressure'].get("value", None))
-        elif 'params' in result and 'DetectTime' in result['params']:
-            # publish_app.py发送的格式
-            prop_data = {}
-            prop_data["time"] = int(result['params']['DetectTime'])
-            prop_data["temperature"] = float(result['params']['CurrentTemperature'])
-            prop_data["humidity"] = float(result['params']['CurrentHumidity'])
-            prop_data["pressure"] = int(result['params']['CurrentPressure'])
-        else:
-            # 直接格式
-            prop_data = {}
-            prop_data["time"] = int(result.get("time", time.time() * 1000))
-            prop_data["temperature"] = float(result.get("temperature", None))
-            prop_data["humidity"] = float(result.get("humidity", None))
-            prop_data["pressure"] = int(result.get("pressure", None))
-        
-        ans_data = {}
-        print(f"[DEBUG] topic_list长度: {len(gv.global_var.topic_list)}")
-        
-        # 由于我们订阅了所有主题，直接将所有数据添加到ans_data中
-        # 不根据topic_list过滤，因为topic_list存储的是MQTT主题，而不是数据字段
-        ans_data["temperature"] = prop_data.get("temperature", None)
-        ans_data["humidity"] = prop_data.get("humidity", None)
-        ans_data["pressure"] = prop_data.get("pressure", None)
-        
-        if ans_data and (ans_data["temperature"] is not None or ans_data["humidity"] is not None or ans_data["pressure"] is not None):
-            ans_data['time'] = prop_data['time']
-            ans_data["printed"] = False
-            gv.global_var.receive_data.append(ans_data)
-            print(format_topicData(ans_data))
-            
-            # 自动保存数据到out.csv
-            try:
-                filename = "out.csv"
-                with open(filename, 'a', newline='') as file:
-                    writer = csv.writer(file)
-                    row = [ans_data.get('time', ''), ans_data.get('temperature', ''), ans_data.get('humidity', ''), ans_data.get('pressure', '')]
-                    writer.writerow(row)
-                print("数据已自动保存到out.csv")
-            except Exception as e:
-                print("保存数据到out.csv失败:", e)
-            
-    except json.JSONDecodeError as e:
-        print(f"JSON解析错误: {e}")
-    except KeyError as e:
-        print(f"键错误: {e}")
+        prop_data = decoder.decode(topic, payload)
+    except message_decoder.DECODE_ERRORS as e:
+        decode_errors.labels(type(e).__name__).inc()
+        messages_dropped.labels('decode_error').inc()
+        sampled.log('decode-error', "消息解析错误(%s): %s", type(e).__name__, e)
+        return
+    receive_meter.record(len(payload))
+    messages_received.inc()
+    save_row(topic, (prop_data['time'], prop_data['temperature'], prop_data['humidity'], prop_data['pressure']))
+    transform_seconds.observe(time.perf_counter() - start)
+
+# 保存工作进程解析好的一批行，由SubscriberPool的收集线程调用
+def handle_rows(rows, nbytes=0, errors=None):
+    if errors:
+        for name, count in errors.items():
+            decode_errors.labels(name).inc(count)
+            messages_dropped.labels('decode_error').inc(count)
+        sampled.log('decode-error', "工作进程消息解析错误: %s", errors)
+    if not rows:
+        return
+    receive_meter.record(nbytes, len(rows))
+    messages_received.inc(len(rows))
+    for row in rows:
+        if accept_topic(row[0]):
+            save_row(row[0], row[1:])
+
+# 主题不匹配topic_filter时丢弃
+def accept_topic(topic):
+    if topic_filter and not topic_filter.matches(topic):
+        messages_dropped.labels('topic_filter').inc()
+        return False
+    return True
+
+# 添加/删除接收消息的MQTT主题过滤器，不合法的过滤器抛出ValueError
+# topic_list中的字段名(temperature等)是页面上选择的显示字段，不加入过滤器
+def add_topic_filter(topic):
+    return topic_filter.add(topic)
+
+def remove_topic_filter(topic):
+    return topic_filter.remove(topic)
+
+# 从主题中取出设备名，无法识别时归入默认分区
+def device_of(topic):
+    import ts_store
+    return message_decoder.device_of(topic) or ts_store.DEFAULT_DEVICE
+
+# 返回设备的接收数据缓冲区，不存在且create为False时返回None
+def device_buffer(device, create=False):
+    buffer = gv.global_var.device_data.get(device)
+    if buffer is None and create:
+        buffer = gv.global_var.device_data.setdefault(device, ReadingRingBuffer(gv.DEVICE_RECEIVE_CAPACITY))
+    return buffer
+
+# 把主题的一行(时间, 温度, 湿度, 气压)加入实时数据、分发给订阅了该主题的消费者，并交给后台线程写入存储
+def save_row(topic, row):
+    device = device_of(topic)
+    ans_data = {
+        "temperature": row[1],
+        "humidity": row[2],
+        "pressure": row[3],
+        "time": row[0],
+    }
+    gv.global_var.receive_data.append(ans_data)
+    device_buffer(device, create=True).append(ans_data)
+    if len(router):
+        for consumer in router.match(topic):
+            consumer(topic, device, ans_data)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s %s", device, format_topicData(ans_data))
+
+    # 自动保存数据到存储，由后台线程批量写入
+    if not out_writer.write((device,) + row):
+        messages_dropped.labels('writer_full').inc()
+        sampled.log('writer-full', "写入队列已满，数据被丢弃")
 
 def format_topicData(prop_data):
     formatted_ans = "time:" + timestamp_to_time(prop_data["time"]) + " "
-    formatted_ans += (" ".join([f"{k}:{v}" for k, v in prop_data.items() if k != "printed" and k != "time"]) + "")
+    formatted_ans += (" ".join([f"{k}:{v}" for k, v in prop_data.items() if k != "time"]) + "")
     return formatted_ans
 
 def format_time(month, day, hour):
@@ -255,29 +484,26 @@ def format_topiclist(topic_list):
     return formatted_ans
     
 # 读取数据，整理
-#写一个函数，它从csv中读取数据，然后存进receive_data里
+#从存储中读取最近的数据，然后存进receive_data里
 def read_data():
     try:
-        with open(csv_file, 'r') as file:
-            reader = csv.reader(file)
-            gv.global_var.receive_data = []
-            for row in reader:
-                prop_data = {}
-                for i in range(0, 4):  # 确保读取所有4个字段
-                    if i < len(row) and row[i] != "":
-                        if i == 0:
-                            prop_data["time"] = int(row[i])
-                        elif i == 1:
-                            prop_data["temperature"] = float(row[i])
-                        elif i == 2:
-                            prop_data["humidity"] = float(row[i])
-                        elif i == 3:
-                            prop_data["pressure"] = int(row[i])
-                if prop_data:
-                    gv.global_var.receive_data.append(prop_data)
-            print("数据读取完成。获取的条目总数:", len(gv.global_var.receive_data))
-            return gv.global_var.receive_data
+        init()
+        import ts_store
+        data = store.tail(gv.RECEIVE_CAPACITY)
+        gv.global_var.receive_data.clear()
+        columns = [data['time'].tolist()]
+        masks = []
+        for name in ts_store.FIELDS:
+            values = data[name] if name == 'pressure' else ts_store.display_values(data[name])
+            columns.append(values.tolist())
+            masks.append(ts_store.present(name, data[name]).tolist())
+        for i, t in enumerate(columns[0]):
+            prop_data = {name: columns[j + 1][i] for j, name in enumerate(ts_store.FIELDS) if masks[j][i]}
+            prop_data["time"] = t
+            gv.global_var.receive_data.append(prop_data)
+        logger.info("数据读取完成。获取的条目总数: %d", len(gv.global_var.receive_data))
+        return gv.global_var.receive_data
     #处理异常
     except Exception as e:
-        print('尝试读取数据时发生错误:', e)
-        return None
\ No newline at end of file
+        logger.error('尝试读取数据时发生错误: %s', e)
+        return None
@@ -0,0 +1,255 @@
+# subscribe_pool.py
+# Function: 订阅端的多进程工作模式
+# N个工作进程以共享订阅($share/<组名>/<主题>)加入同一个订阅组，服务器把消息在组内轮流分给各进程。
+# 每个工作进程解析自己分到的消息，把解析出的行按批通过管道发给主进程；
+# 主进程中的收集线程把各进程的批次交给sink，统一写入存储和实时视图。
+# 工作进程用multiprocessing的spawn方式启动(Windows和Linux相同)，不继承主进程的线程和连接；
+# spawn会在工作进程中重新导入主程序模块，主程序的启动代码需要放在if __name__ == '__main__'之下。
+# 工作进程使用干净会话(clean_session=True): 进程退出后服务器把它移出订阅组，不会再把消息分给已经不在的进程；
+# 重启后的工作进程重新加入订阅组。
+import multiprocessing
+import multiprocessing.connection
+import random
+import signal
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+import log_config
+import message_decoder
+from MQTTClient import PROBE_TOPIC_PREFIX
+
+logger = log_config.get_logger('subscribe_pool')
+
+DEFAULT_GROUP = 'thp-subscribers'
+BATCH_ROWS = 500        # 每批最多的行数
+FLUSH_INTERVAL = 0.05   # 不满一批时最长等待时间(秒)
+RESTART_DELAY = 1.0     # 工作进程意外退出后重新启动前的等待时间(秒)
+
+
+def shared_topic(group, topic):
+    return '$share/%s/%s' % (group, topic)
+
+
+class BatchSender:
+    """工作进程中使用: 把解析出的行攒成批次，通过conn发给主进程
+
+    每个批次为(行列表, 负载字节数, {错误类型: 次数})，行为(主题, 时间, 温度, 湿度, 气压)，
+    主进程根据主题过滤并找到设备分区
+    """
+
+    def __init__(self, conn, batch_rows=BATCH_ROWS):
+        self.conn = conn
+        self.batch_rows = batch_rows
+        self.decoder = message_decoder.MessageDecoder()
+        self._lock = threading.Lock()
+        self._rows = []
+        self._bytes = 0
+        self._errors = {}
+
+    def on_message(self, client, userdata, msg):
+        if msg.topic.startswith(PROBE_TOPIC_PREFIX):
+            return  # 往返时间探测消息
+        try:
+            prop_data = self.decoder.decode(msg.topic, msg.payload)
+        except message_decoder.DECODE_ERRORS as e:
+            name = type(e).__name__
+            with self._lock:
+                self._errors[name] = self._errors.get(name, 0) + 1
+            return
+        row = (msg.topic, prop_data['time'], prop_data['temperature'], prop_data['humidity'], prop_data['pressure'])
+        with self._lock:
+            self._rows.append(row)
+            self._bytes += len(msg.payload)
+            if len(self._rows) >= self.batch_rows:
+                self._send()
+
+    def flush(self):
+        with self._lock:
+            self._send()
+
+    def _send(self):
+        # 调用时需持有self._lock
+        if self._rows or self._errors:
+            self.conn.send((self._rows, self._bytes, self._errors))
+            self._rows, self._bytes, self._errors = [], 0, {}
+
+
+def run_worker(conn, stop, broker, port, client_id, topic, qos, username='', password=''):
+    """工作进程入口: 订阅共享主题，直到主进程关闭stop管道(停止进程池或主进程退出)
+
+    conn为发送批次的管道，stop为只读的管道，主进程不会写入，关闭时这里读到EOF。
+    """
+    log_config.configure()
+    # Ctrl+C由主进程处理，主进程停止进程池时关闭stop管道
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    sender = BatchSender(conn)
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe(topic, qos=qos)
+            logger.info("工作进程%s已连接并订阅%s", client_id, topic)
+        else:
+            logger.warning("工作进程%s连接被拒绝，返回码: %s", client_id, rc)
+
+    client = mqtt.Client(client_id=client_id, clean_session=True)
+    client.on_connect = on_connect
+    client.on_message = sender.on_message
+    # 各工作进程的起始重连间隔不同，服务器重启后不会同时重连
+    client.reconnect_delay_set(min_delay=random.uniform(0.05, 0.1), max_delay=30)
+    if username:
+        client.username_pw_set(username, password)
+    client.connect_async(broker, port, 60)
+    client.loop_start()
+    try:
+        while not stop.poll(FLUSH_INTERVAL):
+            sender.flush()
+    except OSError as e:
+        logger.warning("工作进程%s无法发送数据到主进程: %s", client_id, e)
+    finally:
+        client.disconnect()
+        client.loop_stop()
+        try:
+            sender.flush()
+            sender.conn.close()
+        except OSError:
+            pass
+
+
+class SubscriberPool:
+    """启动并管理N个共享订阅工作进程，把各进程发来的批次交给sink(rows, nbytes, errors)处理
+
+    sink在收集线程中依次调用，不需要考虑并发。
+    工作进程的客户端ID为<client_id>-w<序号>，client_id为空时由paho随机生成。
+    """
+
+    def __init__(self, workers, sink, broker='localhost', port=1883, client_id='subscriber',
+                 username='', password='', group=DEFAULT_GROUP, topic='#', qos=1):
+        if workers < 1:
+            raise ValueError("工作进程数必须大于0: %r" % workers)
+        self.workers = workers
+        self.sink = sink
+        self.broker = broker
+        self.port = port
+        self.client_id = client_id
+        self.username = username
+        self.password = password
+        self.topic = shared_topic(group, topic)
+        self.qos = qos
+        self.batches = 0
+        self.rows = 0
+        self.restarts = 0
+        self._context = multiprocessing.get_context('spawn')
+        self._procs = [None] * workers
+        self._conns = [None] * workers
+        self._stops = [None] * workers
+        self._restart_at = {}
+        self._stopping = False
+        self._collector = None
+
+    def start(self):
+        for index in range(self.workers):
+            self._spawn(index)
+        self._collector = threading.Thread(target=self._collect, name='subscribe-pool', daemon=True)
+        self._collector.start()
+        logger.info("已启动%d个订阅工作进程，共享订阅: %s", self.workers, self.topic)
+
+    def worker_id(self, index):
+        return '%s-w%d' % (self.client_id, index) if self.client_id else ''
+
+    def _spawn(self, index):
+        reader, writer = self._context.Pipe(duplex=False)
+        stop_reader, stop_writer = self._context.Pipe(duplex=False)
+        # 用户名和密码通过管道传给工作进程，不出现在进程列表中
+        proc = self._context.Process(
+            target=run_worker, name='subscribe-worker-%d' % index, daemon=True,
+            args=(writer, stop_reader, self.broker, self.port, self.worker_id(index), self.topic, self.qos,
+                  self.username or '', self.password or ''))
+        try:
+            proc.start()
+        except Exception:
+            reader.close()
+            stop_writer.close()
+            raise
+        finally:
+            # 主进程关闭交给工作进程的一端，工作进程退出后reader才能收到EOF
+            writer.close()
+            stop_reader.close()
+        self._procs[index] = proc
+        self._conns[index] = reader
+        self._stops[index] = stop_writer
+
+    def _collect(self):
+        while True:
+            conns = [conn for conn in self._conns if conn is not None]
+            if not conns and self._stopping:
+                break
+            for conn in multiprocessing.connection.wait(conns, timeout=0.5) if conns else ():
+                index = self._conns.index(conn)
+                try:
+                    rows, nbytes, errors = conn.recv()
+                except (EOFError, OSError):
+                    self._exited(index)
+                    continue
+                self.batches += 1
+                self.rows += len(rows)
+                try:
+                    self.sink(rows, nbytes, errors)
+                except Exception:
+                    logger.exception("处理工作进程%d的数据时发生错误", index)
+            if not conns:
+                time.sleep(0.1)
+            self._restart_due()
+
+    def _exited(self, index):
+        self._conns[index].close()
+        self._conns[index] = None
+        self._stops[index].close()
+        self._procs[index].join()
+        rc = self._procs[index].exitcode
+        if not self._stopping:
+            logger.warning("订阅工作进程%d意外退出(返回码%s)，%.1f秒后重新启动", index, rc, RESTART_DELAY)
+            self._restart_at[index] = time.monotonic() + RESTART_DELAY
+
+    def _restart_due(self):
+        now = time.monotonic()
+        for index, due in list(self._restart_at.items()):
+            if self._stopping:
+                self._restart_at.clear()
+            elif now >= due:
+                del self._restart_at[index]
+                try:
+                    self._spawn(index)
+                    self.restarts += 1
+                except OSError as e:
+                    logger.error("重新启动订阅工作进程%d失败: %s", index, e)
+                    self._restart_at[index] = now + RESTART_DELAY
+
+    def alive(self):
+        return sum(1 for proc in self._procs if proc is not None and proc.is_alive())
+
+    def stop(self, timeout=5.0):
+        """通知工作进程退出，收完它们最后发来的批次后返回"""
+        self._stopping = True
+        for stop in self._stops:
+            if stop is not None:
+                stop.close()
+        if self._collector is not None:
+            self._collector.join(timeout)
+        for proc in self._procs:
+            if proc is not None and proc.is_alive():
+                logger.warning("订阅工作进程%d没有按时退出，强制结束", proc.pid)
+                proc.kill()
+                proc.join()
+        logger.info("订阅工作进程已停止，共收到%d批%d行", self.batches, self.rows)
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'alive': self.alive(),
+            'batches': self.batches,
+            'rows': self.rows,
+            'restarts': self.restarts,
+        }
+
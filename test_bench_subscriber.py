@@ -0,0 +1,32 @@
+# test_bench_subscriber.py
+# 测试订阅端微基准测试结束后恢复订阅端的全局状态，之后仍能正常读取数据，不需要MQTT服务器
+import os
+import tempfile
+
+import bench_subscriber
+import global_var as gv
+import subscribe_app
+import subscribe_module as module
+
+
+def test_bench_restores_subscriber_state():
+    with tempfile.TemporaryDirectory() as directory:
+        old_dir = module.store_dir
+        module.store_dir = os.path.join(directory, 'readings')
+        receive_data, device_data = gv.global_var.receive_data, gv.global_var.device_data
+        try:
+            result = bench_subscriber.run(sizes=[1000], calls=100, repeat=1)
+            assert result['scaling'][0]['rows'] == 1000
+            assert module.store is None and not module._initialized
+            assert gv.global_var.receive_data is receive_data and gv.global_var.device_data is device_data
+            assert '_default' not in device_data and subscribe_app.chart_cache is None
+            # 基准测试之后读取的是订阅端自己的存储
+            assert module.read_data() is not None
+            assert module.store is not None and len(gv.global_var.receive_data) == 0
+        finally:
+            module.store_dir = old_dir
+
+
+if __name__ == "__main__":
+    test_bench_restores_subscriber_state()
+    print("✅ 订阅端基准测试恢复状态测试全部通过")
@@ -0,0 +1,85 @@
+# test_buffered_writer.py
+# 测试异步缓冲写入的批量提交、flush超时和丢弃计数，用内存中的sink代替文件，不需要MQTT服务器
+import threading
+import time
+
+from buffered_writer import BufferedWriter
+
+
+class MemorySink:
+    """把每批数据行记在内存中；gate未打开时写入阻塞，fail为True时写入失败"""
+
+    def __init__(self):
+        self.batches = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.entered = threading.Event()
+        self.fail = False
+
+    def __call__(self, rows):
+        self.entered.set()
+        self.gate.wait()
+        if self.fail:
+            raise IOError("磁盘已满")
+        self.batches.append(list(rows))
+
+
+def test_group_commit_by_rows_and_interval():
+    sink = MemorySink()
+    writer = BufferedWriter(sink, batch_rows=10, flush_interval=0.2)
+    # 第一批写入阻塞期间到达的行合并为一批提交
+    sink.gate.clear()
+    writer.write(0)
+    assert sink.entered.wait(2)
+    for i in range(1, 26):
+        writer.write(i)
+    sink.gate.set()
+    assert writer.flush()
+    assert [row for batch in sink.batches for row in batch] == list(range(26))
+    assert len(sink.batches) < 26 and max(len(batch) for batch in sink.batches) >= 10
+    # 不足batch_rows的行在flush_interval后提交
+    writer.write(26)
+    time.sleep(0.5)
+    assert sink.batches[-1] == [26]
+    assert writer.stats()['written_rows'] == 27 and writer.stats()['dropped_rows'] == 0
+
+
+def test_flush_times_out_while_sink_is_blocked():
+    sink = MemorySink()
+    writer = BufferedWriter(sink, batch_rows=1)
+    sink.gate.clear()
+    writer.write('a')
+    assert sink.entered.wait(2)
+    assert not writer.flush(timeout=0.1)
+    sink.gate.set()
+    assert writer.flush(timeout=2)
+    assert sink.batches == [['a']]
+
+
+def test_dropped_rows_when_queue_full_or_write_fails():
+    sink = MemorySink()
+    writer = BufferedWriter(sink, queue_size=3, batch_rows=1)
+    sink.gate.clear()
+    writer.write('first')
+    assert sink.entered.wait(2)
+    # 写入线程阻塞，队列最多再放3行，其余行直接丢弃
+    accepted = [writer.write(i) for i in range(5)]
+    assert accepted == [True, True, True, False, False]
+    assert writer.dropped_rows == 2
+    sink.gate.set()
+    assert writer.flush(timeout=2)
+    assert writer.written_rows == 4
+
+    # 写入失败的批次计入丢弃的行数
+    sink.fail = True
+    writer.write('x')
+    writer.write('y')
+    assert writer.flush(timeout=2)
+    assert writer.dropped_rows == 4 and writer.written_rows == 4
+
+
+if __name__ == "__main__":
+    test_group_commit_by_rows_and_interval()
+    test_flush_times_out_while_sink_is_blocked()
+    test_dropped_rows_when_queue_full_or_write_fails()
+    print("✅ 缓冲写入测试全部通过")
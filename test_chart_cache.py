@@ -0,0 +1,47 @@
+# test_chart_cache.py
+# 测试/chart使用的时间序列缓存: 乱序数据的增量归并，以及存储被替换后的重建，不需要MQTT服务器
+import tempfile
+
+import numpy as np
+
+import ts_store
+from chart_cache import ChartCache, _Series
+
+
+def test_out_of_order_batches_merge_like_full_sort():
+    rng = np.random.default_rng(2)
+    series = _Series()
+    all_times, all_values = [], []
+    for lo in range(0, 5000, 250):
+        # 每批大体晚于之前的数据，但有抖动，部分早于已缓存的最后一条；时间有重复
+        times = lo * 10 + rng.integers(-400, 2500, 250)
+        values = rng.normal(size=250).astype(np.float32)
+        series.extend(times, values)
+        all_times.append(times)
+        all_values.append(values)
+    times, values = np.concatenate(all_times), np.concatenate(all_values)
+    order = np.argsort(times, kind='stable')
+    assert np.array_equal(series.times, times[order])
+    assert np.array_equal(series.values, values[order])
+
+
+def test_cache_rebuilds_when_store_is_replaced():
+    with tempfile.TemporaryDirectory() as first, tempfile.TemporaryDirectory() as second:
+        store = ts_store.PartitionedStore(first)
+        store.append([('dev', 1000 + i, 20.0 + i, 50.0, 1000) for i in range(5)])
+        cache = ChartCache(store)
+        assert cache.series('temperature')[0].tolist() == [1000, 1001, 1002, 1003, 1004]
+        # 追加的数据增量读取
+        store.append([('dev', 999, 19.0, 50.0, 1000)])
+        assert cache.series('temperature', end=1001)[1].tolist() == [19.0, 20.0, 21.0]
+        # 分区换成另一份行数更多的数据，缓存按存储标识重建，而不是把它当作新追加的行
+        replacement = ts_store.PartitionedStore(second)
+        replacement.append([('dev', 5000 + i, 30.0, 50.0, 1000) for i in range(8)])
+        store.partitions['dev'] = replacement.partitions['dev']
+        assert cache.series('temperature')[0].tolist() == [5000 + i for i in range(8)]
+
+
+if __name__ == "__main__":
+    test_out_of_order_batches_merge_like_full_sort()
+    test_cache_rebuilds_when_store_is_replaced()
+    print("✅ 图表缓存测试全部通过")
@@ -0,0 +1,68 @@
+# test_csv_sort.py
+# 测试发布数据文件的排序，不需要MQTT服务器
+import csv
+import os
+import random
+import tempfile
+
+import csv_sort
+
+
+def _write(path, rows):
+    with open(path, 'w', newline='') as file:
+        csv.writer(file).writerows(rows)
+
+
+def _read(path):
+    with open(path, 'r', newline='') as file:
+        return [row for row in csv.reader(file) if row]
+
+
+def test_external_sort_matches_in_memory_sort():
+    rng = random.Random(3)
+    # 时间戳有重复，检查排序是稳定的
+    rows = [[str(rng.randint(0, 500)), str(i), '50.0', '1000'] for i in range(2000)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'data.csv')
+        _write(path, rows)
+        assert csv_sort.ensure_sorted(path, chunk_rows=300) == csv_sort.RESORTED
+        assert _read(path) == sorted(rows, key=lambda x: int(x[0]))
+        # 只剩数据文件和标记文件，临时文件已删除
+        assert sorted(os.listdir(directory)) == ['data.csv', 'data.csv.sorted']
+
+
+def test_multi_pass_merge_keeps_order_and_mode():
+    rng = random.Random(5)
+    rows = [[str(rng.randint(0, 200)), str(i), '50.0', '1000'] for i in range(1000)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'data.csv')
+        _write(path, rows)
+        os.chmod(path, 0o644)
+        # 50个临时文件，每次最多归并4个，需要三轮
+        csv_sort.external_sort(path, chunk_rows=20, fan_in=4)
+        assert _read(path) == sorted(rows, key=lambda x: int(x[0]))
+        assert os.stat(path).st_mode & 0o777 == 0o644
+        assert os.listdir(directory) == ['data.csv']
+
+
+def test_sorted_file_is_not_rewritten():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'data.csv')
+        _write(path, [[str(t), '20.5', '50.0', '1000'] for t in range(100)])
+        mtime = os.stat(path).st_mtime_ns
+        assert csv_sort.ensure_sorted(path) == csv_sort.ALREADY_SORTED
+        assert os.stat(path).st_mtime_ns == mtime
+        assert csv_sort.ensure_sorted(path) == csv_sort.MARKED
+        # 文件被修改后标记失效，需要重新检查
+        with open(path, 'a', newline='') as file:
+            csv.writer(file).writerow(['5', '20.5', '50.0', '1000'])
+        assert not csv_sort.is_marked_sorted(path)
+        assert csv_sort.ensure_sorted(path) == csv_sort.RESORTED
+        assert [int(row[0]) for row in _read(path)][:7] == [0, 1, 2, 3, 4, 5, 5]
+
+
+if __name__ == "__main__":
+    test_external_sort_matches_in_memory_sort()
+    test_multi_pass_merge_keeps_order_and_mode()
+    test_sorted_file_is_not_rewritten()
+    print("✅ 排序测试全部通过")
@@ -0,0 +1,92 @@
+# test_data.py
+# 测试原始数据的合并和发布数据文件的生成
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+import csv_sort
+import data
+
+
+def _write_series(directory, file_name, lines):
+    with open(os.path.join(directory, file_name), 'w') as file:
+        for line in lines:
+            file.write(json.dumps(line) + '\n')
+
+
+def test_to_epoch_ms():
+    ms = data.to_epoch_ms(['2014-02-13T00:00:00', 'bad', '1970-01-01T08:00:01'])
+    assert ms.tolist() == [1392220800000, -1, 1000]
+    assert data.to_epoch_ms(['1970-01-01T00:00:00'], utc_offset=0).tolist() == [0]
+    assert data.time_to_timestamp('2014-02-13T00:00:00') == 1392220800000
+
+
+def test_import_has_no_side_effects():
+    # 在新进程中导入，确认没有加载pandas/numpy，没有生成文件，也没有修改全局的日志设置
+    with tempfile.TemporaryDirectory() as directory:
+        here = os.path.dirname(os.path.abspath(__file__))
+        code = ("import sys, logging; sys.path.insert(0, %r); "
+                "import data, publish_module, subscibeChoice, subscribe_app, publish_app; "
+                "print(sorted(name for name in ('pandas', 'numpy', 'linkkit') if name in sys.modules), "
+                "len(logging.getLogger().handlers))" % here)
+        env = dict(os.environ, THP_LOG_LEVEL='not-a-level')
+        output = subprocess.run([sys.executable, '-W', 'ignore', '-c', code], cwd=directory, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        assert output.strip() == '[] 0' and os.listdir(directory) == []
+
+
+def test_merge_and_write():
+    with tempfile.TemporaryDirectory() as directory:
+        _write_series(directory, 'temperature.txt', [
+            {'2014-02-13T00:20:00': '3.5', '2014-02-13T00:00:00': '4'},
+            {'2014-02-13T00:40:00': '5.0', '2014-02-13T00:20:00': '3.0'},  # 重复的时间以后出现的为准
+        ])
+        _write_series(directory, 'humidity.txt', [
+            {'2014-02-13T00:00:00': '66', '2014-02-13T00:20:00': '75', '2014-02-13T01:00:00': '80'},
+        ])
+        _write_series(directory, 'pressure.txt', [
+            {'2014-02-13T00:00:00': '995', '2014-02-13T00:20:00': 'n/a', '2014-02-13T00:40:00': '993',
+             'not a time': '990'},
+        ])
+        frame = data.load(directory)
+        # 外连接: 任一序列有数据的时间都保留，按时间排序，无法解析的时间被丢弃
+        assert list(frame.index) == ['2014-02-13T00:00:00', '2014-02-13T00:20:00',
+                                     '2014-02-13T00:40:00', '2014-02-13T01:00:00']
+        assert frame['timestamp'].tolist() == [1392220800000 + i * 1200000 for i in range(3)] + [1392224400000]
+        assert frame['temperature'].tolist()[:3] == [4.0, 3.0, 5.0] and np.isnan(frame['pressure'].iloc[1])
+
+        merged_path = os.path.join(directory, data.MERGED_FILE)
+        assert data.write_merged_csv(frame, merged_path) == 4
+        with open(merged_path, 'r') as file:
+            assert list(csv.reader(file)) == [
+                ['time', 'temperature', 'humidity', 'pressure'],
+                ['2014-02-13T00:00:00', '4', '66', '995'],
+                ['2014-02-13T00:20:00', '3', '75', ''],
+                ['2014-02-13T00:40:00', '5', '', '993'],
+                ['2014-02-13T01:00:00', '', '80', ''],
+            ]
+
+        # 发布数据文件只保留三项都有的行，并标记为已排序
+        publish_path = os.path.join(directory, data.PUBLISH_FILE)
+        assert data.write_publish_csv(frame, publish_path) == 1
+        with open(publish_path, 'r') as file:
+            assert file.read() == '1392220800000,4,66,995\n'
+        assert csv_sort.ensure_sorted(publish_path) == csv_sort.MARKED
+
+
+def test_format_values():
+    values = np.array([66.0, 22.35, np.nan, -3.0, 1e20])
+    assert data.format_values(values).tolist() == ['66', '22.35', '', '-3', '1e+20']
+
+
+if __name__ == "__main__":
+    test_to_epoch_ms()
+    test_import_has_no_side_effects()
+    test_merge_and_write()
+    test_format_values()
+    print("✅ 数据合并测试全部通过")
@@ -0,0 +1,61 @@
+# test_downsample.py
+# 测试/chart使用的降采样函数，不需要MQTT服务器
+import numpy as np
+
+import downsample
+
+
+def reference_lttb(x, y, threshold):
+    # 逐点计算的LTTB参考实现，用于校验向量化版本
+    n = len(x)
+    every = (n - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n - 1) if i < threshold - 3 else n
+        if i < threshold - 3:
+            cx = sum(x[end:next_end]) / (next_end - end)
+            cy = sum(y[end:next_end]) / (next_end - end)
+        else:
+            cx, cy = x[n - 1], y[n - 1]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((x[a] - cx) * (y[j] - y[a]) - (x[a] - x[j]) * (cy - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+def test_lttb_matches_reference():
+    rng = np.random.default_rng(0)
+    x = np.arange(1000, dtype=np.float64) * 1000
+    y = np.cumsum(rng.normal(size=1000))
+    index = downsample.lttb(x, y, 50)
+    assert len(index) == 50
+    assert index.tolist() == reference_lttb(x.tolist(), y.tolist(), 50)
+
+
+def test_minmax_keeps_extremes():
+    y = np.array([1.0, 5.0, 3.0, -2.0, 4.0, 0.0, 9.0, 2.0])
+    index = downsample.minmax(y, 4)
+    # 两个桶: [1,5,3,-2] 和 [4,0,9,2]
+    assert index.tolist() == [1, 3, 5, 6]
+
+
+def test_small_input_is_unchanged():
+    x = np.arange(10)
+    y = np.arange(10, dtype=np.float64)
+    assert downsample.downsample(x, y, 100).tolist() == list(range(10))
+    assert downsample.downsample(x, y, 100, 'minmax').tolist() == list(range(10))
+
+
+if __name__ == "__main__":
+    test_lttb_matches_reference()
+    test_minmax_keeps_extremes()
+    test_small_input_is_unchanged()
+    print("✅ 降采样测试全部通过")
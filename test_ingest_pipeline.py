@@ -0,0 +1,125 @@
+# test_ingest_pipeline.py
+# 测试订阅端消息处理队列的批量处理和三种溢出策略，不需要MQTT服务器
+import os
+import tempfile
+import threading
+import time
+
+from ingest_pipeline import IngestPipeline
+
+
+def _gated(handled, gate):
+    def handler(batch):
+        gate.wait(5)
+        handled.extend(payload for _, payload, _ in batch)
+    return handler
+
+
+def test_drop_oldest_and_block():
+    handled, gate = [], threading.Event()
+    pipeline = IngestPipeline(_gated(handled, gate), queue_size=3, policy='drop_oldest')
+    pipeline.start()
+    assert pipeline.put('t', 0)
+    time.sleep(0.05)  # 工作线程取走第一条后阻塞在handler中
+    results = [pipeline.put('t', i) for i in range(1, 6)]
+    assert results == [True, True, True, False, False] and pipeline.dropped == 2
+    gate.set()
+    assert pipeline.flush()
+    assert handled == [0, 3, 4, 5]
+
+    handled, gate = [], threading.Event()
+    pipeline = IngestPipeline(_gated(handled, gate), queue_size=2, batch_size=2, policy='block')
+    pipeline.start()
+    producer = threading.Thread(target=lambda: [pipeline.put('t', i) for i in range(10)])
+    producer.start()
+    time.sleep(0.1)
+    # 队列已满，放入消息的线程被阻塞
+    assert producer.is_alive() and pipeline.depth() == 2 and pipeline.blocked >= 1
+    gate.set()
+    producer.join(5)
+    assert pipeline.flush() and handled == list(range(10)) and pipeline.dropped == 0
+    pipeline.stop()
+
+
+def test_spill_keeps_order_and_survives_restart():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'spill.log')
+        handled, gate = [], threading.Event()
+        pipeline = IngestPipeline(_gated(handled, gate), queue_size=5, batch_size=4, policy='spill', spill_path=path)
+        for i in range(20):
+            assert pipeline.put('dev/%d' % i, str(i), recv_ts=1000.0 + i)
+        stats = pipeline.stats()
+        assert stats['queue_depth'] == 5 and stats['spill_depth'] == 15 and stats['spilled'] == 15
+        pipeline.start()
+        gate.set()
+        assert pipeline.flush()
+        assert handled == [str(i).encode() if i >= 5 else str(i) for i in range(20)]
+        pipeline.stop()
+
+        # 还没处理的溢出消息在重启后继续处理，接收时间保持不变
+        seen = []
+        pipeline = IngestPipeline(lambda batch: None, queue_size=1, policy='spill', spill_path=path)
+        for i in range(3):
+            pipeline.put('dev/%d' % i, str(i), recv_ts=2000.0 + i)
+        restarted = IngestPipeline(seen.extend, queue_size=1, policy='spill', spill_path=path)
+        assert restarted.stats()['spill_depth'] == 2
+        restarted.start()
+        assert restarted.flush()
+        assert seen == [('dev/1', b'1', 2001.0), ('dev/2', b'2', 2002.0)]
+
+
+def test_spill_committed_after_handler():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'spill.log')
+        batches, reading, gate = [], threading.Event(), threading.Event()
+
+        def handler(batch):
+            batches.append(batch)
+            if len(batches) == 2:  # 第一批来自内存队列，第二批来自溢出文件
+                reading.set()
+                gate.wait(5)
+
+        pipeline = IngestPipeline(handler, queue_size=1, batch_size=10, policy='spill', spill_path=path)
+        for i in range(5):
+            pipeline.put('dev/%d' % i, str(i))
+        pipeline.start()
+        assert reading.wait(5) and len(batches[1]) == 4
+        # handler返回前这一批仍在溢出文件中，此时进程退出，重启后还能读到
+        assert pipeline.stats()['spill_depth'] == 4
+        assert IngestPipeline(handler, policy='spill', spill_path=path).stats()['spill_depth'] == 4
+        # 处理溢出文件中的一批时，新消息照常放入，排在溢出文件的最后
+        assert pipeline.put('dev/5', '5')
+        gate.set()
+        assert pipeline.flush() and pipeline.stats()['spill_depth'] == 0
+        assert [payload for batch in batches for _, payload, _ in batch] == ['0'] + [str(i).encode() for i in range(1, 6)]
+        pipeline.stop()
+
+
+def test_spill_batch_retried_after_handler_failure():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'spill.log')
+        calls = []
+
+        def handler(batch):
+            calls.append([payload for _, payload, _ in batch])
+            if len(calls) == 2:  # 第一批来自内存队列，第二批(溢出文件)第一次写入失败
+                raise IOError("磁盘已满")
+
+        pipeline = IngestPipeline(handler, queue_size=1, batch_size=10, policy='spill', spill_path=path)
+        for i in range(4):
+            pipeline.put('dev/%d' % i, str(i))
+        pipeline.start()
+        assert pipeline.flush() and pipeline.stats()['spill_depth'] == 0
+        # 失败的一批没有提交，重试时原样读回，没有丢失
+        assert calls == [['0'], [b'1', b'2', b'3'], [b'1', b'2', b'3']]
+        stats = pipeline.stats()
+        assert stats['failed'] == 3 and stats['processed'] == 4
+        pipeline.stop()
+
+
+if __name__ == "__main__":
+    test_drop_oldest_and_block()
+    test_spill_keeps_order_and_survives_restart()
+    test_spill_committed_after_handler()
+    test_spill_batch_retried_after_handler_failure()
+    print("✅ 消息处理队列测试全部通过")
@@ -0,0 +1,120 @@
+# test_live_stream.py
+# 测试实时数据推送: 按序号推送、gap和reset事件、Last-Event-ID续传以及发布状态的节流，不需要MQTT服务器
+import json
+
+import live_stream
+from ring_buffer import ReadingRingBuffer
+
+
+class FakeRequest:
+    def __init__(self, headers=None, args=None):
+        self.headers = headers or {}
+        self.args = args or {}
+
+
+def _parse(message):
+    """把一条SSE消息解析为(事件, id, 数据)"""
+    event = event_id = data = None
+    for line in message.strip('\n').split('\n'):
+        field, _, value = line.partition(': ')
+        if field == 'event':
+            event = value
+        elif field == 'id':
+            event_id = int(value)
+        elif field == 'data':
+            data = json.loads(value)
+    return event, event_id, data
+
+
+def _buffer(count, capacity=100):
+    buffer = ReadingRingBuffer(capacity)
+    for i in range(count):
+        buffer.append({'time': 1000 + i, 'temperature': 20.0 + i})
+    return buffer
+
+
+def _format(reading):
+    return '%d ' % reading['time']
+
+
+def _take(stream, count):
+    assert next(stream) == 'retry: %d\n\n' % live_stream.RETRY_MS
+    return [next(stream) for _ in range(count)]
+
+
+def test_resume_id():
+    assert live_stream.resume_id(FakeRequest({'Last-Event-ID': '42'}, {'cursor': '7'})) == 42
+    assert live_stream.resume_id(FakeRequest(args={'cursor': '7'})) == 7
+    assert live_stream.resume_id(FakeRequest({'Last-Event-ID': 'abc'})) is None
+    assert live_stream.resume_id(FakeRequest()) is None
+
+
+def test_stream_resumes_from_last_event_id():
+    buffer = _buffer(12)
+    cursor = live_stream.resume_id(FakeRequest({'Last-Event-ID': '10'}))
+    [message] = _take(live_stream.stream_readings(buffer, cursor, _format), 1)
+    event, event_id, data = _parse(message)
+    assert event == 'readings' and event_id == 12 and data['cursor'] == 12
+    assert [r['time'] for r in data['readings']] == [1010, 1011] and data['message'] == '1010 1011 '
+
+
+def test_stream_reports_gap_when_overwritten():
+    buffer = _buffer(12, capacity=5)
+    gap, readings = _take(live_stream.stream_readings(buffer, 2, _format, batch=3), 2)
+    assert _parse(gap) == ('gap', None, {'missed': 5})
+    event, event_id, data = _parse(readings)
+    assert event == 'readings' and event_id == 10
+    assert [r['time'] for r in data['readings']] == [1007, 1008, 1009]
+
+
+def test_stream_resets_cursor_from_previous_server():
+    # 浏览器带着服务端重启之前的Last-Event-ID重连，从最早仍保留的数据重新开始
+    buffer = _buffer(3)
+    reset, readings = _take(live_stream.stream_readings(buffer, 50, _format), 2)
+    assert _parse(reset) == ('reset', None, {'cursor': 0})
+    assert _parse(readings)[1] == 3
+
+
+def test_stream_keepalive_without_new_data():
+    buffer = _buffer(3)
+    old = live_stream.KEEPALIVE_INTERVAL
+    live_stream.KEEPALIVE_INTERVAL = 0.01
+    try:
+        stream = live_stream.stream_readings(buffer, 3, _format)
+        assert _take(stream, 1) == [': keepalive\n\n']
+        buffer.append({'time': 2000, 'temperature': 30.0})
+        assert _parse(next(stream))[1] == 4
+    finally:
+        live_stream.KEEPALIVE_INTERVAL = old
+
+
+def test_status_channel_throttles_publish():
+    channel = live_stream.StatusChannel()
+    channel.publish({'count': 1})
+    channel.publish({'count': 2})   # 距上次不足STATUS_MIN_INTERVAL，跳过
+    assert channel.version == 1 and channel.snapshot == {'count': 1}
+    channel.publish({'count': 3}, force=True)
+    assert channel.version == 2 and channel.snapshot == {'count': 3}
+
+    # 新连接先收到当前状态，带着最新版本号重连时只在状态更新后发送
+    [message] = _take(channel.stream(), 1)
+    assert _parse(message) == ('status', 2, {'count': 3})
+    old = live_stream.KEEPALIVE_INTERVAL
+    live_stream.KEEPALIVE_INTERVAL = 0.01
+    try:
+        stream = channel.stream(version=2)
+        assert _take(stream, 1) == [': keepalive\n\n']
+        channel.publish({'count': 4}, force=True)
+        assert _parse(next(stream)) == ('status', 3, {'count': 4})
+    finally:
+        live_stream.KEEPALIVE_INTERVAL = old
+
+
+if __name__ == "__main__":
+    test_resume_id()
+    test_stream_resumes_from_last_event_id()
+    test_stream_reports_gap_when_overwritten()
+    test_stream_resets_cursor_from_previous_server()
+    test_stream_keepalive_without_new_data()
+    test_status_channel_throttles_publish()
+    print("✅ 实时推送测试全部通过")
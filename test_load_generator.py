@@ -0,0 +1,64 @@
+# test_load_generator.py
+# 用模拟的客户端测试压测工具的调度和统计，不需要MQTT服务器
+import threading
+
+import message_decoder
+from load_generator import LoadGenerator, RAMP_STEP, percentile
+
+
+class FakeClient:
+    """模拟MQTTClient，奇数mid在publish返回前确认，偶数mid稍后在另一个线程确认"""
+    decoder = message_decoder.MessageDecoder()
+
+    def __init__(self, product_key, device_name, device_secret, broker='localhost', port=1883):
+        self.mqtt_topic_post = f'/sys/{product_key}/{device_name}/thing/event/property/post'
+        self.publish_callback = None
+        self.connected = False
+        self.mid = 0
+        self.messages = []
+
+    def connect(self):
+        self.connected = True
+        return True
+
+    def disconnect(self):
+        self.connected = False
+
+    def is_connected(self):
+        return self.connected
+
+    def publish(self, topic, message):
+        self.mid += 1
+        self.messages.append(self.decoder.decode(topic, message))
+        if self.mid % 2:
+            self.publish_callback(self.mid)
+        else:
+            threading.Timer(0.001, self.publish_callback, (self.mid,)).start()
+        return 0, self.mid
+
+
+def test_rates_shapes_and_latency():
+    generator = LoadGenerator(devices=4, rates=(50.0, 100.0), shape='mixed', threads=2, client_factory=FakeClient)
+    generator.connect()
+    result = generator.run(0.5, report_every=0.2)
+    clients = [device.client for device in generator.devices]
+    assert [FakeClient.decoder.schema_for(c.mqtt_topic_post) for c in clients] == ['params', 'items', 'params', 'items']
+    # 每个设备按自己的速率发布
+    assert 20 <= len(clients[0].messages) <= 30 and 45 <= len(clients[1].messages) <= 55
+    assert result['sent'] == sum(len(c.messages) for c in clients)
+    assert result['acked'] == result['sent'] and result['failed'] == 0
+    assert result['target_rate'] == 300.0
+    assert 0 <= result['latency_ms']['p50'] <= result['latency_ms']['p99'] <= result['latency_ms']['max']
+
+
+def test_step_ramp_offsets():
+    generator = LoadGenerator(devices=8, rates=(1.0,), ramp=RAMP_STEP, ramp_time=4.0, steps=4, client_factory=FakeClient)
+    assert [device.start_offset for device in generator.devices] == [0, 0, 1, 1, 2, 2, 3, 3]
+    assert generator.target_rate(0.5) == 2.0 and generator.target_rate(3.0) == 8.0
+    assert percentile([1, 2, 3, 4, 5], 50) == 3 and percentile([], 99) is None
+
+
+if __name__ == "__main__":
+    test_rates_shapes_and_latency()
+    test_step_ramp_offsets()
+    print("✅ 压测工具测试全部通过")
@@ -0,0 +1,73 @@
+# test_log_config.py
+# 测试限频日志和吞吐量汇总，不需要MQTT服务器
+import logging
+import time
+
+import log_config
+
+
+class _Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def _logger(name):
+    logger = log_config.get_logger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = _Records()
+    logger.addHandler(handler)
+    return logger, handler
+
+
+def test_sampled_log_suppresses_repeats():
+    logger, handler = _logger('test_sampled')
+    sampled = log_config.SampledLog(logger, interval=0.2)
+    for i in range(100):
+        sampled.log('error', "解析错误: %d", i)
+    sampled.log('other', "其他错误")
+    assert handler.messages == ["解析错误: 0", "其他错误"]
+    time.sleep(0.25)
+    sampled.log('error', "解析错误: %d", 100)
+    assert handler.messages[-1] == "解析错误: 100 (期间省略99条同类日志)"
+
+
+def test_debug_disabled_skips_formatting():
+    logger, handler = _logger('test_debug')
+
+    class Expensive:
+        def __str__(self):
+            raise AssertionError("DEBUG关闭时不应格式化参数")
+
+    logger.debug("消息: %s", Expensive())
+    assert handler.messages == []
+
+
+def test_throughput_meter_reports_rate():
+    logger, handler = _logger('test_meter')
+    meter = log_config.ThroughputMeter(logger, 'received', interval=0.1)
+    for _ in range(50):
+        meter.record(20)
+    time.sleep(0.25)
+    assert meter.count == 50 and meter.bytes == 1000
+    assert len(handler.messages) == 1 and handler.messages[0].startswith("received: ")
+
+
+def test_invalid_level_keeps_previous():
+    logger, _ = _logger('test_invalid_level')
+    log_config._set_level(logger, 'not-a-level', 'THP_LOG_LEVEL')
+    assert logger.level == logging.INFO
+    log_config._set_level(logger, ' debug ', 'THP_LOG_LEVEL')
+    assert logger.level == logging.DEBUG
+
+
+if __name__ == "__main__":
+    test_sampled_log_suppresses_repeats()
+    test_debug_disabled_skips_formatting()
+    test_throughput_meter_reports_rate()
+    test_invalid_level_keeps_previous()
+    print("✅ 日志测试全部通过")
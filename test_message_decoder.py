@@ -0,0 +1,50 @@
+# test_message_decoder.py
+# 测试三种消息格式的解析和按主题缓存格式，不需要MQTT服务器
+import json
+
+import message_decoder
+
+ITEMS = {"items": {"DetectTime": {"value": "1392220800000"}, "CurrentTemperature": {"value": 4.0},
+                   "CurrentHumidity": {"value": 66}, "CurrentPressure": {"value": 995}}}
+PARAMS = {"id": "123", "version": "1.0", "method": "thing.event.property.post",
+          "params": {"DetectTime": "1392220800000", "CurrentTemperature": 4.0,
+                     "CurrentHumidity": 66, "CurrentPressure": 995}}
+FLAT = {"time": 1392220800000, "temperature": 4.0, "humidity": 66, "pressure": 995}
+EXPECTED = {"time": 1392220800000, "temperature": 4.0, "humidity": 66.0, "pressure": 995}
+
+
+def test_all_schemas_decode_to_same_reading():
+    decoder = message_decoder.MessageDecoder()
+    for topic, payload in (("a", ITEMS), ("b", PARAMS), ("c", FLAT)):
+        assert decoder.decode(topic, json.dumps(payload).encode()) == EXPECTED
+        assert decoder.decode(topic, json.dumps(payload)) == EXPECTED
+    assert [decoder.schema_for(t) for t in "abc"] == ["items", "params", "flat"]
+    # 每个主题只识别一次格式
+    assert decoder.schema_misses == 3
+    assert decoder.stats()["decoded"] == 6
+
+
+def test_schema_change_on_topic_is_redetected():
+    decoder = message_decoder.MessageDecoder()
+    decoder.decode("t", json.dumps(PARAMS))
+    assert decoder.decode("t", json.dumps(ITEMS)) == EXPECTED
+    assert decoder.schema_for("t") == "items"
+
+
+def test_bad_payload_raises_and_counts():
+    decoder = message_decoder.MessageDecoder()
+    for payload in ("not json", json.dumps({"temperature": 1})):
+        try:
+            decoder.decode("t", payload)
+        except message_decoder.DECODE_ERRORS:
+            pass
+        else:
+            raise AssertionError("应当抛出解析异常")
+    assert decoder.stats()["errors"] == 2
+
+
+if __name__ == "__main__":
+    test_all_schemas_decode_to_same_reading()
+    test_schema_change_on_topic_is_redetected()
+    test_bad_payload_raises_and_counts()
+    print("✅ 消息解析测试全部通过")
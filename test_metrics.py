@@ -0,0 +1,70 @@
+# test_metrics.py
+# 测试运行时指标的计数和Prometheus文本格式，不需要MQTT服务器
+import threading
+
+import metrics
+
+
+def test_counter_sums_per_thread_cells():
+    registry = metrics.Registry()
+    counter = metrics.counter('test_events_total', '事件数', registry=registry)
+    errors = metrics.counter('test_errors_total', '错误数', ['type'], registry=registry)
+
+    def work():
+        for _ in range(10000):
+            counter.inc()
+        errors.labels('ValueError').inc(2)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.value == 80000
+    assert errors.labels('ValueError').value == 16
+    # 同名指标重复注册时返回已有的指标
+    assert metrics.counter('test_events_total', '事件数', registry=registry) is counter
+
+
+def test_finished_thread_cells_are_retired():
+    registry = metrics.Registry()
+    counter = metrics.counter('test_short_total', '短时线程的事件数', registry=registry)
+    latency = metrics.histogram('test_short_seconds', '短时线程的耗时', buckets=(0.1, 1.0), registry=registry)
+    for _ in range(50):
+        thread = threading.Thread(target=lambda: (counter.inc(), latency.observe(0.5)))
+        thread.start()
+        thread.join()
+    # 已结束线程的单元并入合计，不再单独保留
+    assert counter.value == 50
+    assert len(counter._default._cells._cells) <= 1
+    assert len(latency._default._cells._cells) <= 1
+    counter.inc()
+    assert counter.value == 51
+    assert 'test_short_seconds_count 50' in registry.render()
+
+
+def test_render_prometheus_text():
+    registry = metrics.Registry()
+    latency = metrics.histogram('test_latency_seconds', '耗时', buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value)
+    metrics.gauge('test_queue_depth', '队列长度', func=lambda: 7, registry=registry)
+    metrics.counter('test_dropped_total', '丢弃数', ['reason'], registry=registry).labels('queue "full"').inc()
+    text = registry.render()
+    assert text.endswith('\n')
+    lines = text.splitlines()
+    assert '# TYPE test_latency_seconds histogram' in lines
+    assert 'test_latency_seconds_bucket{le="0.1"} 2' in lines
+    assert 'test_latency_seconds_bucket{le="1.0"} 3' in lines
+    assert 'test_latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert 'test_latency_seconds_count 4' in lines
+    assert 'test_latency_seconds_sum 3.65' in lines
+    assert 'test_queue_depth 7' in lines
+    assert 'test_dropped_total{reason="queue \\"full\\""} 1' in lines
+
+
+if __name__ == "__main__":
+    test_counter_sums_per_thread_cells()
+    test_finished_thread_cells_are_retired()
+    test_render_prometheus_text()
+    print("✅ 指标测试全部通过")
@@ -0,0 +1,88 @@
+# test_mqtt_window.py
+# 测试MQTTClient的在途窗口和送达统计，用模拟的paho客户端代替MQTT服务器
+import threading
+
+import paho.mqtt.client as mqtt
+
+from MQTTClient import MQTTClient
+
+
+class FakeResult:
+    def __init__(self, rc, mid):
+        self.rc = rc
+        self.mid = mid
+
+
+class FakePaho:
+    """记录发布的消息，由测试决定何时确认；ack_now为True时在publish返回前确认"""
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.mid = 0
+        self.unacked = []
+        self.qos = []
+        self.messages = []
+        self.ack_now = False
+
+    def max_inflight_messages_set(self, n):
+        pass
+
+    def publish(self, topic, message, qos=0):
+        self.mid += 1
+        self.qos.append(qos)
+        self.messages.append(message)
+        if self.ack_now:
+            self.owner.on_publish(self, None, self.mid)
+        else:
+            self.unacked.append(self.mid)
+        return FakeResult(0, self.mid)
+
+    def ack(self, n=1):
+        for _ in range(n):
+            self.owner.on_publish(self, None, self.unacked.pop(0))
+
+
+def _client(max_inflight):
+    client = MQTTClient('pk', 'dev', 'secret', qos=1, max_inflight=max_inflight)
+    client.client = FakePaho(client)
+    client.connected = True
+    return client
+
+
+def test_window_blocks_until_acked():
+    client = _client(3)
+    for _ in range(3):
+        assert client.publish('t', 'x')[0] == 0
+    assert client.inflight == 3 and client.delivered == 0
+    # 窗口已满，超时后发布失败
+    assert client.publish('t', 'x', timeout=0.05)[0] == mqtt.MQTT_ERR_QUEUE_SIZE
+    # 另一个线程确认后，阻塞的发布继续
+    timer = threading.Timer(0.05, client.client.ack)
+    timer.start()
+    assert client.publish('t', 'x', timeout=2)[0] == 0
+    timer.join()
+    assert client.client.qos == [1, 1, 1, 1]
+    client.client.ack(3)
+    assert client.wait_for_delivery(1)
+    assert (client.published, client.delivered, client.inflight) == (4, 4, 0)
+
+
+def test_early_ack_and_qos0_loss_on_disconnect():
+    client = _client(10)
+    acked = []
+    client.publish_callback = acked.append
+    client.client.ack_now = True
+    client.publish('t', 'x', qos=0)
+    assert client.delivered == 1 and client.inflight == 0 and acked == [1]
+    client.client.ack_now = False
+    client.publish('t', 'x', qos=0)
+    client.publish('t', 'x', qos=1)
+    client.on_disconnect(client.client, None, 1)
+    # QoS 0的消息丢失并释放窗口，QoS 1的消息等待重连后重发
+    assert client.lost == 1 and client.inflight == 1
+
+
+if __name__ == "__main__":
+    test_window_blocks_until_acked()
+    test_early_ack_and_qos0_loss_on_disconnect()
+    print("✅ 在途窗口测试全部通过")
@@ -0,0 +1,146 @@
+# test_outbox.py
+# 测试发布端的磁盘发件箱，不需要MQTT服务器
+import os
+import tempfile
+import time
+
+from MQTTClient import MQTTClient, ERR_QUEUE_FULL
+from outbox import Outbox
+from test_mqtt_window import FakePaho, FakeResult
+
+
+def test_outbox_survives_restart_and_torn_write():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'outbox.log')
+        outbox = Outbox(path, max_messages=5)
+        for i in range(6):
+            assert outbox.append('t/%d' % i, '{"n": %d}' % i, qos=i % 2) == (i < 5)
+        assert outbox.dropped == 1
+        assert outbox.peek(2) == [('t/0', b'{"n": 0}', 0), ('t/1', b'{"n": 1}', 1)]
+        outbox.commit(2)
+        outbox.close()
+        # 模拟写了一半的记录
+        with open(path, 'ab') as file:
+            file.write(b'\x01\x02\x03')
+
+        outbox = Outbox(path)
+        assert len(outbox) == 3
+        assert [topic for topic, _, _ in outbox.peek(10)] == ['t/2', 't/3', 't/4']
+        outbox.append('t/5', b'x')
+        outbox.commit(4)
+        assert len(outbox) == 0 and os.path.getsize(path) == 0
+        assert outbox.stats()['drained'] == 4
+        outbox.close()
+
+
+def test_client_queues_offline_and_drains_in_order():
+    with tempfile.TemporaryDirectory() as directory:
+        client = MQTTClient('pk', 'dev', 'secret', outbox_path=os.path.join(directory, 'outbox.log'),
+                            drain_rate=1000)
+        client.client = FakePaho(client)
+        client.client.ack_now = True
+        for i in range(250):
+            assert client.publish('t', str(i)) == (0, 0)
+        assert client.outbox_stats()['depth'] == 250
+        client.outbox.max_messages = 250
+        assert client.publish('t', 'full')[0] == ERR_QUEUE_FULL
+        client.outbox.max_messages = 1000
+
+        client.on_connect(client.client, None, {}, 0)
+        # 发出期间新发布的消息排在发件箱之后
+        assert client.publish('t', '250') == (0, 0)
+        deadline = time.monotonic() + 5
+        while client.outbox_stats()['depth'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert client.outbox_stats()['depth'] == 0 and not client._draining
+        # 发件箱清空后直接发布
+        assert client.publish('t', 'direct')[1] != 0
+        messages = [m.decode() if isinstance(m, bytes) else m for m in client.client.messages]
+        assert messages == [str(i) for i in range(251)] + ['direct']
+        assert client.delivered == 252
+
+
+class FailingPaho(FakePaho):
+    """前fail次publish返回错误码，模拟连接正常但发送失败"""
+
+    def __init__(self, owner, fail):
+        super().__init__(owner)
+        self.fail = fail
+        self.ack_now = True
+
+    def publish(self, topic, message, qos=0):
+        if self.fail:
+            self.fail -= 1
+            return FakeResult(1, 0)
+        return super().publish(topic, message, qos)
+
+
+def _offline_client(directory, paho, count):
+    client = MQTTClient('pk', 'dev', 'secret', qos=1, outbox_path=os.path.join(directory, 'outbox.log'),
+                        drain_rate=1000)
+    client.client = paho(client)
+    for i in range(count):
+        client.publish('t', str(i))
+    return client
+
+
+def _wait(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_drain_commits_after_ack():
+    with tempfile.TemporaryDirectory() as directory:
+        client = _offline_client(directory, FakePaho, 5)
+        client.on_connect(client.client, None, {}, 0)
+        assert _wait(lambda: len(client.client.unacked) == 5)
+        # 没有确认前不提交，期间断开的话这一批留在发件箱中
+        time.sleep(0.05)
+        assert client.outbox_stats()['depth'] == 5 and client._draining
+        client.client.ack(5)
+        assert _wait(lambda: not client._draining)
+        assert client.outbox_stats()['depth'] == 0
+
+
+def test_drain_retries_send_failure_without_releasing_order():
+    with tempfile.TemporaryDirectory() as directory:
+        client = _offline_client(directory, lambda owner: FailingPaho(owner, 2), 3)
+        client.on_connect(client.client, None, {}, 0)
+        # 发送失败后仍在发出发件箱，新发布的消息继续排在后面
+        assert _wait(lambda: client.client.fail == 0)
+        assert client._draining
+        assert client.publish('t', '3') == (0, 0)
+        assert _wait(lambda: not client._draining)
+        assert client.outbox_stats()['depth'] == 0
+        messages = [m.decode() if isinstance(m, bytes) else m for m in client.client.messages]
+        assert messages == ['0', '1', '2', '3']
+
+
+def test_publish_during_reconnect_stays_behind_outbox():
+    with tempfile.TemporaryDirectory() as directory:
+        client = _offline_client(directory, FakePaho, 3)
+        client.client.ack_now = True
+        # on_connect已标记连接、发出线程尚未开始时发布的消息也排在发件箱之后
+        assert client._set_connected() and client._draining
+        assert client.publish('t', '3') == (0, 0)
+        assert client.client.messages == []
+        # 发件箱中还有消息而没有在发出时同样排队
+        client._draining = False
+        assert client.publish('t', '4') == (0, 0)
+        client._draining = True
+        client._drain_outbox()
+        assert not client._draining and client.outbox_stats()['depth'] == 0
+        messages = [m.decode() if isinstance(m, bytes) else m for m in client.client.messages]
+        assert messages == ['0', '1', '2', '3', '4']
+        assert client.publish('t', '5')[1] != 0
+
+
+if __name__ == "__main__":
+    test_outbox_survives_restart_and_torn_write()
+    test_client_queues_offline_and_drains_in_order()
+    test_drain_commits_after_ack()
+    test_drain_retries_send_failure_without_releasing_order()
+    test_publish_during_reconnect_stays_behind_outbox()
+    print("✅ 发件箱测试全部通过")
@@ -0,0 +1,141 @@
+# test_replay_engine.py
+# 测试回放的节奏(rate/realtime/max三种模式)、状态更新的节流和回放参数的检查，用模拟的时钟和MQTT客户端，不需要MQTT服务器
+import os
+import tempfile
+
+import replay_engine
+from replay_engine import ReplayEngine
+
+
+class FakeClock:
+    """模拟的时钟，等待时直接把时间向后拨，不真正睡眠"""
+
+    def __init__(self):
+        self.now = 100.0
+        self.waits = []
+
+    def __call__(self):
+        return self.now
+
+    # 代替ReplayEngine._stop
+    def is_set(self):
+        return False
+
+    def set(self):
+        pass
+
+    def wait(self, timeout):
+        self.waits.append(timeout)
+        self.now += timeout
+        return False
+
+
+class FakeClient:
+    """立即确认送达，记录每条消息发布时的时间"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.published = []
+        self.inflight = 0
+        self.delivered = 0
+
+    def set_max_inflight(self, window):
+        self.window = window
+
+    def wait_for_window(self, timeout=None):
+        return True
+
+    def wait_for_delivery(self, timeout=None):
+        return True
+
+    def is_connected(self):
+        return True
+
+    def outbox_stats(self):
+        return None
+
+    def publish(self, topic, payload, qos=0):
+        self.published.append(self.clock())
+        self.delivered += 1
+        return 0, len(self.published)
+
+
+def _replay(times, **options):
+    clock = FakeClock()
+    client = FakeClient(clock)
+    progress = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'THP_data.csv')
+        with open(path, 'w') as file:
+            for t in times:
+                file.write('%d,20.5,60.0,1000\n' % t)
+        status = {'count': 0, 'complete': False, 'error': None}
+        engine = ReplayEngine(client, 't', path, status, on_progress=lambda s: progress.append(s['count']),
+                              **options)
+        engine._clock = clock
+        engine._stop = clock
+        engine.run()
+    offsets = [round(t - 100.0, 6) for t in client.published]
+    return offsets, status, progress, clock
+
+
+def test_rate_mode_paces_evenly():
+    offsets, status, _, _ = _replay(range(0, 5000, 1000), mode='rate', rate=4)
+    assert offsets == [0.0, 0.25, 0.5, 0.75, 1.0]
+    assert status['count'] == 5 and status['delivered'] == 5
+
+
+def test_realtime_mode_follows_detect_time_with_speedup():
+    times = [1000, 2000, 2500, 6500]
+    offsets, _, _, _ = _replay(times, mode='realtime')
+    assert offsets == [0.0, 1.0, 1.5, 5.5]
+    offsets, _, _, _ = _replay(times, mode='realtime', speedup=10)
+    assert offsets == [0.0, 0.1, 0.15, 0.55]
+
+
+def test_max_mode_never_waits():
+    offsets, status, _, clock = _replay(range(500), mode='max')
+    assert offsets == [0.0] * 500 and clock.waits == []
+    assert status['count'] == 500
+
+
+def test_progress_is_throttled():
+    # 每秒1000条、共3秒，状态每STATS_INTERVAL秒最多更新一次，结束时再更新一次
+    _, status, progress, _ = _replay(range(3000), mode='rate', rate=1000)
+    limit = 3.0 / replay_engine.STATS_INTERVAL + 3000 // replay_engine.PROGRESS_EVERY + 2
+    assert 3 < len(progress) <= limit
+    assert progress[-1] == 3000 and status['throughput'] > 0
+
+
+def test_rejects_invalid_options():
+    import publish_app
+    app = publish_app.app
+
+    def parse(**kwargs):
+        with app.test_request_context('/startPublish', method='POST', **kwargs):
+            return publish_app.parse_replay_options(publish_app.request)
+
+    assert parse(json={'mode': 'rate', 'rate': '5', 'window': 10}) == ('rate', 5.0, 1.0, 10, 0)
+    assert parse(data={'rate': '2'})[1] == 2.0
+    for body in ({'rate': 'nan'}, {'rate': 'inf'}, {'speedup': '-inf'}, {'window': 'nan'},
+                 {'rate': -1}, {'rate': [1]}, [1, 2], 'fast'):
+        try:
+            parse(json=body)
+        except ValueError:
+            continue
+        raise AssertionError("应拒绝: %r" % (body,))
+    try:
+        ReplayEngine(FakeClient(FakeClock()), 't', 'x.csv', {'count': 0}, mode='rate', rate=float('nan'))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("NaN速率应被拒绝")
+
+
+if __name__ == "__main__":
+    test_rate_mode_paces_evenly()
+    test_realtime_mode_follows_detect_time_with_speedup()
+    test_max_mode_never_waits()
+    test_progress_is_throttled()
+    test_rejects_invalid_options()
+    print("✅ 回放节奏测试全部通过")
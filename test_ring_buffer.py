@@ -0,0 +1,69 @@
+# test_ring_buffer.py
+# 测试接收数据环形缓冲区的游标读取和覆盖行为，不需要MQTT服务器
+from ring_buffer import ReadingRingBuffer
+
+
+def make_reading(i):
+    return {"time": 1392220800000 + i * 1000, "temperature": 20.0 + i, "humidity": 50.0, "pressure": 1000 + i}
+
+
+def test_cursor_returns_only_new_items():
+    buffer = ReadingRingBuffer(8)
+    for i in range(3):
+        buffer.append(make_reading(i))
+    readings, cursor = buffer.since(0)
+    assert [r["pressure"] for r in readings] == [1000, 1001, 1002]
+    assert cursor == 3
+    readings, cursor = buffer.since(cursor)
+    assert readings == [] and cursor == 3
+    buffer.append(make_reading(3))
+    readings, cursor = buffer.since(cursor)
+    assert [r["pressure"] for r in readings] == [1003]
+    assert cursor == 4
+
+
+def test_overwrite_keeps_capacity():
+    buffer = ReadingRingBuffer(4)
+    for i in range(10):
+        buffer.append(make_reading(i))
+    assert len(buffer) == 4
+    readings, cursor = buffer.since(0)
+    assert [r["pressure"] for r in readings] == [1006, 1007, 1008, 1009]
+    assert cursor == 10
+
+
+def test_limit_and_clear():
+    buffer = ReadingRingBuffer(16)
+    for i in range(5):
+        buffer.append(make_reading(i))
+    readings, cursor = buffer.since(0, limit=2)
+    assert len(readings) == 2 and cursor == 2
+    buffer.clear()
+    assert len(buffer) == 0
+    # 被清空的数据直接跳过，游标移动到清空时的位置
+    readings, cursor = buffer.since(cursor)
+    assert readings == [] and cursor == 5
+    seq = buffer.append({"time": 1, "temperature": None, "humidity": 1.5})
+    assert seq == 6
+    readings, _ = buffer.since(cursor)
+    assert readings == [{"humidity": 1.5, "time": 1}]
+
+
+def test_stale_cursor_restarts_from_oldest():
+    # 服务端重启后序号重新从1开始，客户端带着重启前更大的游标来读取
+    buffer = ReadingRingBuffer(4)
+    for i in range(6):
+        buffer.append(make_reading(i))
+    assert buffer.wait(100, timeout=0)
+    readings, cursor = buffer.since(100)
+    assert [r["pressure"] for r in readings] == [1002, 1003, 1004, 1005] and cursor == 6
+    empty = ReadingRingBuffer(4)
+    assert empty.since(100) == ([], 0)
+
+
+if __name__ == "__main__":
+    test_cursor_returns_only_new_items()
+    test_overwrite_keeps_capacity()
+    test_limit_and_clear()
+    test_stale_cursor_restarts_from_oldest()
+    print("✅ 环形缓冲区测试全部通过")
@@ -0,0 +1,30 @@
+# test_subscribe_app.py
+# 测试订阅端/chart和/exportCsv的时间参数，数据写入临时目录，不需要MQTT服务器
+import os
+import tempfile
+
+import subscribe_app
+import subscribe_module as module
+
+
+def test_export_and_chart_reject_malformed_time():
+    with tempfile.TemporaryDirectory() as directory:
+        old_dir = module.store_dir
+        module.store_dir = os.path.join(directory, 'readings')
+        try:
+            client = subscribe_app.app.test_client()
+            for path in ('/exportCsv?start=yesterday', '/exportCsv?end=2014-13-45T00:00:00',
+                         '/chart?variable=temperature&start=yesterday'):
+                response = client.get(path)
+                assert response.status_code == 200 and response.get_json()['isSuccess'] is False, path
+            module.store.append([('dev', 1392220800000 + i * 60000, 20.0, 50.0, 1000) for i in range(3)])
+            response = client.get('/exportCsv?start=1392220860000&device=dev')
+            assert response.mimetype == 'text/csv'
+            assert len(response.get_data(as_text=True).splitlines()) == 2
+        finally:
+            module.store_dir = old_dir
+
+
+if __name__ == "__main__":
+    test_export_and_chart_reject_malformed_time()
+    print("✅ 订阅端接口测试全部通过")
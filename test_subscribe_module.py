@@ -0,0 +1,172 @@
+# test_subscribe_module.py
+# 测试订阅端的重新连接(退避、断开后安排重连)、持久会话的删除和本机客户端ID，用模拟的paho客户端，不需要MQTT服务器
+import os
+import random
+import tempfile
+import threading
+import types
+
+import global_var as gv
+import subscribe_module as module
+
+
+class FakeClient:
+    """记录reconnect/loop_start调用；前fail次reconnect抛出OSError"""
+
+    def __init__(self, fail=0):
+        self.fail = fail
+        self.reconnects = 0
+        self.loops = []
+        self.started = threading.Event()
+
+    def loop_stop(self):
+        self.loops.append('stop')
+
+    def loop_start(self):
+        self.loops.append('start')
+        self.started.set()
+
+    def reconnect(self):
+        self.reconnects += 1
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionRefusedError("服务器未启动")
+
+
+class FakeCleaner:
+    """代替clear_session中的mqtt.Client"""
+    created = []
+
+    def __init__(self, client_id, clean_session, reconnect_on_failure):
+        self.client_id = client_id
+        self.clean_session = clean_session
+        self.connected = False
+        self.disconnected = False
+        self.auth = None
+        FakeCleaner.created.append(self)
+
+    def username_pw_set(self, username, password):
+        self.auth = (username, password)
+
+    def connect(self, host, port, keepalive):
+        if port == 0:
+            raise ConnectionRefusedError("服务器未启动")
+
+    def loop(self, timeout):
+        self.connected = True
+
+    def is_connected(self):
+        return self.connected
+
+    def disconnect(self):
+        self.disconnected = True
+
+
+def _with_globals(func, **values):
+    saved = {name: getattr(module, name) for name in values}
+    saved_flag = gv.global_var.user_initiated_disconnect
+    for name, value in values.items():
+        setattr(module, name, value)
+    gv.global_var.user_initiated_disconnect = False
+    try:
+        func()
+    finally:
+        module.cancel_reconnect()
+        for name, value in saved.items():
+            setattr(module, name, value)
+        gv.global_var.user_initiated_disconnect = saved_flag
+
+
+def test_backoff_doubles_ceiling_with_jitter():
+    random.seed(3)
+    backoff = module.Backoff(0.1, 1.0)
+    ceilings = [0.2, 0.4, 0.8, 1.0, 1.0]
+    for ceiling in ceilings:
+        assert 0.1 <= backoff.next() <= ceiling
+    assert backoff._ceiling == 1.0
+    backoff.reset()
+    assert 0.1 <= backoff.next() <= 0.2
+    # 随机等待把同时断开的订阅端错开
+    assert len({round(module.Backoff(0.1, 1.0).next(), 6) for _ in range(20)}) > 1
+
+
+def test_unexpected_disconnect_reconnects_after_backoff():
+    fake = FakeClient(fail=2)
+
+    def check():
+        module.on_disconnect(fake, None, 0)   # 正常断开不重连
+        assert module.reconnect_timer is None
+        module.on_disconnect(fake, None, 7)
+        assert fake.started.wait(2)
+        # 前两次失败后继续退避，第三次成功后重新启动网络线程
+        assert fake.reconnects == 3 and fake.loops[-1] == 'start'
+        assert module.disconnected_at is not None
+
+    _with_globals(check, client=fake, reconnect_backoff=module.Backoff(0.001, 0.005),
+                  reconnect_timer=None, disconnected_at=None)
+
+
+def test_reconnect_skipped_after_relogin_or_user_disconnect():
+    old, new = FakeClient(), FakeClient()
+
+    def check():
+        module.reconnect(old)      # 期间已换用新的客户端
+        gv.global_var.user_initiated_disconnect = True
+        module.reconnect(new)      # 用户主动断开
+        assert old.reconnects == 0 and new.reconnects == 0
+
+    _with_globals(check, client=new)
+
+
+def test_clear_session_connects_clean_once():
+    def check():
+        FakeCleaner.created = []
+        assert module.clear_session('thp-a', 'user', 'secret')
+        [cleaner] = FakeCleaner.created
+        assert cleaner.client_id == 'thp-a' and cleaner.clean_session
+        assert cleaner.auth == ('user', 'secret') and cleaner.disconnected
+        module.mqtt_port = 0
+        assert not module.clear_session('thp-a')
+
+    _with_globals(check, mqtt=types.SimpleNamespace(Client=FakeCleaner), mqtt_port=1883)
+
+
+def test_install_client_id_is_unique_and_saved():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'data', 'client_id')
+
+        def check():
+            first = module.resolve_client_id('')
+            assert first.startswith('thp-') and len(first) <= 23
+            # 之后一直使用保存的ID，不同安装各自生成
+            assert module.resolve_client_id('') == first
+            module.client_id_file = os.path.join(directory, 'other')
+            assert module.install_client_id() != first
+            assert module.resolve_client_id('given') == 'given'
+            module.default_client_id = ''
+            assert module.resolve_client_id('') == ''
+
+        _with_globals(check, client_id_file=path, default_client_id=None)
+        with open(path) as file:
+            assert file.read().strip().startswith('thp-')
+
+
+def test_pool_mode_uses_clean_session():
+    def check():
+        assert module.use_persistent_session('thp-a')
+        assert not module.use_persistent_session('')
+        # 多进程模式下主连接不保留会话，不会沿用之前单进程运行时的"#"订阅
+        module.subscribe_workers = 2
+        assert not module.use_persistent_session('thp-a')
+
+    _with_globals(check, subscribe_workers=0)
+
+
+if __name__ == "__main__":
+    test_backoff_doubles_ceiling_with_jitter()
+    test_unexpected_disconnect_reconnects_after_backoff()
+    test_reconnect_skipped_after_relogin_or_user_disconnect()
+    test_clear_session_connects_clean_once()
+    test_install_client_id_is_unique_and_saved()
+    test_pool_mode_uses_clean_session()
+    print("✅ 订阅端连接测试全部通过")
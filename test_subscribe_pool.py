@@ -0,0 +1,63 @@
+# test_subscribe_pool.py
+# 测试共享订阅工作进程的批量发送和进程管理，不需要MQTT服务器
+import json
+import multiprocessing
+import time
+
+from subscribe_pool import BatchSender, SubscriberPool
+
+
+class FakeMessage:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def _payload(i):
+    return json.dumps({'params': {'DetectTime': 1600000000000 + i, 'CurrentTemperature': 20.5,
+                                  'CurrentHumidity': 50.0, 'CurrentPressure': 1000}}).encode()
+
+
+def test_batch_sender_batches_rows_and_errors():
+    reader, writer = multiprocessing.Pipe(duplex=False)
+    sender = BatchSender(writer, batch_rows=3)
+    for i in range(4):
+        sender.on_message(None, None, FakeMessage('dev/%d' % i, _payload(i)))
+    sender.on_message(None, None, FakeMessage('thp/rtt-probe/subscriber', b''))
+    sender.on_message(None, None, FakeMessage('dev/bad', b'not json'))
+    # 满一批时立即发送
+    rows, nbytes, errors = reader.recv()
+    assert [row[1] for row in rows] == [1600000000000, 1600000000001, 1600000000002]
+    assert rows[0][0] == 'dev/0' and rows[0][2:] == (20.5, 50.0, 1000) and nbytes == 3 * len(_payload(0)) and errors == {}
+    assert not reader.poll()
+    sender.flush()
+    rows, _, errors = reader.recv()
+    assert len(rows) == 1 and errors == {'JSONDecodeError': 1}
+    # 没有新数据时不发送空批次
+    sender.flush()
+    assert not reader.poll()
+
+
+def test_pool_restarts_and_stops_workers():
+    batches = []
+    # 没有可用的MQTT服务器时工作进程一直等待重连
+    pool = SubscriberPool(2, lambda *batch: batches.append(batch), port=1, client_id='test-pool')
+    assert pool.topic == '$share/thp-subscribers/#'
+    pool.start()
+    try:
+        time.sleep(0.5)
+        assert pool.alive() == 2
+        pool._procs[0].kill()
+        deadline = time.monotonic() + 5
+        while pool.restarts == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert pool.restarts == 1 and pool.alive() == 2
+    finally:
+        pool.stop()
+    assert pool.alive() == 0 and batches == []
+
+
+if __name__ == "__main__":
+    test_batch_sender_batches_rows_and_errors()
+    test_pool_restarts_and_stops_workers()
+    print("✅ 订阅工作进程测试全部通过")
@@ -0,0 +1,68 @@
+# test_time_format.py
+# 测试时间戳的格式化: 按秒缓存的单个转换、整列转换，以及夏令时切换前后的结果
+# 切换时区需要time.tzset，Windows上没有，只在本机时区下检查
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+import time_format
+
+
+def _expected(timestamp):
+    # 原来逐个转换的写法
+    return datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m-%d T %H:%M:%S')
+
+
+def _with_tz(tz, func):
+    # 没有time.tzset(Windows)时无法切换时区，在本机时区下检查
+    if not hasattr(time, 'tzset'):
+        time_format._format_second.cache_clear()
+        func()
+        return
+    old = os.environ.get('TZ')
+    os.environ['TZ'] = tz
+    time.tzset()
+    time_format._format_second.cache_clear()
+    try:
+        func()
+    finally:
+        if old is None:
+            del os.environ['TZ']
+        else:
+            os.environ['TZ'] = old
+        time.tzset()
+        time_format._format_second.cache_clear()
+
+
+def test_format_timestamp_cached():
+    def check():
+        assert time_format.format_timestamp(1392220800000) == _expected(1392220800000)
+        assert time_format.format_timestamp(1392220800999.5) == _expected(1392220800000)
+        # 同一秒内的时间戳命中缓存
+        time_format.format_timestamp(1392220800500)
+        assert time_format.cache_info().hits == 2
+    _with_tz('Asia/Shanghai', check)
+
+
+def test_format_timestamps_matches_single():
+    def check():
+        rng = np.random.default_rng(1)
+        times = np.sort(rng.integers(1_300_000_000_000, 1_800_000_000_000, 5000))
+        # 2023-03-26和2023-10-29欧洲夏令时切换前后，每分钟一个点
+        times = np.concatenate([times, np.arange(1679788800000, 1679803200000, 60000),
+                                np.arange(1698537600000, 1698552000000, 60000)])
+        expected = [_expected(t) for t in times.tolist()]
+        assert time_format.format_timestamps(times) == expected
+        assert [time_format.format_timestamp(t) for t in times.tolist()] == expected
+        assert time_format.format_timestamps(times.astype(np.float64) + 0.5) == expected
+        assert time_format.format_timestamps(np.empty(0, dtype=np.int64)) == []
+    _with_tz('Europe/Berlin', check)
+    _with_tz('America/St_Johns', check)
+
+
+if __name__ == "__main__":
+    test_format_timestamp_cached()
+    test_format_timestamps_matches_single()
+    print("✅ 时间格式化测试全部通过")
@@ -0,0 +1,67 @@
+# test_topic_trie.py
+# 测试MQTT主题过滤器前缀树的匹配规则，不需要MQTT服务器
+from topic_trie import TopicTrie
+
+
+def test_wildcard_matching():
+    trie = TopicTrie(['/sys/+/THP-01/#', 'sensors/+/temperature', 'alarm/#', '#'])
+    trie.remove('#')
+    assert len(trie) == 3
+    assert trie.matches('/sys/pk/THP-01/thing/event/property/post')
+    assert trie.matches('/sys/pk/THP-01')          # #也匹配上一层本身
+    assert not trie.matches('/sys/pk/THP-02/thing/event/property/post')
+    assert not trie.matches('/sys/pk/thp-01/x')    # 主题区分大小写
+    assert trie.matches('sensors/room1/temperature')
+    assert not trie.matches('sensors/room1/humidity')
+    assert not trie.matches('sensors/room1/temperature/raw')
+    assert trie.matches('alarm') and trie.matches('alarm/a/b/c')
+
+    # 以$开头的主题不被第一层的通配符匹配
+    trie = TopicTrie(['#', '+/info'])
+    assert trie.matches('a/b') and not trie.matches('$SYS/info')
+    trie.add('$SYS/#')
+    assert trie.matches('$SYS/info')
+    # 删除后不再匹配，缓存的结果同时失效
+    assert trie.remove('$SYS/#') and not trie.matches('$SYS/info')
+    assert not trie.remove('$SYS/#')
+
+
+def test_invalid_filters():
+    trie = TopicTrie()
+    for topic_filter in ('', 'a/#/b', 'a/b#', 'a/+b'):
+        try:
+            trie.add(topic_filter)
+        except ValueError:
+            continue
+        raise AssertionError('%r应当不合法' % topic_filter)
+    assert len(trie) == 0 and not trie.matches('a/b')
+
+
+def test_dispatch_to_consumers():
+    trie = TopicTrie()
+    # 每个设备一个过滤器，另有按通配符订阅的消费者
+    for i in range(5000):
+        trie.add('/sys/pk/dev%d/#' % i, 'partition-%d' % i)
+    trie.add('/sys/+/dev7/thing/event/property/post', 'stream-a')
+    trie.add('/sys/#', 'alerts')
+    trie.add('/sys/#', 'stream-b')
+    assert trie.add('/sys/#', 'alerts') is False
+    assert len(trie) == 5002
+    topic = '/sys/pk/dev7/thing/event/property/post'
+    assert trie.match(topic) == {'partition-7', 'stream-a', 'alerts', 'stream-b'}
+    assert trie.match('/sys/pk/dev4999') == {'partition-4999', 'alerts', 'stream-b'}
+    assert trie.match('/other/pk/dev7') == frozenset()
+
+    assert trie.remove('/sys/#', 'stream-b') and '/sys/#' in trie
+    assert not trie.remove('/sys/#', 'stream-b')
+    assert trie.remove('/sys/+/dev7/thing/event/property/post', 'stream-a')
+    assert trie.match(topic) == {'partition-7', 'alerts'}
+    # 没有消费者的节点被删除
+    assert '+' not in trie._root.children[''].children['sys'].children
+
+
+if __name__ == "__main__":
+    test_wildcard_matching()
+    test_invalid_filters()
+    test_dispatch_to_consumers()
+    print("✅ 主题过滤器测试全部通过")
@@ -0,0 +1,117 @@
+# test_ts_store.py
+# 测试订阅端的列式二进制存储，不需要MQTT服务器
+import os
+import tempfile
+
+import numpy as np
+
+import ts_store
+
+
+def test_append_across_segments_and_reopen():
+    with tempfile.TemporaryDirectory() as directory:
+        store = ts_store.SegmentStore(directory, segment_rows=4)
+        rows = [(1000 + i, 20.5 + i, None if i == 3 else 50.0, 1000 + i) for i in range(10)]
+        store.append(rows[:3])
+        store.append(rows[3:])
+        assert len(store) == 10
+        assert len(store.segments) == 3
+
+        # 重新打开后通过memmap读取
+        store = ts_store.SegmentStore(directory)
+        data = store.read()
+        assert data['time'].tolist() == [r[0] for r in rows]
+        assert ts_store.display_values(data['temperature']).tolist() == [r[1] for r in rows]
+        assert ts_store.present('humidity', data['humidity']).tolist() == [i != 3 for i in range(10)]
+        assert data['pressure'].tolist() == [r[3] for r in rows]
+        assert store.read(3, 6)['time'].tolist() == [1003, 1004, 1005]
+        assert store.tail(2)['time'].tolist() == [1008, 1009]
+        assert store.segments[1].min_time == 1004 and store.segments[1].max_time == 1007
+
+
+def test_csv_import_and_export():
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'in.csv')
+        with open(source, 'w') as file:
+            file.write("time,temperature,humidity,pressure\n")
+            file.write("1392220800000,4.0,66,995\n")
+            file.write("1392222000000,,75.5,994\n")
+        store = ts_store.SegmentStore(os.path.join(directory, 'store'))
+        assert store.import_csv(source) == 2
+        target = os.path.join(directory, 'out.csv')
+        assert store.export_csv(target) == 2
+        with open(target) as file:
+            assert file.read().splitlines() == ["1392220800000,4.0,66.0,995", "1392222000000,,75.5,994"]
+        assert np.isnan(store.read()['temperature'][1])
+
+
+def test_time_range_query_with_out_of_order_times():
+    rng = np.random.default_rng(1)
+    # 整体递增但局部乱序的时间戳，模拟多个发布端
+    times = np.arange(20000, dtype=np.int64) * 1000 + rng.integers(-30000, 30000, 20000)
+    with tempfile.TemporaryDirectory() as directory:
+        store = ts_store.SegmentStore(directory, segment_rows=8192)
+        for lo in range(0, len(times), 3000):
+            chunk = times[lo:lo + 3000]
+            store.append([(int(t), float(i % 50), 50.0, 1000) for i, t in enumerate(chunk, lo)])
+        for start, end in [(5_000_000, 6_000_000), (None, 100_000), (19_990_000, None), (-10**9, -1)]:
+            data = store.query(start, end, ['temperature'])
+            mask = np.ones(len(times), dtype=bool)
+            if start is not None:
+                mask &= times >= start
+            if end is not None:
+                mask &= times <= end
+            assert data['time'].tolist() == np.sort(times[mask], kind='stable').tolist()
+        # 窄范围只需读取少量块
+        assert len(store.index.candidate_ranges(5_000_000, 5_010_000)) <= 2
+        # 重新打开后索引从time列重建
+        reopened = ts_store.SegmentStore(directory)
+        assert reopened.index.blocks == store.index.blocks
+        assert reopened.query(5_000_000, 6_000_000)['time'].tolist() == store.query(5_000_000, 6_000_000)['time'].tolist()
+
+
+def test_partitioned_store_by_device():
+    with tempfile.TemporaryDirectory() as directory:
+        # 分区之前保存的数据作为默认分区
+        ts_store.SegmentStore(directory).append([(500, 1.0, 2.0, 3)])
+        store = ts_store.PartitionedStore(directory, segment_rows=4)
+        store.append([('dev-a', 1000 + i, 20.0, 50.0, 1000) for i in range(0, 10, 2)] +
+                     [('../b', 1000 + i, 30.0, 60.0, 1001) for i in range(1, 10, 2)])
+        assert len(store) == 11
+        assert store.devices() == {'../b': 5, '_default': 1, 'dev-a': 5}
+        assert sorted(os.listdir(os.path.join(directory, ts_store.DEVICES_DIR))) == \
+            sorted(ts_store.partition_dir_name(device) for device in ('../b', 'dev-a'))
+        assert ts_store.partition_dir_name('../b').startswith('%2E%2E%2Fb~')
+
+        store = ts_store.PartitionedStore(directory)
+        assert store.query(1000, 1004, ['temperature'], device='../b')['time'].tolist() == [1001, 1003]
+        assert store.query(1000, 1003)['time'].tolist() == [1000, 1001, 1002, 1003]
+        assert store.tail(3)['time'].tolist() == [1007, 1008, 1009]
+        assert store.tail(2, device='dev-a')['time'].tolist() == [1006, 1008]
+        assert store.query(device='missing')['time'].tolist() == []
+        path = os.path.join(directory, 'dev-a.csv')
+        assert store.export_csv(path, device='dev-a') == 5
+
+
+def test_partition_dirs_differ_by_more_than_case():
+    with tempfile.TemporaryDirectory() as directory:
+        # 之前只转义设备名的分区目录仍按原设备名读取
+        ts_store.SegmentStore(os.path.join(directory, ts_store.DEVICES_DIR, 'old%7Edev')).append([(1, 1.0, 2.0, 3)])
+        store = ts_store.PartitionedStore(directory)
+        store.append([('THP-01', 1000, 20.0, 50.0, 1000), ('thp-01', 2000, 30.0, 60.0, 1001),
+                      ('a~b', 3000, 40.0, 70.0, 1002)])
+        names = [ts_store.partition_dir_name(device) for device in ('THP-01', 'thp-01')]
+        # 不区分大小写的文件系统上也是两个目录
+        assert names[0].lower() != names[1].lower()
+        store = ts_store.PartitionedStore(directory)
+        assert store.devices() == {'THP-01': 1, 'a~b': 1, 'old~dev': 1, 'thp-01': 1}
+        assert store.query(device='thp-01')['time'].tolist() == [2000]
+
+
+if __name__ == "__main__":
+    test_append_across_segments_and_reopen()
+    test_csv_import_and_export()
+    test_time_range_query_with_out_of_order_times()
+    test_partitioned_store_by_device()
+    test_partition_dirs_differ_by_more_than_case()
+    print("✅ 二进制存储测试全部通过")
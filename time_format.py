@@ -0,0 +1,65 @@
+# time_format.py
+# Function: 毫秒时间戳转换为显示用的时间字符串("2014-02-13 T 06:20:00"，本地时区)
+# 数据最多精确到秒，而且集中在相近的时间:
+#   format_timestamp - 单个时间戳，按秒(LRU)缓存格式化结果，实时数据和format_topicData使用
+#   format_timestamps - 一列时间戳，用numpy的datetime64一次转换为字符串数组，/chart使用
+# 本地时区的UTC偏移按天查询，一天的开始和结束偏移不同(夏令时切换)时，
+# 这一天再按15分钟查询(切换时刻都在整15分钟)；同一批数据中相同的天只查询一次。
+import functools
+import time
+
+import numpy as np
+
+TIME_FORMAT = '%Y-%m-%d T %H:%M:%S'
+CACHE_SIZE = 4096           # 缓存最近格式化过的秒数
+DAY = 86400
+OFFSET_STEP = 900           # 夏令时切换当天查询UTC偏移的时间粒度(秒)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _format_second(second):
+    return time.strftime(TIME_FORMAT, time.localtime(second))
+
+
+def format_timestamp(timestamp):
+    """把一个毫秒时间戳(int或float)转换为时间字符串，不足一秒的部分舍去"""
+    return _format_second(int(timestamp // 1000))
+
+
+def _offsets_at(seconds):
+    return np.fromiter((time.localtime(second).tm_gmtoff for second in seconds.tolist()),
+                       dtype=np.int64, count=len(seconds))
+
+
+def _utc_offsets(seconds):
+    """每个时间(秒)所在时刻本地时区的UTC偏移(秒)"""
+    days, inverse = np.unique(seconds // DAY, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    first = _offsets_at(days * DAY)
+    last = _offsets_at(days * DAY + DAY - 1)
+    offsets = first[inverse]
+    changed = (first != last)[inverse]
+    if changed.any():
+        steps, step_inverse = np.unique(seconds[changed] // OFFSET_STEP, return_inverse=True)
+        offsets[changed] = _offsets_at(steps * OFFSET_STEP)[step_inverse.reshape(-1)]
+    return offsets
+
+
+def format_timestamps(timestamps):
+    """把一列毫秒时间戳转换为时间字符串的列表，结果与逐个调用format_timestamp相同"""
+    timestamps = np.asarray(timestamps)
+    if len(timestamps) == 0:
+        return []
+    seconds = np.floor_divide(timestamps, 1000).astype(np.int64)
+    local = (seconds + _utc_offsets(seconds)).astype('datetime64[s]')
+    # "2014-02-13T06:20:00"按字符拆开，在日期和时间之间插入" T "
+    chars = np.datetime_as_string(local, unit='s').astype('U19').view('U1').reshape(-1, 19)
+    text = np.empty((len(chars), 21), dtype='U1')
+    text[:, :10] = chars[:, :10]
+    text[:, 10:13] = [' ', 'T', ' ']
+    text[:, 13:] = chars[:, 11:]
+    return text.view('U21').reshape(-1).tolist()
+
+
+def cache_info():
+    return _format_second.cache_info()
@@ -0,0 +1,73 @@
+# time_index.py
+# Function: 存储数据的稀疏时间索引
+# 按写入顺序每BLOCK_ROWS行划分为一个块，记录每个块的最小/最大时间。
+# 发布端的时间戳可能乱序，块之间的时间范围会重叠，因此另外维护:
+#   块最大时间的前缀最大值 - 单调不减，二分查找第一个可能包含start的块
+#   块最小时间的后缀最小值 - 单调不减，二分查找最后一个可能包含end的块
+# 查询[start, end]时只需读取这两个位置之间、且时间范围有交集的块。
+import numpy as np
+
+BLOCK_ROWS = 4096
+
+
+class TimeIndex:
+    def __init__(self, block_rows=BLOCK_ROWS):
+        self.block_rows = block_rows
+        self.rows = 0
+        self._mins = np.empty(0, dtype=np.int64)
+        self._maxs = np.empty(0, dtype=np.int64)
+        self._prefix_max = None
+        self._suffix_min = None
+
+    @property
+    def blocks(self):
+        return len(self._mins)
+
+    def add(self, times):
+        """登记新追加的一批时间(按写入顺序)"""
+        times = np.asarray(times, dtype=np.int64)
+        if len(times) == 0:
+            return
+        # 先补满最后一个未满的块
+        used = self.rows % self.block_rows
+        if used:
+            head = times[:self.block_rows - used]
+            self._mins[-1] = min(self._mins[-1], head.min())
+            self._maxs[-1] = max(self._maxs[-1], head.max())
+            self.rows += len(head)
+            times = times[len(head):]
+        if len(times):
+            starts = np.arange(0, len(times), self.block_rows)
+            self._mins = np.concatenate((self._mins, np.minimum.reduceat(times, starts)))
+            self._maxs = np.concatenate((self._maxs, np.maximum.reduceat(times, starts)))
+            self.rows += len(times)
+        self._prefix_max = self._suffix_min = None
+
+    def candidate_ranges(self, start=None, end=None):
+        """返回可能包含[start, end]内数据的行范围列表[(起始行, 结束行), ...]"""
+        if self.blocks == 0:
+            return []
+        if self._prefix_max is None:
+            self._prefix_max = np.maximum.accumulate(self._maxs)
+            self._suffix_min = np.minimum.accumulate(self._mins[::-1])[::-1]
+        first = 0 if start is None else int(np.searchsorted(self._prefix_max, start, side='left'))
+        last = self.blocks if end is None else int(np.searchsorted(self._suffix_min, end, side='right'))
+        if first >= last:
+            return []
+        blocks = np.arange(first, last)
+        overlap = np.ones(len(blocks), dtype=bool)
+        if start is not None:
+            overlap &= self._maxs[first:last] >= start
+        if end is not None:
+            overlap &= self._mins[first:last] <= end
+        blocks = blocks[overlap]
+        # 合并相邻的块，减少读取次数
+        ranges = []
+        for block in blocks.tolist():
+            lo = block * self.block_rows
+            hi = min(lo + self.block_rows, self.rows)
+            if ranges and ranges[-1][1] == lo:
+                ranges[-1] = (ranges[-1][0], hi)
+            else:
+                ranges.append((lo, hi))
+        return ranges
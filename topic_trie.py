@@ -0,0 +1,146 @@
+# topic_trie.py
+# Function: MQTT主题过滤器的前缀树
+# 把一组主题过滤器(可以包含+和#通配符)按层级编译成前缀树，每个过滤器可以关联若干个消费者。
+# 匹配一个主题时只沿着该主题的各层级向下查找，耗时与主题层数有关，与过滤器的数量无关。
+# 匹配规则与MQTT服务器相同:
+#   +  匹配一个层级
+#   #  匹配该层级及之后的所有层级(包括上一层本身，a/#匹配a)，只能出现在最后
+#   以$开头的主题(如$SYS)不会被第一层的通配符匹配
+# 同一设备的主题会反复出现，匹配结果按主题缓存，过滤器变化时清空缓存。
+# 修改在锁内进行，节点上的消费者集合整体替换，匹配时不需要加锁。
+import threading
+
+MATCH_CACHE_SIZE = 10000
+
+
+class _Node:
+    __slots__ = ('children', 'consumers')
+
+    def __init__(self):
+        self.children = {}
+        self.consumers = frozenset()  # 在这一层结束的过滤器关联的消费者
+
+
+def validate_filter(topic_filter):
+    """检查主题过滤器是否合法，不合法时抛出ValueError"""
+    if not topic_filter:
+        raise ValueError("主题过滤器不能为空")
+    levels = topic_filter.split('/')
+    for i, level in enumerate(levels):
+        if '#' in level and (level != '#' or i != len(levels) - 1):
+            raise ValueError("#只能单独出现在主题过滤器的最后一层: %r" % topic_filter)
+        if '+' in level and level != '+':
+            raise ValueError("+必须单独占一层: %r" % topic_filter)
+    return levels
+
+
+class TopicTrie:
+    """主题过滤器 -> 消费者集合
+
+    只用来判断主题是否被过滤器接收时，add/remove不传consumer即可。
+    """
+
+    def __init__(self, filters=()):
+        self._root = _Node()
+        self._filters = {}  # 过滤器 -> 关联的消费者数
+        self._cache = {}
+        self._lock = threading.Lock()
+        for topic_filter in filters:
+            self.add(topic_filter)
+
+    def __len__(self):
+        return len(self._filters)
+
+    def __contains__(self, topic_filter):
+        return topic_filter in self._filters
+
+    @property
+    def filters(self):
+        return sorted(self._filters)
+
+    def add(self, topic_filter, consumer=None):
+        """为过滤器添加一个消费者，返回该消费者之前是否不存在"""
+        levels = validate_filter(topic_filter)
+        with self._lock:
+            node = self._root
+            for level in levels:
+                child = node.children.get(level)
+                if child is None:
+                    child = node.children[level] = _Node()
+                node = child
+            if consumer in node.consumers:
+                return False
+            node.consumers = node.consumers | {consumer}
+            self._filters[topic_filter] = self._filters.get(topic_filter, 0) + 1
+            self._cache = {}
+            return True
+
+    def remove(self, topic_filter, consumer=None):
+        """删除过滤器的一个消费者，返回是否删除成功"""
+        with self._lock:
+            if topic_filter not in self._filters:
+                return False
+            levels = topic_filter.split('/')
+            path = [self._root]
+            for level in levels:
+                path.append(path[-1].children[level])
+            node = path[-1]
+            if consumer not in node.consumers:
+                return False
+            node.consumers = node.consumers - {consumer}
+            count = self._filters[topic_filter] - 1
+            if count:
+                self._filters[topic_filter] = count
+            else:
+                del self._filters[topic_filter]
+            # 删除不再有用的节点
+            for parent, level, node in zip(reversed(path[:-1]), reversed(levels), reversed(path[1:])):
+                if node.consumers or node.children:
+                    break
+                del parent.children[level]
+            self._cache = {}
+            return True
+
+    def match(self, topic):
+        """返回与主题匹配的所有过滤器的消费者集合"""
+        cache = self._cache
+        result = cache.get(topic)
+        if result is None:
+            result = self._match(topic)
+            if len(cache) >= MATCH_CACHE_SIZE:
+                cache.clear()
+            cache[topic] = result
+        return result
+
+    def matches(self, topic):
+        """主题是否与任意一个过滤器匹配"""
+        return bool(self.match(topic))
+
+    def _match(self, topic):
+        consumers = set()
+        nodes = [self._root]
+        for depth, level in enumerate(topic.split('/')):
+            wildcard = not (depth == 0 and level.startswith('$'))
+            next_nodes = []
+            for node in nodes:
+                children = node.children
+                if wildcard:
+                    rest = children.get('#')
+                    if rest is not None:
+                        consumers.update(rest.consumers)
+                    child = children.get('+')
+                    if child is not None:
+                        next_nodes.append(child)
+                child = children.get(level)
+                if child is not None:
+                    next_nodes.append(child)
+            nodes = next_nodes
+            if not nodes:
+                return frozenset(consumers)
+        # 主题的各层级都已匹配: 在这里结束的过滤器，以及后面只剩#的过滤器
+        for node in nodes:
+            consumers.update(node.consumers)
+            rest = node.children.get('#')
+            if rest is not None:
+                consumers.update(rest.consumers)
+        return frozenset(consumers)
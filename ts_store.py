@@ -0,0 +1,373 @@
+# ts_store.py
+# Function: 订阅端接收数据的列式二进制存储
+# 数据按段(segment)存放，每个段是一个预分配大小的文件:
+#   64字节文件头 | time列(int64) | temperature列(float32) | humidity列(float32) | pressure列(int32)
+# 每一列都是定长数组，读取时直接用numpy.memmap映射，不需要逐行解析。
+# 只在文件末尾追加，先写数据再更新文件头中的行数，进程中途退出也不会读到半条数据。
+# 缺失值: 浮点列用NaN，气压列用PRESSURE_MISSING。
+# PartitionedStore按设备分区，每个设备一个SegmentStore，查询单个设备时不读取其他设备的数据。
+import csv
+import hashlib
+import itertools
+import os
+import struct
+import threading
+import urllib.parse
+
+import numpy as np
+
+from time_index import TimeIndex
+
+MAGIC = b'THPSEG01'
+VERSION = 1
+HEADER_FORMAT = '<8sIIQqq'   # magic, version, capacity, count, min_time, max_time
+HEADER_SIZE = 64
+SEGMENT_ROWS = 1 << 16       # 每个段的行数
+PRESSURE_MISSING = np.iinfo(np.int32).min
+
+COLUMNS = (
+    ('time', np.dtype('<i8')),
+    ('temperature', np.dtype('<f4')),
+    ('humidity', np.dtype('<f4')),
+    ('pressure', np.dtype('<i4')),
+)
+FIELDS = tuple(name for name, _ in COLUMNS[1:])
+DEFAULT_DEVICE = '_default'   # 无法从主题识别设备的数据，以及分区之前保存的数据
+DEVICES_DIR = 'devices'       # 设备分区所在的子目录
+
+_generations = itertools.count(1)
+
+
+def _column_offsets(capacity):
+    offsets = {}
+    offset = HEADER_SIZE
+    for name, dtype in COLUMNS:
+        offsets[name] = offset
+        offset += capacity * dtype.itemsize
+    return offsets, offset
+
+
+def rows_to_columns(rows):
+    """把(time, temperature, humidity, pressure)行转换为列数组，空值转换为缺失值"""
+    n = len(rows)
+    columns = {
+        'time': np.fromiter((int(r[0]) for r in rows), dtype=np.int64, count=n),
+        'temperature': np.fromiter((np.nan if r[1] in (None, '') else r[1] for r in rows), dtype=np.float32, count=n),
+        'humidity': np.fromiter((np.nan if r[2] in (None, '') else r[2] for r in rows), dtype=np.float32, count=n),
+        'pressure': np.fromiter((PRESSURE_MISSING if r[3] in (None, '') else int(r[3]) for r in rows), dtype=np.int32, count=n),
+    }
+    return columns
+
+
+def present(name, values):
+    """返回某一列中非缺失值的掩码"""
+    if name == 'pressure':
+        return values != PRESSURE_MISSING
+    if name == 'time':
+        return np.ones(len(values), dtype=bool)
+    return ~np.isnan(values)
+
+
+def display_values(values):
+    """把float32的数值转换为最短的十进制表示，避免返回给前端时出现22.350000381469727这样的数"""
+    values = np.asarray(values)
+    if values.dtype == np.float32:
+        return values.astype(str).astype(np.float64)
+    return values.astype(np.float64)
+
+
+class Segment:
+    def __init__(self, path, capacity=SEGMENT_ROWS):
+        self.path = path
+        if not os.path.exists(path):
+            self._create(capacity)
+        with open(path, 'rb') as file:
+            magic, version, capacity, count, min_time, max_time = struct.unpack(
+                HEADER_FORMAT, file.read(struct.calcsize(HEADER_FORMAT)))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("不是有效的数据段文件: " + path)
+        self.capacity = capacity
+        self.count = count
+        self.min_time = min_time
+        self.max_time = max_time
+        self._offsets, self._size = _column_offsets(capacity)
+        # 按容量映射整列，之后追加的数据通过同一文件可见，只需按count截取
+        self._maps = {name: np.memmap(path, dtype=dtype, mode='r', offset=self._offsets[name], shape=(capacity,))
+                      for name, dtype in COLUMNS}
+
+    def _create(self, capacity):
+        _, size = _column_offsets(capacity)
+        with open(self.path, 'wb') as file:
+            file.write(self._header(capacity, 0, 0, 0))
+            file.truncate(size)
+
+    @staticmethod
+    def _header(capacity, count, min_time, max_time):
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, capacity, count, min_time, max_time)
+        return header.ljust(HEADER_SIZE, b'\0')
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    def column(self, name, start=0, stop=None):
+        """返回列的只读视图(零拷贝)"""
+        stop = self.count if stop is None else min(stop, self.count)
+        return self._maps[name][start:stop]
+
+    def append(self, columns, start, stop):
+        """写入columns[start:stop]，返回实际写入的行数"""
+        n = min(stop - start, self.capacity - self.count)
+        if n <= 0:
+            return 0
+        times = columns['time'][start:start + n]
+        with open(self.path, 'r+b') as file:
+            for name, dtype in COLUMNS:
+                file.seek(self._offsets[name] + self.count * dtype.itemsize)
+                file.write(np.ascontiguousarray(columns[name][start:start + n], dtype=dtype).tobytes())
+            file.flush()
+            min_time = int(times.min()) if self.count == 0 else min(self.min_time, int(times.min()))
+            max_time = int(times.max()) if self.count == 0 else max(self.max_time, int(times.max()))
+            # 数据写完后再更新行数
+            file.seek(0)
+            file.write(self._header(self.capacity, self.count + n, min_time, max_time))
+        self.count += n
+        self.min_time, self.max_time = min_time, max_time
+        return n
+
+
+class SegmentStore:
+    def __init__(self, directory, segment_rows=SEGMENT_ROWS):
+        self.directory = directory
+        self.segment_rows = segment_rows
+        self._lock = threading.Lock()
+        # 每次打开存储得到不同的标识，缓存按标识判断数据是否仍是同一份，而不只是比较行数
+        self.generation = next(_generations)
+        os.makedirs(directory, exist_ok=True)
+        names = sorted(name for name in os.listdir(directory) if name.startswith('seg-') and name.endswith('.thp'))
+        self.segments = [Segment(os.path.join(directory, name)) for name in names]
+        # 打开时从time列重建时间索引，之后随追加同步更新
+        self.index = TimeIndex()
+        for segment in self.segments:
+            self.index.add(segment.column('time'))
+
+    def _segment_path(self, index):
+        return os.path.join(self.directory, 'seg-%06d.thp' % index)
+
+    def __len__(self):
+        return sum(segment.count for segment in self.segments)
+
+    def append(self, rows):
+        """追加(time, temperature, humidity, pressure)行"""
+        if not rows:
+            return
+        self.append_columns(rows_to_columns(rows))
+
+    def append_columns(self, columns):
+        n = len(columns['time'])
+        with self._lock:
+            done = 0
+            while done < n:
+                if not self.segments or self.segments[-1].full:
+                    self.segments.append(Segment(self._segment_path(len(self.segments)), self.segment_rows))
+                done += self.segments[-1].append(columns, done, n)
+            self.index.add(columns['time'])
+
+    def read(self, start=0, stop=None, names=None):
+        """按写入顺序读取第start到stop行，返回{列名: 数组}"""
+        names = names or [name for name, _ in COLUMNS]
+        parts = {name: [] for name in names}
+        with self._lock:
+            segments = list(self.segments)
+        base = 0
+        for segment in segments:
+            count = segment.count
+            lo, hi = max(start - base, 0), count if stop is None else min(stop - base, count)
+            if lo < hi:
+                for name in names:
+                    parts[name].append(segment.column(name, lo, hi))
+            base += count
+        return {name: np.concatenate(parts[name]) if parts[name] else np.empty(0, dtype=dict(COLUMNS)[name])
+                for name in names}
+
+    def query(self, start=None, end=None, names=None):
+        """读取时间在[start, end]范围内的数据，按时间排序后返回{列名: 数组}
+
+        通过时间索引只读取可能包含该范围的块，不扫描全部数据。
+        """
+        names = list(names or [name for name, _ in COLUMNS])
+        if 'time' not in names:
+            names.insert(0, 'time')
+        with self._lock:
+            ranges = self.index.candidate_ranges(start, end)
+        parts = [self.read(lo, hi, names) for lo, hi in ranges]
+        if not parts:
+            return {name: np.empty(0, dtype=dict(COLUMNS)[name]) for name in names}
+        data = {name: np.concatenate([part[name] for part in parts]) for name in names}
+        times = data['time']
+        mask = np.ones(len(times), dtype=bool)
+        if start is not None:
+            mask &= times >= start
+        if end is not None:
+            mask &= times <= end
+        order = np.argsort(times[mask], kind='stable')
+        return {name: values[mask][order] for name, values in data.items()}
+
+    def tail(self, n):
+        """读取最后写入的n行"""
+        total = len(self)
+        return self.read(max(total - n, 0), total)
+
+    def import_csv(self, path, batch=SEGMENT_ROWS):
+        """把旧的CSV文件(时间,温度,湿度,气压)导入存储，返回导入的行数"""
+        imported = 0
+        with open(path, 'r') as file:
+            rows = []
+            for row in csv.reader(file):
+                if len(row) < 4 or row[0] == '':
+                    continue
+                try:
+                    rows.append((int(float(row[0])), row[1] and float(row[1]), row[2] and float(row[2]),
+                                 row[3] and int(float(row[3]))))
+                except ValueError:
+                    continue  # 跳过表头等无法解析的行
+                if len(rows) >= batch:
+                    self.append(rows)
+                    imported += len(rows)
+                    rows = []
+            self.append(rows)
+            imported += len(rows)
+        return imported
+
+    def export_csv(self, path, start=None, end=None):
+        """把数据导出为CSV文件(时间,温度,湿度,气压)，返回导出的行数
+
+        path可以是文件名，也可以是已打开的文件对象；
+        指定start/end时只导出该时间范围内的数据，并按时间排序。
+        """
+        data = self.read() if start is None and end is None else self.query(start, end)
+        return write_csv(path, data)
+
+
+def write_csv(path, data):
+    """把{列名: 数组}写成CSV(时间,温度,湿度,气压)，缺失值写为空，返回行数"""
+    columns = [data['time'].tolist()]
+    for name in FIELDS:
+        mask = present(name, data[name])
+        values = display_values(data[name]) if name != 'pressure' else data[name]
+        columns.append([v if ok else '' for v, ok in zip(values.tolist(), mask.tolist())])
+    if hasattr(path, 'write'):
+        csv.writer(path).writerows(zip(*columns))
+    else:
+        with open(path, 'w', newline='') as file:
+            csv.writer(file).writerows(zip(*columns))
+    return len(data['time'])
+
+
+def _empty(names):
+    return {name: np.empty(0, dtype=dict(COLUMNS)[name]) for name in names}
+
+
+def _merge_by_time(parts, names):
+    """合并多个分区的查询结果并按时间排序"""
+    parts = [part for part in parts if len(part['time'])]
+    if not parts:
+        return _empty(names)
+    if len(parts) == 1:
+        return parts[0]
+    data = {name: np.concatenate([part[name] for part in parts]) for name in names}
+    order = np.argsort(data['time'], kind='stable')
+    return {name: values[order] for name, values in data.items()}
+
+
+def partition_dir_name(device):
+    """设备分区的目录名: 转义后的设备名 + "~" + 设备名的短哈希
+
+    设备名来自主题，转义后作为目录名，"."也转义，避免出现".."这样的目录。
+    Windows和macOS默认的文件系统不区分大小写，"THP-01"和"thp-01"转义后是同一个目录，
+    加上按原设备名计算的哈希后不会冲突。
+    """
+    quoted = urllib.parse.quote(device, safe='').replace('.', '%2E')
+    return quoted + '~' + hashlib.sha1(device.encode('utf-8')).hexdigest()[:8]
+
+
+def _device_of_dir(name):
+    """由分区目录名得到设备名；没有哈希后缀的是之前只转义设备名的目录"""
+    quoted, sep, digest = name.rpartition('~')
+    if sep:
+        device = urllib.parse.unquote(quoted)
+        if partition_dir_name(device) == name:
+            return device
+    return urllib.parse.unquote(name)
+
+
+class PartitionedStore:
+    """按设备分区的存储
+
+    分区之前保存在directory中的数据作为DEFAULT_DEVICE分区，其他设备保存在directory/devices/<设备名>中。
+    append的行为(设备, time, temperature, humidity, pressure)；查询时指定device只读取该设备的分区，
+    不指定时合并所有分区并按时间排序。
+    """
+
+    def __init__(self, directory, segment_rows=SEGMENT_ROWS):
+        self.directory = directory
+        self.segment_rows = segment_rows
+        self._lock = threading.Lock()
+        self.partitions = {DEFAULT_DEVICE: SegmentStore(directory, segment_rows)}
+        devices_dir = os.path.join(directory, DEVICES_DIR)
+        if os.path.isdir(devices_dir):
+            for name in sorted(os.listdir(devices_dir)):
+                self.partitions[_device_of_dir(name)] = SegmentStore(os.path.join(devices_dir, name), segment_rows)
+
+    def __len__(self):
+        return sum(len(store) for store in list(self.partitions.values()))
+
+    def partition(self, device, create=False):
+        """返回设备的分区，不存在且create为False时返回None"""
+        store = self.partitions.get(device)
+        if store is None and create:
+            with self._lock:
+                store = self.partitions.get(device)
+                if store is None:
+                    path = os.path.join(self.directory, DEVICES_DIR, partition_dir_name(device))
+                    store = self.partitions[device] = SegmentStore(path, self.segment_rows)
+        return store
+
+    def stores(self, device=None):
+        """返回{设备: SegmentStore}，device为None时返回全部分区"""
+        if device is None:
+            return dict(self.partitions)
+        store = self.partitions.get(device)
+        return {device: store} if store is not None else {}
+
+    def devices(self):
+        """返回有数据的设备及其行数"""
+        return {device: len(store) for device, store in sorted(self.partitions.items()) if len(store)}
+
+    def append(self, rows):
+        """追加(设备, time, temperature, humidity, pressure)行，按设备写入各自的分区"""
+        groups = {}
+        for row in rows:
+            groups.setdefault(row[0], []).append(row[1:])
+        for device, device_rows in groups.items():
+            self.partition(device, create=True).append(device_rows)
+
+    def query(self, start=None, end=None, names=None, device=None):
+        names = list(names or [name for name, _ in COLUMNS])
+        if 'time' not in names:
+            names.insert(0, 'time')
+        return _merge_by_time([store.query(start, end, names) for store in self.stores(device).values()], names)
+
+    def tail(self, n, device=None):
+        """读取最后写入的n行；合并所有分区时取各分区的最后n行按时间排序后的最后n行"""
+        names = [name for name, _ in COLUMNS]
+        data = _merge_by_time([store.tail(n) for store in self.stores(device).values()], names)
+        return {name: values[-n:] for name, values in data.items()} if n else _empty(names)
+
+    def import_csv(self, path, batch=SEGMENT_ROWS):
+        """把旧的CSV文件导入DEFAULT_DEVICE分区"""
+        return self.partitions[DEFAULT_DEVICE].import_csv(path, batch)
+
+    def export_csv(self, path, start=None, end=None, device=None):
+        """按时间顺序导出一个设备或全部设备的数据，返回导出的行数"""
+        return write_csv(path, self.query(start, end, device=device))